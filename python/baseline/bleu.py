@@ -11,10 +11,12 @@ from six.moves import reduce, map, zip, range
 
 import sys
 import argparse
+import multiprocessing
 from operator import or_
 from itertools import chain
 from collections import Counter
 import numpy as np
+from baseline.utils import Offsets
 
 
 def n_grams(tokens, n):
@@ -233,6 +235,170 @@ def bleu(preds, golds, n=4):
     return (b, precision * 100, bp, len_ratio, pred_len, gold_len)
 
 
+def bleu_from_stats(stats, n=4):
+    """Calculate the BLEU score from corpus level sufficient statistics.
+
+    :param stats: `np.ndarray` The statistics from `BleuScorer.stats`, this is
+        the matches for each n-gram size, the possible matches for each n-gram
+        size, the length of the predictions and the length of the references.
+    :param n: `int` The max size n-gram to use.
+
+    :returns: The same 6-tuple as `bleu`
+    """
+    matches, total = stats[:n], stats[n:2 * n]
+    pred_len, gold_len = int(stats[2 * n]), int(stats[2 * n + 1])
+    precision = np.array([matches[i] / float(total[i]) if total[i] > 0 else 0.0 for i in range(n)])
+    geo_mean = geometric_mean(precision)
+    bp, len_ratio = brevity_penalty(pred_len, gold_len)
+    b = geo_mean * bp * 100
+    return (b, precision * 100, bp, len_ratio, pred_len, gold_len)
+
+
+def ids_to_tokens(indices, lengths=None):
+    """Convert decoded indices into token sequences that can be scored directly.
+
+    This mirrors `lookup_sentence`, the sequence stops at the first `EOS` and
+    `PAD` and `GO` are dropped, without looking the words up. Scoring these is
+    the same as scoring the strings as long as each index maps to a unique word
+    and no subword merging is done.
+
+    :param indices: The indices of the sentences. Should be in the shape `[B, T]`.
+    :param lengths: The optional lengths of the sentences.
+
+    :returns: `List[Tuple[int]]` The tokens for each sentence.
+    """
+    if hasattr(indices, 'cpu'):
+        indices = indices.cpu().numpy()
+    sentences = []
+    for i, idx in enumerate(indices):
+        idx = np.asarray(idx).tolist()
+        if lengths is not None:
+            idx = idx[:int(lengths[i])]
+        tokens = []
+        for tok in idx:
+            if tok == Offsets.EOS:
+                break
+            if tok != Offsets.PAD and tok != Offsets.GO:
+                tokens.append(tok)
+        sentences.append(tuple(tokens))
+    return sentences
+
+
+def _accumulate(preds, references, n):
+    """Collect the statistics for predictions given their reference statistics.
+
+    :param preds: `List[List[str]]` The predictions `[B, T]`
+    :param references: `List[Tuple[Counter, Tuple[int]]]` The output of
+        `BleuScorer.reference_stats` for each prediction.
+    :param n: `int` The max size n-gram to use.
+
+    :returns: `np.ndarray` The statistics for `bleu_from_stats`
+    """
+    # Accumulate into python ints, adding to numpy scalars one at a time is slow
+    matches = [0] * n
+    total = [0] * n
+    pred_len = gold_len = 0
+    for pred, (max_counts, gold_lens) in zip(preds, references):
+        for n_gram, count in count_n_grams(pred, n).items():
+            gold_count = max_counts.get(n_gram)
+            if gold_count:
+                matches[len(n_gram) - 1] += min(count, gold_count)
+        length = len(pred)
+        for i in range(min(length, n)):
+            total[i] += length - i
+        pred_len += length
+        # The closest reference length, the shortest on ties (see `find_closest`)
+        gold_len += min(gold_lens, key=lambda l: (abs(length - l), l)) if gold_lens else six.MAXSIZE
+    return np.array(matches + total + [pred_len, gold_len], dtype=np.int64)
+
+
+def _accumulate_job(args):
+    """Collect statistics in a worker process, this is module level so it can be pickled."""
+    return _accumulate(*args)
+
+
+class BleuScorer(object):
+    """Calculate BLEU while caching the reference statistics.
+
+    The per reference max n-gram counts and lengths are cached the first time
+    a set of references is seen, so scoring the same validation set every
+    epoch only counts the predictions. The tokens can be strings or integer
+    ids (see `ids_to_tokens`). The scores match `bleu` (and `multi-bleu.pl`)
+    exactly.
+    """
+    def __init__(self, n=4, processes=1, cache=True):
+        """Create a scorer
+
+        :param n: `int` The max size n-gram to use.
+        :param processes: `int` When larger than 1 the predictions are counted
+            in a pool of this many processes. The pool is created on first use
+            and kept until `close`. The reference statistics are still cached
+            in this process.
+        :param cache: `bool` Should reference statistics be cached
+        """
+        self.n = n
+        self.processes = processes
+        self.cache = cache
+        self._references = {}
+        self._pool = None
+
+    def reference_stats(self, golds):
+        """Get the max n-gram counts for a set of references.
+
+        :param golds: `List[List[str]]` The references for a single example.
+
+        :returns: `(Counter, Tuple[int])` The max counts and the length of each reference
+        """
+        key = tuple(tuple(g) for g in golds)
+        stats = self._references.get(key)
+        if stats is None:
+            max_counts = max_gold_n_gram_counts(key, self.n) if key else Counter()
+            stats = (max_counts, tuple(len(g) for g in key))
+            if self.cache:
+                self._references[key] = stats
+        return stats
+
+    def stats(self, preds, golds):
+        """Collect the corpus level sufficient statistics, these can be summed across shards.
+
+        :param preds: `List[List[str]]` The predictions `[B, T]`
+        :param golds: `List[List[List[str]]]` The references `[B, R, T]`
+
+        :returns: `np.ndarray` The statistics for `bleu_from_stats`
+        """
+        references = [self.reference_stats(gold) for gold in golds]
+        if self.processes > 1 and len(preds) > self.processes:
+            return self._parallel_stats(preds, references)
+        return _accumulate(preds, references, self.n)
+
+    def _parallel_stats(self, preds, references):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.processes)
+        chunks = self.processes * 4
+        size = (len(preds) + chunks - 1) // chunks
+        jobs = [(preds[i:i + size], references[i:i + size], self.n) for i in range(0, len(preds), size)]
+        return sum(self._pool.map(_accumulate_job, jobs))
+
+    def score(self, preds, golds):
+        """Calculate BLEU, see `bleu` for the arguments and return value"""
+        return bleu_from_stats(self.stats(preds, golds), self.n)
+
+    def reset(self):
+        """Drop the cached reference statistics"""
+        self._references = {}
+
+    def close(self):
+        """Shut down the worker processes"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __del__(self):
+        if getattr(self, '_pool', None) is not None:
+            self._pool.terminate()
+
+
 # Slightly strange file readers that read from pre opened files to facilitate
 # reading the predictions from stdin. Won't be used elsewhere.
 def _read_references(reference_files, lc):
@@ -265,13 +431,16 @@ def main():
     parser = argparse.ArgumentParser(description="Calculate Bleu score.", usage=usage)
     parser.add_argument('-lc', help='lowercase the input', action='store_true')
     parser.add_argument('-n', type=int, default=4, help='The number of ngrams to use.')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='The number of processes to use.')
     parser.add_argument('reference', nargs='+')
     args = parser.parse_args()
 
     golds = _read_references(args.reference, args.lc)
     preds = _read_lines(sys.stdin, args.lc)
 
-    b, precision, bp, len_ratio, pred_len, gold_len = bleu(preds, golds, args.n)
+    scorer = BleuScorer(args.n, args.processes, cache=False)
+    b, precision, bp, len_ratio, pred_len, gold_len = scorer.score(preds, golds)
+    scorer.close()
     precision_str = "/".join(["{:.1f}"] * len(precision)).format(*precision)
 
     print("BLEU = {bleu:.2f}, {per} (BP={bp:.3f}, ratio={ratio:.3f}, hyp_len={hyp}, ref_len={ref})".format(
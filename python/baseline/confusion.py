@@ -12,6 +12,9 @@ class ConfusionMatrix(object):
 
     This class accumulates classification output, and tracks it in a confusion matrix.
     Metrics are available that use the confusion matrix
+
+    Confusion matrices over the same labels can be merged with `merge` (or `+`), so sharded evaluation
+    can run in separate processes and combine their (picklable) matrices at the end
     """
     def __init__(self, labels):
         """Constructor with input labels
@@ -25,7 +28,7 @@ class ConfusionMatrix(object):
         else:
             self.labels = labels
         nc = len(self.labels)
-        self._cm = np.zeros((nc, nc), dtype=np.int)
+        self._cm = np.zeros((nc, nc), dtype=np.int64)
 
     def add(self, truth, guess):
         """Add a single value to the confusion matrix based off `truth` and `guess`
@@ -36,6 +39,32 @@ class ConfusionMatrix(object):
 
         self._cm[truth, guess] += 1
 
+    def add_counts(self, counts):
+        """Add a matrix of counts (indexed by truth, then guess) to the confusion matrix
+
+        :param counts: An array of shape `[nc, nc]`
+        """
+        self._cm += np.asarray(counts, dtype=self._cm.dtype)
+
+    def merge(self, other):
+        """Add the counts from another confusion matrix over the same labels into this one
+
+        :param other: A `ConfusionMatrix`
+        :return: This `ConfusionMatrix`
+        """
+        if list(self.labels) != list(other.labels):
+            raise ValueError('Cannot merge confusion matrices with different labels')
+        self.add_counts(other._cm)
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        cm = ConfusionMatrix(self.labels)
+        cm.merge(self)
+        return cm.merge(other)
+
     def __str__(self):
         values = []
         width = max(8, max(len(x) for x in self.labels) + 1)
@@ -192,5 +221,13 @@ class ConfusionMatrix(object):
         :param guess: The guess tensor
         :return:
         """
-        for truth_i, guess_i in zip(truth, guess):
-            self.add(truth_i, guess_i)
+        nc = len(self.labels)
+        truth = np.asarray(truth, dtype=np.int64).reshape(-1)
+        guess = np.asarray(guess, dtype=np.int64).reshape(-1)
+        if len(truth) != len(guess):
+            raise ValueError('Truth and guess must be the same size, got {} and {}'.format(len(truth), len(guess)))
+        for name, values in (('truth', truth), ('guess', guess)):
+            if len(values) and (values.min() < 0 or values.max() >= nc):
+                raise ValueError('All {} values must be in [0, {}), got [{}, {}]'.format(name, nc, values.min(), values.max()))
+        counts = np.bincount(truth * nc + guess, minlength=nc * nc)
+        self._cm += counts.reshape(nc, nc)
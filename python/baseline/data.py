@@ -1,5 +1,9 @@
 import random
 import logging
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
 import math
 from baseline.utils import export
@@ -17,6 +21,9 @@ class DataFeed(object):
     a single step at a time.  The data can be shuffled per epoch, if requested, otherwise it is
     returned in the order of the dateset
     """
+    # Can batches be built in any order with `_batch(i)`, or only by iterating?
+    random_access = True
+
     def __init__(self):
         self.steps = 0
         self.shuffle = False
@@ -27,8 +34,15 @@ class DataFeed(object):
     def __getitem__(self, i):
         return self._batch(i)
 
+    def _epoch_order(self):
+        """The order to visit the steps in for one epoch
+
+        :return: An array of step indices
+        """
+        return np.random.permutation(np.arange(self.steps)) if self.shuffle else np.arange(self.steps)
+
     def __iter__(self):
-        shuffle = np.random.permutation(np.arange(self.steps)) if self.shuffle else np.arange(self.steps)
+        shuffle = self._epoch_order()
         for i in range(self.steps):
             si = shuffle[i]
             yield self._batch(si)
@@ -37,6 +51,121 @@ class DataFeed(object):
         return self.steps
 
 
+# The feed that a prefetch worker process reads from, this is set when the process starts
+_PREFETCH_FEED = None
+
+
+def _init_prefetch_worker(feed):
+    global _PREFETCH_FEED
+    _PREFETCH_FEED = feed
+
+
+def _prefetch_batch(i):
+    return _PREFETCH_FEED._batch(i)
+
+
+@exporter
+class PrefetchDataFeed(DataFeed):
+    """Wrap a `DataFeed` so that batches are built in the background while the trainer works on the current one
+
+    The step order (shuffling) is decided by the wrapped feed's `_epoch_order`, and the batches themselves
+    (including any trimming) are created by the wrapped feed's `_batch` so the data is the same as iterating the
+    wrapped feed directly.  Since this is itself a `DataFeed` it can be passed to any trainer.
+    """
+    def __init__(self, feed, prefetch=2, num_workers=1, worker_type='thread'):
+        """Constructor
+
+        :param feed: The `DataFeed` to wrap
+        :param prefetch: (``int``) How many batches to build ahead of the one being consumed
+        :param num_workers: (``int``) How many workers build batches
+        :param worker_type: (``str``) `thread` or `process`.  Threads are usually enough since most of the work is
+            done in numpy which releases the GIL.  Process workers are forked so the data is not copied to them up
+            front, but each batch is pickled back to the trainer
+        """
+        super(PrefetchDataFeed, self).__init__()
+        if worker_type not in {'thread', 'process'}:
+            raise ValueError("worker_type must be one of `thread` or `process`, got {}".format(worker_type))
+        self.feed = feed
+        self.steps = feed.steps
+        self.shuffle = feed.shuffle
+        self.prefetch = max(1, int(prefetch))
+        self.num_workers = max(1, int(num_workers))
+        self.worker_type = worker_type
+
+    def _batch(self, i):
+        return self.feed._batch(i)
+
+    def _epoch_order(self):
+        return self.feed._epoch_order()
+
+    def __len__(self):
+        return len(self.feed)
+
+    def _create_executor(self):
+        if self.worker_type == 'thread':
+            return ThreadPoolExecutor(self.num_workers), self.feed._batch
+        try:
+            ctx = multiprocessing.get_context('fork')
+        except ValueError:
+            ctx = multiprocessing.get_context()
+        executor = ProcessPoolExecutor(self.num_workers, mp_context=ctx,
+                                       initializer=_init_prefetch_worker, initargs=(self.feed,))
+        return executor, _prefetch_batch
+
+    def __iter__(self):
+        stream = None
+        if self.feed.random_access:
+            order = iter(self._epoch_order())
+            executor, batch_fn = self._create_executor()
+        else:
+            # A stream can only be read in order so a single thread reads ahead, `None` marks the end
+            stream = iter(self.feed)
+            order = itertools.count()
+            executor, batch_fn = ThreadPoolExecutor(1), lambda _: next(stream, None)
+        pending = deque()
+        try:
+            for _ in range(self.prefetch):
+                si = next(order, None)
+                if si is None:
+                    break
+                pending.append(executor.submit(batch_fn, si))
+            while pending:
+                batch = pending.popleft().result()
+                if batch is None:
+                    break
+                si = next(order, None)
+                if si is not None:
+                    pending.append(executor.submit(batch_fn, si))
+                yield batch
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
+
+
+@exporter
+def create_prefetch_feed(feed, **kwargs):
+    """Wrap a feed in a `PrefetchDataFeed` if prefetching is requested
+
+    :param feed: The `DataFeed` to wrap, if this is `None` it is returned as is
+    :param kwargs: See below
+
+    :Keyword Arguments:
+        * *prefetch* -- (``int``) The number of batches to build ahead of time, `0` turns prefetching off (default)
+        * *prefetch_workers* -- (``int``) The number of workers, defaults to `1`
+        * *prefetch_type* -- (``str``) `thread` (default) or `process`
+    :return: The (possibly wrapped) feed
+    """
+    prefetch = int(kwargs.get('prefetch', 0))
+    if feed is None or prefetch <= 0 or isinstance(feed, PrefetchDataFeed):
+        return feed
+    return PrefetchDataFeed(feed, prefetch,
+                            num_workers=kwargs.get('prefetch_workers', 1),
+                            worker_type=kwargs.get('prefetch_type', 'thread'))
+
+
 @exporter
 class ExampleDataFeed(DataFeed):
 
@@ -87,6 +216,271 @@ class ExampleDataFeed(DataFeed):
         return batch
 
 
+@exporter
+def padding_efficiency(lengths, batches, width=None):
+    """The fraction of the tokens in a set of batches that are real tokens rather than padding
+
+    :param lengths: (``np.ndarray``) The length of each example
+    :param batches: A list of example index arrays, one per batch
+    :param width: (``int``) If given, every batch is padded to this width, otherwise each batch is padded to its
+        longest example (which is what `trim` does)
+    :return: (``float``) real tokens / padded tokens
+    """
+    real = 0
+    padded = 0
+    for idx in batches:
+        if len(idx) == 0:
+            continue
+        batch_lengths = lengths[idx]
+        real += int(np.sum(batch_lengths))
+        padded += len(idx) * (int(np.max(batch_lengths)) if width is None else width)
+    return real / float(padded) if padded > 0 else 1.0
+
+
+@exporter
+class BucketedExampleDataFeed(ExampleDataFeed):
+    """An `ExampleDataFeed` that puts examples of similar length in the same batch
+
+    Each epoch the examples are sorted by length (randomly breaking ties), split into `num_buckets` buckets of the
+    same size, shuffled within each bucket and then cut into batches.  If `shuffle` is set, the batch order is shuffled
+    too.  Every epoch sees different batches, but since the examples in a batch have similar lengths, much less of a
+    trimmed batch is padding than with a full shuffle.  More buckets means less padding but less randomness.
+
+    This needs examples that support `take` and `lengths` like `ArrayExamples`
+    """
+    def __init__(self, examples, batchsz, **kwargs):
+        """Constructor
+
+        :param examples: The examples, typically `ArrayExamples`
+        :param batchsz: Batch size per step
+        :param kwargs: See `ExampleDataFeed`, and below
+
+        :Keyword Arguments:
+            * *num_buckets* -- (``int``) The number of length buckets, defaults to `8`
+            * *length_key* -- (``str``) The key to bucket by, defaults to the `sort_key` of the examples
+        """
+        super(BucketedExampleDataFeed, self).__init__(examples, batchsz, **kwargs)
+        if not hasattr(examples, 'take'):
+            raise ValueError("Bucketing requires examples that support `take`, like `ArrayExamples`")
+        self.length_key = kwargs.get('length_key', getattr(examples, 'sort_key', None))
+        if self.length_key is None:
+            raise ValueError("Bucketing requires a `length_key` (or a `sort_key` on the examples)")
+        self.num_buckets = max(1, int(kwargs.get('num_buckets') or 8))
+        self.lengths = np.asarray(examples.lengths(self.length_key))
+        self.width = None
+        if not self.trim:
+            feature = examples.arrays.get(self.length_key[:-len('_lengths')])
+            self.width = feature.shape[1] if feature is not None and feature.ndim > 1 else None
+        self.batches = self._bucket()
+        self.padding_efficiency = padding_efficiency(self.lengths, self.batches, self.width)
+
+    def _bucket_order(self):
+        """Sort the examples by length, randomly within each bucket
+
+        :return: An array of example indices
+        """
+        num_examples = len(self.lengths)
+        perm = np.random.permutation(num_examples)
+        order = perm[np.argsort(self.lengths[perm], kind='stable')]
+        buckets = np.array_split(order, min(self.num_buckets, max(num_examples, 1)))
+        return np.concatenate([np.random.permutation(bucket) for bucket in buckets])
+
+    def _bucket(self):
+        """Assign the examples to batches for an epoch
+
+        :return: A list of example index arrays, one per step
+        """
+        order = self._bucket_order()
+        return [order[i * self.batchsz:(i + 1) * self.batchsz] for i in range(self.steps)]
+
+    def _epoch_order(self):
+        self.batches = self._bucket()
+        self.padding_efficiency = padding_efficiency(self.lengths, self.batches, self.width)
+        logger.debug("Bucketed %d examples into %d batches, padding efficiency %.4f",
+                     len(self.lengths), self.steps, self.padding_efficiency)
+        return super(BucketedExampleDataFeed, self)._epoch_order()
+
+    def _batch(self, i):
+        return self.examples.take(self.batches[i], trim=self.trim)
+
+
+@exporter
+class TokenBatchedExampleDataFeed(BucketedExampleDataFeed):
+    """A `BucketedExampleDataFeed` where batches hold up to a number of tokens rather than a number of examples
+
+    The examples are bucketed by length as in `BucketedExampleDataFeed` and then packed greedily into batches while
+    the padded size of the batch (the number of examples times the longest length, summed over all the `length_keys`)
+    is at most `max_tokens`.  Batches of short examples hold many examples and batches of long ones hold few, so the
+    memory needed per step stays about the same.  An example that is longer than `max_tokens` gets a batch of its own.
+
+    Since the batches change each epoch, the number of steps (`len(feed)`) can change a little from epoch to epoch.
+    `batchsz` and `truncate` are not used.  Batches are always trimmed, otherwise they would be padded to the full
+    width of the features and the budget would not bound their size.
+    """
+    def __init__(self, examples, batchsz, **kwargs):
+        """Constructor
+
+        :param examples: The examples, typically `ArrayExamples` or `ArraySeq2SeqExamples`
+        :param batchsz: Ignored, the batch size depends on the lengths
+        :param kwargs: See `BucketedExampleDataFeed`, and below
+
+        :Keyword Arguments:
+            * *max_tokens* -- (``int``) The maximum number of (padded) tokens in a batch
+            * *length_keys* -- (``list``) The lengths that count towards `max_tokens`, defaults to the `length_key`
+              along with `tgt_lengths` if the examples have it
+        """
+        self.max_tokens = int(kwargs['max_tokens'])
+        if self.max_tokens <= 0:
+            raise ValueError("max_tokens must be positive, got {}".format(self.max_tokens))
+        self.length_keys = kwargs.get('length_keys')
+        self.all_lengths = None
+        kwargs['trim'] = True
+        super(TokenBatchedExampleDataFeed, self).__init__(examples, batchsz, **kwargs)
+
+    def _token_lengths(self):
+        if self.all_lengths is None:
+            if self.length_keys is None:
+                self.length_keys = [self.length_key]
+                if 'tgt_lengths' in self.examples.arrays and self.length_key != 'tgt_lengths':
+                    self.length_keys.append('tgt_lengths')
+            self.all_lengths = [np.asarray(self.examples.lengths(k)) for k in self.length_keys]
+        return self.all_lengths
+
+    def _bucket(self):
+        all_lengths = self._token_lengths()
+        order = self._bucket_order()
+        batches = []
+        start = 0
+        longest = [0] * len(all_lengths)
+        for i, example in enumerate(order):
+            lengths = [max(m, int(l[example])) for m, l in zip(longest, all_lengths)]
+            if i > start and (i - start + 1) * sum(lengths) > self.max_tokens:
+                batches.append(order[start:i])
+                start = i
+                lengths = [int(l[example]) for l in all_lengths]
+            longest = lengths
+        if start < len(order):
+            batches.append(order[start:])
+        self.steps = len(batches)
+        return batches
+
+
+@exporter
+def create_example_feed(examples, batchsz, **kwargs):
+    """Create an `ExampleDataFeed`, bucketing by length or batching by tokens if requested
+
+    Bucketing and token batching are only done when shuffling (training), evaluation data keeps its order
+
+    :param examples: The examples
+    :param batchsz: Batch size per step
+    :param kwargs: See `ExampleDataFeed`, `BucketedExampleDataFeed` and `TokenBatchedExampleDataFeed`.
+        `num_buckets` turns on bucketing and `max_tokens` turns on token batching, both are off by default
+    :return: The feed
+    """
+    if kwargs.get('shuffle', False):
+        if kwargs.get('max_tokens'):
+            return TokenBatchedExampleDataFeed(examples, batchsz, **kwargs)
+        if kwargs.get('num_buckets'):
+            return BucketedExampleDataFeed(examples, batchsz, **kwargs)
+    return ExampleDataFeed(examples, batchsz, **kwargs)
+
+
+def _shuffle_buffer(examples, buffer_size):
+    """Shuffle a stream of examples, holding at most `buffer_size` of them in memory at a time
+
+    :param examples: An iterator of examples
+    :param buffer_size: (``int``) The number of examples to shuffle between
+    :return: A generator of the same examples in a random order
+    """
+    buf = []
+    for example in examples:
+        if len(buf) < buffer_size:
+            buf.append(example)
+            continue
+        i = random.randrange(buffer_size)
+        yield buf[i]
+        buf[i] = example
+    random.shuffle(buf)
+    for example in buf:
+        yield example
+
+
+@exporter
+class StreamingDataFeed(DataFeed):
+    """A `DataFeed` that reads and vectorizes examples as it goes, so the dataset never has to fit in memory
+
+    Each epoch, `example_fn` is called to get a fresh iterator of raw examples (i.e. it reads the file again).
+    Every `batchsz` raw examples are turned into a batch with `batch_fn`.  Shuffling is done with a bounded
+    shuffle buffer, so the order is only random within a window of `shuffle_buffer` examples, and there is
+    no sorting.  Batches can only be produced in order (`random_access` is `False`), use it with
+    `for batch in feed`
+    """
+    random_access = False
+
+    def __init__(self, example_fn, batch_fn, batchsz, **kwargs):
+        """Constructor
+
+        :param example_fn: A function that returns an iterator over the raw examples for one epoch
+        :param batch_fn: A function that takes a list of raw examples and returns a batch dictionary
+        :param batchsz: Batch size per step
+        :param kwargs: See below
+
+        :Keyword Arguments:
+            * *num_examples* -- (``int``) The number of examples, if this is not given there is a pass over
+              `example_fn` to count them
+            * *shuffle* -- Shuffle the data per epoch? Defaults to `False`
+            * *shuffle_buffer* -- (``int``) How many examples to hold when shuffling, defaults to `10000`
+            * *trim* -- Trim batches to the maximum length seen in the batch (defaults to `False`)
+            * *sort_key* -- (``str``) The lengths key to trim by, there is no trimming without it
+            * *truncate* -- bool, If true the datastream will be cut short when
+                a full batch cannot be made, otherwise the final batch is smaller
+                than normal batches.
+        """
+        super(StreamingDataFeed, self).__init__()
+        self.example_fn = example_fn
+        self.batch_fn = batch_fn
+        self.batchsz = batchsz
+        self.shuffle = bool(kwargs.get('shuffle', False))
+        self.shuffle_buffer = max(1, int(kwargs.get('shuffle_buffer', 10000)))
+        self.trim = bool(kwargs.get('trim', False))
+        self.sort_key = kwargs.get('sort_key')
+        self.truncate = bool(kwargs.get('truncate', False))
+        num_examples = kwargs.get('num_examples')
+        if num_examples is None:
+            num_examples = sum(1 for _ in example_fn())
+        self.num_examples = num_examples
+        if self.truncate:
+            self.steps = self.num_examples // batchsz
+        else:
+            self.steps = (self.num_examples + batchsz - 1) // batchsz
+
+    def _batch(self, i):
+        raise TypeError("A StreamingDataFeed does not support random access (feed[i]), iterate over it instead")
+
+    def _make_batch(self, examples):
+        batch = self.batch_fn(examples)
+        if self.trim and self.sort_key is not None:
+            batch = _trim_to(batch, list(batch.keys()), int(np.max(batch[self.sort_key])))
+        return batch
+
+    def __iter__(self):
+        examples = self.example_fn()
+        if self.shuffle:
+            examples = _shuffle_buffer(examples, self.shuffle_buffer)
+        chunk = []
+        steps = 0
+        for example in examples:
+            chunk.append(example)
+            if len(chunk) == self.batchsz:
+                yield self._make_batch(chunk)
+                chunk = []
+                steps += 1
+                if steps == self.steps:
+                    return
+        if chunk and not self.truncate:
+            yield self._make_batch(chunk)
+
+
 @exporter
 class DictExamples(object):
     """This object holds a list of dictionaries, and knows how to shuffle, sort and batch them
@@ -258,6 +652,151 @@ class Seq2SeqExamples(object):
         return self._trim_batch(batch, max_src_len, max_tgt_len) if trim else batch
 
 
+@exporter
+def stack_examples(example_list, keys=None):
+    """Convert a list of example dictionaries into a dictionary of arrays, one row per example
+
+    :param example_list: A list of examples
+    :param keys: The keys to stack, defaults to the keys of the first example
+    :return: A `dict` of stacked arrays
+    """
+    if not example_list:
+        return {}
+    keys = list(example_list[0].keys()) if keys is None else keys
+    return {k: np.stack([ex[k] for ex in example_list]) for k in keys}
+
+
+@exporter
+class ArrayExamples(object):
+    """Columnar version of `DictExamples`, each feature is stored as one contiguous array
+
+    This holds a dictionary of arrays where the first dimension is the example (a `word` feature is `[N, T]`,
+    `word_lengths` and `y` are `[N]`, etc).  Shuffling and sorting only permute an index so batching is a single
+    fancy index per feature instead of gathering and stacking a list of per-example arrays.  The arrays can also be
+    memory-mapped (see `baseline.reader.VectorizedCache`).
+    """
+    def __init__(self, arrays, do_shuffle=True, sort_key=None):
+        """Constructor
+
+        :param arrays: A `dict` of arrays with the same first dimension
+        :param do_shuffle: (``bool``) Shuffle the data? Defaults to `True`
+        :param sort_key: (``str``) A key to sort the data on, Defaults to `None`
+        """
+        self.arrays = arrays
+        self.sort_key = sort_key
+        self.num_examples = len(next(iter(arrays.values()))) if arrays else 0
+        order = None
+        if do_shuffle:
+            order = np.random.permutation(self.num_examples)
+        if sort_key is not None and self.num_examples > 0:
+            order = np.arange(self.num_examples) if order is None else order
+            order = order[np.argsort(arrays[sort_key][order], kind='stable')]
+        self.order = order
+
+    @classmethod
+    def from_list(cls, example_list, *args, **kwargs):
+        """Create from a list of example dictionaries, like the ones given to `DictExamples`"""
+        return cls(stack_examples(example_list), *args, **kwargs)
+
+    def _indices(self, start, end):
+        if self.order is None:
+            return slice(start, end)
+        return self.order[start:end]
+
+    def __getitem__(self, i):
+        """Get a single example
+
+        :param i: (``int``) simple index
+        :return: an example
+        """
+        i = i if self.order is None else self.order[i]
+        return {k: v[i] for k, v in self.arrays.items()}
+
+    def __len__(self):
+        """Number of examples
+
+        :return: (``int``) length of data
+        """
+        return self.num_examples
+
+    def _max_len(self, key, idx):
+        return int(np.max(self.arrays[key][idx]))
+
+    def _trim_batch(self, batch, idx):
+        if self.sort_key is None:
+            return batch
+        return _trim_to(batch, batch.keys(), self._max_len(self.sort_key, idx))
+
+    def lengths(self, key):
+        """Get a column (usually a `*_lengths` key) in example order
+
+        :param key: (``str``) The key to get
+        :return: (``np.ndarray``) The value for each example, `lengths(key)[i] == self[i][key]`
+        """
+        return self.arrays[key] if self.order is None else self.arrays[key][self.order]
+
+    def _take(self, idx, trim):
+        batch = {k: _gather(v, idx) for k, v in self.arrays.items()}
+        return self._trim_batch(batch, idx) if trim else batch
+
+    def take(self, indices, trim=False):
+        """Get a batch made of arbitrary examples
+
+        :param indices: (``np.ndarray``) The example indices (as in `self[i]`) to put in the batch
+        :param trim: (``bool``) Trim to maximum length in a batch
+        :return batched dictionary
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        return self._take(indices if self.order is None else self.order[indices], trim)
+
+    def batch(self, start, batchsz, trim=False):
+        """Get a batch of data
+
+        :param start: (``int``) The step index
+        :param batchsz: (``int``) The batch size
+        :param trim: (``bool``) Trim to maximum length in a batch
+        :return batched dictionary
+        """
+        return self._take(self._indices(start * batchsz, (start + 1) * batchsz), trim)
+
+
+@exporter
+class ArraySeq2SeqExamples(ArrayExamples):
+    """Columnar version of `Seq2SeqExamples`, trims the `tgt` separately from the source features
+    """
+    def __init__(self, arrays, do_shuffle=True, src_sort_key=None):
+        """Constructor
+
+        :param arrays: A `dict` of arrays with the same first dimension
+        :param do_shuffle: Shuffle the data (defaults to `True`)
+        :param src_sort_key: A key to sort the data on (defaults to `None`)
+        """
+        super(ArraySeq2SeqExamples, self).__init__(arrays, do_shuffle, src_sort_key)
+        self.src_sort_key = src_sort_key
+
+    def _trim_batch(self, batch, idx):
+        max_tgt_len = self._max_len('tgt_lengths', idx)
+        if self.src_sort_key is not None:
+            batch = _trim_to(batch, [k for k in batch.keys() if k != 'tgt'], self._max_len(self.src_sort_key, idx))
+        return _trim_to(batch, ['tgt'], max_tgt_len)
+
+
+def _gather(array, idx):
+    # Fancy indexing always copies but slices are views (maybe into a memory-mapped file) so copy those too
+    return np.array(array[idx]) if isinstance(idx, slice) else np.asarray(array[idx])
+
+
+def _trim_to(batch, keys, max_len):
+    if max_len == 0:
+        return batch
+    for k in keys:
+        if len(batch[k].shape) == 3:
+            batch[k] = batch[k][:, 0:max_len, :]
+        elif len(batch[k].shape) == 2:
+            batch[k] = batch[k][:, :max_len]
+    return batch
+
+
 # This one is a little different at the moment
 @exporter
 class SeqWordCharDataFeed(DataFeed):
@@ -0,0 +1,15 @@
+"""The TF serving protos that `RemoteModelGRPC` needs, so a gRPC client only depends on `protobuf` and `grpcio`
+
+The `tensorflow_serving.apis` stubs import the generated `tensorflow.core.framework` protos, which loads all of
+TensorFlow.  These are copies of `TensorProto` and the messages around it, in their own proto package so they can
+be loaded next to TensorFlow.  The field numbers (so the wire format) and the `PredictionService` method name are
+the same as upstream so they talk to an unmodified `tensorflow_model_server`.
+
+The `_pb2` files were generated with `protoc` 3.20, that code needs `protobuf>=3.20` and also loads on the 4.x and
+5.x runtimes.  Regenerate from the `python` dir with:
+
+```
+protoc -I . --python_out=. baseline/protos/{types,tensor_shape,tensor,model,predict}.proto
+python -m grpc_tools.protoc -I . --grpc_python_out=. baseline/protos/prediction_service.proto
+```
+"""
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: baseline/protos/predict.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+from baseline.protos import tensor_pb2 as baseline_dot_protos_dot_tensor__pb2
+from baseline.protos import model_pb2 as baseline_dot_protos_dot_model__pb2
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1d\x62\x61seline/protos/predict.proto\x12\x0f\x62\x61seline.protos\x1a\x1c\x62\x61seline/protos/tensor.proto\x1a\x1b\x62\x61seline/protos/model.proto\"\xe1\x01\n\x0ePredictRequest\x12.\n\nmodel_spec\x18\x01 \x01(\x0b\x32\x1a.baseline.protos.ModelSpec\x12;\n\x06inputs\x18\x02 \x03(\x0b\x32+.baseline.protos.PredictRequest.InputsEntry\x12\x15\n\routput_filter\x18\x03 \x03(\t\x1aK\n\x0bInputsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12+\n\x05value\x18\x02 \x01(\x0b\x32\x1c.baseline.protos.TensorProto:\x02\x38\x01\"\xcf\x01\n\x0fPredictResponse\x12.\n\nmodel_spec\x18\x02 \x01(\x0b\x32\x1a.baseline.protos.ModelSpec\x12>\n\x07outputs\x18\x01 \x03(\x0b\x32-.baseline.protos.PredictResponse.OutputsEntry\x1aL\n\x0cOutputsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12+\n\x05value\x18\x02 \x01(\x0b\x32\x1c.baseline.protos.TensorProto:\x02\x38\x01\x42\x03\xf8\x01\x01\x62\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'baseline.protos.predict_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  DESCRIPTOR._serialized_options = b'\370\001\001'
+  _PREDICTREQUEST_INPUTSENTRY._options = None
+  _PREDICTREQUEST_INPUTSENTRY._serialized_options = b'8\001'
+  _PREDICTRESPONSE_OUTPUTSENTRY._options = None
+  _PREDICTRESPONSE_OUTPUTSENTRY._serialized_options = b'8\001'
+  _PREDICTREQUEST._serialized_start=110
+  _PREDICTREQUEST._serialized_end=335
+  _PREDICTREQUEST_INPUTSENTRY._serialized_start=260
+  _PREDICTREQUEST_INPUTSENTRY._serialized_end=335
+  _PREDICTRESPONSE._serialized_start=338
+  _PREDICTRESPONSE._serialized_end=545
+  _PREDICTRESPONSE_OUTPUTSENTRY._serialized_start=469
+  _PREDICTRESPONSE_OUTPUTSENTRY._serialized_end=545
+# @@protoc_insertion_point(module_scope)
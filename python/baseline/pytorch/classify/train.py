@@ -9,17 +9,11 @@ from baseline.confusion import ConfusionMatrix
 from baseline.progress import create_progress_bar
 from baseline.utils import listify, get_model_file, get_metric_cmp
 from baseline.pytorch.optz import OptimizerManager
+from baseline.pytorch.torchy import MetricsAccumulator
 from baseline.train import EpochReportingTrainer, create_trainer, register_trainer, register_training_func
 logger = logging.getLogger('baseline')
 
 
-def _add_to_cm(cm, y, pred):
-    _, best = pred.max(1)
-    yt = y.cpu().int()
-    yp = best.cpu().int()
-    cm.add_batch(yt.data.numpy(), yp.data.numpy())
-
-
 @register_trainer(task='classify', name='default')
 class ClassifyTrainerPyTorch(EpochReportingTrainer):
 
@@ -56,11 +50,9 @@ class ClassifyTrainerPyTorch(EpochReportingTrainer):
 
     def _test(self, loader, **kwargs):
         self.model.eval()
-        total_loss = 0
-        total_norm = 0
         steps = len(loader)
         pg = create_progress_bar(steps)
-        cm = ConfusionMatrix(self.labels)
+        acc = MetricsAccumulator(len(self.labels))
         verbose = kwargs.get("verbose", None)
         output = kwargs.get('output')
         txts = kwargs.get('txts')
@@ -79,12 +71,12 @@ class ClassifyTrainerPyTorch(EpochReportingTrainer):
                     handle.write('{}\t{}\t{}\n'.format(" ".join(txts[line_number]), self.model.labels[p], self.model.labels[y]))
                     line_number += 1
             batchsz = self._get_batchsz(batch_dict)
-            total_loss += loss.item() * batchsz
-            total_norm += batchsz
-            _add_to_cm(cm, ys, pred)
+            acc.add_loss(loss, batchsz)
+            acc.add_batch(ys, pred)
 
+        cm = self._get_cm(acc)
         metrics = cm.get_all_metrics()
-        metrics['avg_loss'] = total_loss / float(total_norm)
+        metrics.update(self.calc_metrics(*acc.loss()))
         verbose_output(verbose, cm)
         if handle is not None:
             handle.close()
@@ -96,9 +88,8 @@ class ClassifyTrainerPyTorch(EpochReportingTrainer):
         reporting_fns = kwargs.get('reporting_fns', [])
         steps = len(loader)
         pg = create_progress_bar(steps)
-        cm = ConfusionMatrix(self.labels)
-        epoch_loss = 0
-        epoch_div = 0
+        acc = MetricsAccumulator(len(self.labels))
+        nstep_acc = MetricsAccumulator()
         for batch_dict in pg(loader):
             self.optimizer.zero_grad()
             example = self._make_input(batch_dict)
@@ -106,28 +97,32 @@ class ClassifyTrainerPyTorch(EpochReportingTrainer):
             pred = self.model(example)
             loss = self.crit(pred, y)
             batchsz = self._get_batchsz(batch_dict)
-            report_loss = loss.item() * batchsz
-            epoch_loss += report_loss
-            epoch_div += batchsz
-            self.nstep_agg += report_loss
-            self.nstep_div += batchsz
+            acc.add_loss(loss, batchsz)
+            nstep_acc.add_loss(loss, batchsz)
             loss.backward()
             torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip)
-            _add_to_cm(cm, y, pred)
+            acc.add_batch(y, pred)
             self.optimizer.step()
 
             if (self.optimizer.global_step + 1) % self.nsteps == 0:
+                self.nstep_agg, self.nstep_div = nstep_acc.loss()
                 metrics = self.calc_metrics(self.nstep_agg, self.nstep_div)
                 self.report(
                     self.optimizer.global_step + 1, metrics, self.nstep_start,
                     'Train', 'STEP', reporting_fns, self.nsteps
                 )
                 self.reset_nstep()
+                nstep_acc.reset()
 
-        metrics = cm.get_all_metrics()
-        metrics['avg_loss'] = epoch_loss / float(epoch_div)
+        metrics = self._get_cm(acc).get_all_metrics()
+        metrics.update(self.calc_metrics(*acc.loss()))
         return metrics
 
+    def _get_cm(self, acc):
+        cm = ConfusionMatrix(self.labels)
+        cm.add_counts(acc.confusion())
+        return cm
+
 
 @register_training_func('classify')
 def fit(model, ts, vs, es, **kwargs):
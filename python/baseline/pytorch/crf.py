@@ -1,7 +1,7 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from baseline.pytorch.torchy import vec_log_sum_exp, sequence_mask
+from baseline.pytorch.torchy import sequence_mask
 from baseline.utils import transition_mask as transition_mask_np, Offsets
 
 
@@ -16,7 +16,7 @@ def transition_mask(vocab, span_type, s_idx, e_idx, pad_idx=None):
 
 class CRF(nn.Module):
 
-    def __init__(self, n_tags, idxs=(Offsets.GO, Offsets.EOS), batch_first=False, constraint=None):
+    def __init__(self, n_tags, idxs=(Offsets.GO, Offsets.EOS), batch_first=False, constraint=None, script=False):
         """Initialize the object.
         :param n_tags: int: The number of tags in your output (emission size)
         :param idxs: Tuple(int. int): The index of the start and stop symbol
@@ -24,8 +24,11 @@ class CRF(nn.Module):
         :param batch_first: bool: if the input [B, T, ...] (true) or [T, B, ...] (false)
         :param constraint: torch.ByteTensor: Constraints on the transitions [N, N]
             invalid transitions should be set to `1`.
+        :param script: bool: Run the forward algorithm and viterbi with the TorchScript
+            compiled versions, see `script_crf_functions`.
         """
         super(CRF, self).__init__()
+        self.script = script
 
         self.start_idx, self.end_idx = idxs
         self.n_tags = n_tags
@@ -108,35 +111,8 @@ class CRF(nn.Module):
 
         :return: torch.FloatTensor: [B]
         """
-        min_length = torch.min(lengths)
-        # alphas: [B, 1, N]
-        alphas = torch.Tensor(batch_size, 1, self.n_tags).fill_(-1e4).to(unary.device)
-        alphas[:, 0, self.start_idx] = 0.
-        alphas.requires_grad = True
-
-        trans = self.transitions  # [1, N, N]
-
-        for i, unary_t in enumerate(unary):
-            # unary_t: [B, N]
-            unary_t = unary_t.unsqueeze(2)  # [B, N, 1]
-            # Broadcast alphas along the rows of trans
-            # Broadcast trans along the batch of alphas
-            # [B, 1, N] + [1, N, N] -> [B, N, N]
-            # Broadcast unary_t along the cols of result
-            # [B, N, N] + [B, N, 1] -> [B, N, N]
-            scores = alphas + trans + unary_t
-            new_alphas = vec_log_sum_exp(scores, 2).transpose(1, 2)
-            # If we haven't reached your length zero out old alpha and take new one.
-            # If we are past your length, zero out new_alpha and keep old one.
-            if i >= min_length:
-                mask = (i < lengths).view(-1, 1, 1)
-                alphas = alphas.masked_fill(mask, 0) + new_alphas.masked_fill(mask == 0, 0)
-            else:
-                alphas = new_alphas
-
-        terminal_vars = alphas + trans[:, self.end_idx]
-        alphas = vec_log_sum_exp(terminal_vars, 2)
-        return alphas.view(batch_size)
+        forward_fn = script_crf_functions()[0] if self.script else crf_forward
+        return forward_fn(unary, self.transitions, lengths, self.start_idx, self.end_idx)
 
     def decode(self, unary, lengths):
         """Do Viterbi decode on a batch.
@@ -150,66 +126,142 @@ class CRF(nn.Module):
         if self.batch_first:
             unary = unary.transpose(0, 1)
         trans = self.transitions  # [1, N, N]
+        if self.script:
+            return script_crf_functions()[1](unary, trans, lengths, crf_init_alphas(unary, self.start_idx), self.end_idx)
         return viterbi(unary, trans, lengths, self.start_idx, self.end_idx)
 
 
-def viterbi(unary, trans, lengths, start_idx, end_idx, norm=lambda x, y: x):
-    """Do Viterbi decode on a batch.
+def crf_init_alphas(unary, start_idx):
+    # type: (Tensor, int) -> Tensor
+    """The starting scores, all the mass is on the start tag.
+
+    :param unary: torch.FloatTensor: [T, B, N]
+    :param start_idx: int: The index of the go token
+
+    :return: torch.FloatTensor: [B, N]
+    """
+    _, batch_size, tag_size = unary.size()
+    alphas = torch.full((batch_size, tag_size), -1e4, dtype=unary.dtype, device=unary.device)
+    alphas[:, start_idx] = 0
+    return alphas
+
+
+def crf_forward(unary, trans, lengths, start_idx, end_idx):
+    # type: (Tensor, Tensor, Tensor, int, int) -> Tensor
+    """The forward algorithm (the log partition) for a batch.
+
+    The time loop only does one log-sum-exp per step.  The length mask is
+    built once and only applied (with a `where`) once the shortest
+    sequence is finished.
 
     :param unary: torch.FloatTensor: [T, B, N]
     :param trans: torch.FloatTensor: [1, N, N]
     :param lengths: torch.LongTensor: [B]
     :param start_idx: int: The index of the go token
     :param end_idx: int: The index of the eos token
-    :param norm: Callable: This function should take the initial and a dim to
-        normalize along.
 
-    :return: torch.LongTensor: [T, B] the padded paths
-    :return: torch.FloatTensor: [B] the path scores
+    :return: torch.FloatTensor: [B]
     """
     seq_len, batch_size, tag_size = unary.size()
-    min_length = torch.min(lengths)
-    backpointers = []
+    trans = trans.view(tag_size, tag_size)
+    min_length = int(torch.min(lengths))
+    # [T, B, 1]
+    mask = (torch.arange(seq_len, device=lengths.device).unsqueeze(1) < lengths.unsqueeze(0)).unsqueeze(-1)
+    alphas = torch.full((batch_size, tag_size), -1e4, dtype=unary.dtype, device=unary.device)
+    alphas[:, start_idx] = 0
+    for i in range(seq_len):
+        # [B, 1, N] + [N, N] -> [B, N, N], reduce over the previous tag
+        new_alphas = torch.logsumexp(alphas.unsqueeze(1) + trans, 2) + unary[i]
+        if i >= min_length:
+            alphas = torch.where(mask[i], new_alphas, alphas)
+        else:
+            alphas = new_alphas
+    return torch.logsumexp(alphas + trans[end_idx], 1)
 
-    # Alphas: [B, 1, N]
-    alphas = torch.Tensor(batch_size, 1, tag_size).fill_(-1e4).to(unary.device)
-    alphas[:, 0, start_idx] = 0
-    alphas = norm(alphas, -1)
 
-    for i, unary_t in enumerate(unary):
-        next_tag_var = alphas + trans
-        viterbi, best_tag_ids = torch.max(next_tag_var, 2)
-        backpointers.append(best_tag_ids.data)
-        new_alphas = viterbi + unary_t
-        new_alphas.unsqueeze_(1)
+def viterbi_from_alphas(unary, trans, lengths, alphas, end_idx):
+    # type: (Tensor, Tensor, Tensor, Tensor, int) -> Tuple[Tensor, Tensor]
+    """Viterbi decode on a batch starting from the initial scores.
+
+    The backpointers are written into a buffer allocated up front.  Past the end
+    of a sequence its backpointers are set to point at the same tag so the
+    backtrace is a single gather per step with no masking.
+
+    :param unary: torch.FloatTensor: [T, B, N]
+    :param trans: torch.FloatTensor: [1, N, N]
+    :param lengths: torch.LongTensor: [B]
+    :param alphas: torch.FloatTensor: [B, N] The initial scores
+    :param end_idx: int: The index of the eos token
+
+    :return: torch.LongTensor: [T, B] the padded paths
+    :return: torch.FloatTensor: [B] the path scores
+    """
+    seq_len, batch_size, tag_size = unary.size()
+    trans = trans.view(1, tag_size, tag_size)
+    min_length = int(torch.min(lengths))
+    # [T, B]
+    mask = torch.arange(seq_len, device=lengths.device).unsqueeze(1) < lengths.unsqueeze(0)
+    backpointers = torch.empty((seq_len, batch_size, tag_size), dtype=torch.long, device=unary.device)
+    same_tag = torch.arange(tag_size, device=unary.device).unsqueeze(0).expand(batch_size, tag_size)
+
+    for i in range(seq_len):
+        best_scores, best_tag_ids = torch.max(alphas.unsqueeze(1) + trans, 2)
+        new_alphas = best_scores + unary[i]
         if i >= min_length:
-            mask = (i < lengths).view(-1, 1, 1)
-            alphas = alphas.masked_fill(mask, 0) + new_alphas.masked_fill(mask == 0, 0)
+            mask_i = mask[i].unsqueeze(1)
+            alphas = torch.where(mask_i, new_alphas, alphas)
+            best_tag_ids = torch.where(mask_i, best_tag_ids, same_tag)
         else:
             alphas = new_alphas
+        backpointers[i] = best_tag_ids
 
     # Add end tag
-    terminal_var = alphas.squeeze(1) + trans[:, end_idx, :]
+    terminal_var = alphas + trans[0, end_idx]
     path_score, best_tag_id = torch.max(terminal_var, 1)
 
-    # Flip lengths
-    rev_len = seq_len - lengths - 1
-
-    best_path = [best_tag_id]
-    for i, backpointer_t in enumerate(reversed(backpointers)):
-        # Get new best tag candidate
-        new_best_tag_id = backpointer_t.gather(1, best_tag_id.unsqueeze(1)).squeeze(1)
-        # We are going backwards now, if you haven't passed your flipped length
-        # then you aren't in your real results yet so we propagate best tag
-        # from the argmax on the terminal_var
-        mask = (i > rev_len)
-        best_tag_id = best_tag_id.masked_fill(mask, 0) + new_best_tag_id.masked_fill(mask == 0, 0)
-        best_path.append(best_tag_id)
-    _ = best_path.pop()
-    best_path.reverse()
-    best_path = torch.stack(best_path)
+    best_path = torch.empty((seq_len, batch_size), dtype=torch.long, device=unary.device)
+    best_path[seq_len - 1] = best_tag_id
+    for i in range(seq_len - 1, 0, -1):
+        best_tag_id = backpointers[i].gather(1, best_tag_id.unsqueeze(1)).squeeze(1)
+        best_path[i - 1] = best_tag_id
     # Mask out the extra tags (This might be pointless given that anything that
     # will use this as a dense tensor downstream will mask it itself?)
-    seq_mask = sequence_mask(lengths).to(best_path.device).transpose(0, 1)
-    best_path = best_path.masked_fill(seq_mask == 0, 0)
+    best_path = best_path.masked_fill(mask == 0, 0)
     return best_path, path_score
+
+
+_SCRIPTED = []
+
+
+def script_crf_functions():
+    """Get TorchScript compiled versions of `crf_forward` and `viterbi_from_alphas`.
+
+    They are compiled the first time this is called.
+
+    :return: Tuple(Callable, Callable): The compiled forward and viterbi functions
+    """
+    if not _SCRIPTED:
+        _SCRIPTED.extend([torch.jit.script(crf_forward), torch.jit.script(viterbi_from_alphas)])
+    return _SCRIPTED[0], _SCRIPTED[1]
+
+
+def viterbi(unary, trans, lengths, start_idx, end_idx, norm=lambda x, y: x):
+    """Do Viterbi decode on a batch.
+
+    :param unary: torch.FloatTensor: [T, B, N]
+    :param trans: torch.FloatTensor: [1, N, N]
+    :param lengths: torch.LongTensor: [B]
+    :param start_idx: int: The index of the go token
+    :param end_idx: int: The index of the eos token
+    :param norm: Callable: This function should take the initial and a dim to
+        normalize along.
+
+    :return: torch.LongTensor: [T, B] the padded paths
+    :return: torch.FloatTensor: [B] the path scores
+    """
+    seq_len, batch_size, tag_size = unary.size()
+    # Alphas: [B, 1, N]
+    alphas = torch.Tensor(batch_size, 1, tag_size).fill_(-1e4).to(unary.device)
+    alphas[:, 0, start_idx] = 0
+    alphas = norm(alphas, -1)
+    return viterbi_from_alphas(unary, trans, lengths, alphas.view(batch_size, tag_size), end_idx)
@@ -52,9 +52,7 @@ class LanguageModelTrainerPyTorch(Trainer):
             epoch = self.valid_epochs
         start = time.time()
         self.model.eval()
-        total_loss = 0
-        total_toks = 0
-        metrics = {}
+        acc = MetricsAccumulator()
         batchsz, nctx = self._get_dims(vs[0])
 
         hidden = self.model.init_hidden(batchsz)
@@ -63,12 +61,10 @@ class LanguageModelTrainerPyTorch(Trainer):
             inputs = self.model.make_input(batch_dict)
             y = inputs.pop('y')
             output, hidden = self.model(inputs, hidden)
-            toks = self._num_toks(batch_dict)
-            total_loss += self.crit(output, y).item() * toks
-            total_toks += toks
+            acc.add_loss(self.crit(output, y), self._num_toks(batch_dict))
             if hidden is not None:
                 hidden = self.repackage_hidden(hidden)
-        metrics = self.calc_metrics(total_loss, total_toks)
+        metrics = self.calc_metrics(*acc.loss())
         self.report(
             epoch, metrics, start,
             phase, 'EPOCH', reporting_fns
@@ -79,8 +75,8 @@ class LanguageModelTrainerPyTorch(Trainer):
         start = time.time()
         self.nstep_start = start
         self.model.train()
-        epoch_loss = 0
-        epoch_toks = 0
+        acc = MetricsAccumulator()
+        nstep_acc = MetricsAccumulator()
         batchsz, nctx = self._get_dims(ts[0])
         hidden = self.model.init_hidden(batchsz)
 
@@ -96,20 +92,19 @@ class LanguageModelTrainerPyTorch(Trainer):
             torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip)
             self.optimizer.step()
             toks = self._num_toks(batch_dict)
-            report_loss = loss.item() * toks
-            epoch_loss += report_loss
-            epoch_toks += toks
-            self.nstep_agg += report_loss
-            self.nstep_div += toks
+            acc.add_loss(loss, toks)
+            nstep_acc.add_loss(loss, toks)
             if (self.optimizer.global_step + 1) % self.nsteps == 0:
+                self.nstep_agg, self.nstep_div = nstep_acc.loss()
                 metrics = self.calc_metrics(self.nstep_agg, self.nstep_div)
                 self.report(
                     self.optimizer.global_step + 1, metrics, self.nstep_start,
                     'Train', 'STEP', reporting_fns, self.nsteps
                 )
                 self.reset_nstep()
+                nstep_acc.reset()
 
-        metrics = self.calc_metrics(epoch_loss, epoch_toks)
+        metrics = self.calc_metrics(*acc.loss())
         self.train_epochs += 1
         self.report(
             self.train_epochs, metrics, start,
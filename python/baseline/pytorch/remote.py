@@ -8,6 +8,14 @@ def _convert(data):
     return np.array(data)
 
 
+def _stack(arrays):
+    """Stack arrays that can differ in length along the first dim, padding with zeros"""
+    batch = np.zeros((len(arrays), max(len(a) for a in arrays)) + arrays[0].shape[1:], dtype=np.result_type(*arrays))
+    for i, a in enumerate(arrays):
+        batch[i, :len(a)] = a
+    return batch
+
+
 @register_remote('http')
 class RemoteModelRESTPytorch(RemoteModelREST):
     """JSON schema:
@@ -39,14 +47,29 @@ class RemoteModelRESTPytorch(RemoteModelREST):
         example.
         """
         results = []
-        example_input = examples[self.input_keys[0]]
-        batch_size = len(example_input)
-        for i in range(batch_size):
-            example = {k: np.array([v[i]]) for k, v in examples.items()}
+        for example in self._split(examples):
             example_output = super(RemoteModelRESTPytorch, self).predict(example, **kwargs)
             results.append(example_output[0])
         return results
 
+    def predict_arrays(self, examples):
+        """Send a request per example (see `predict`) and stack the outputs back into whole arrays
+
+        :param examples: The input examples
+        :return: (`dict`) The `classes` (and for `predict_text`, the `scores`) as `np.ndarray`s, `tag_text` classes
+            are zero padded to the longest example
+        """
+        outputs = [
+            super(RemoteModelRESTPytorch, self).predict(example, batched=True) for example in self._split(examples)
+        ]
+        return {k: _stack([o[k][0] for o in outputs]) for k in outputs[0]}
+
+    def _split(self, examples):
+        """Yield a batch of one for each example"""
+        batch_size = len(examples[self.input_keys[0]])
+        for i in range(batch_size):
+            yield {k: np.array([v[i]]) for k, v in examples.items()}
+
     def create_request(self, examples):
         request = {}
         request['signature_name'] = self.signature
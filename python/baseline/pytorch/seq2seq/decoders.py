@@ -214,10 +214,16 @@ layer's hidden size == embedding weight dimensions")
         dec_out = dec_out[beams, :]
         return h_i, dec_out, context, src_mask
 
+    def beam_compact(self, rows, extra):
+        """Drop the finished examples, this also selects the (tiled) context and mask."""
+        h_i, dec_out, context, src_mask = self.beam_update(rows, extra)
+        return h_i, dec_out, context[rows], src_mask[rows]
+
     def beam_search(self, encoder_outputs, **kwargs):
         alpha = kwargs.get('alpha')
         if alpha is not None: kwargs['length_penalty'] = partial(gnmt_length_penalty, alpha=alpha)
-        return beam_search(encoder_outputs, self.beam_init, self.beam_step, self.beam_update, **kwargs)
+        compact = self.beam_compact if kwargs.pop('compact', True) else None
+        return beam_search(encoder_outputs, self.beam_init, self.beam_step, self.beam_update, compact=compact, **kwargs)
 
 
 @register_decoder(name='default')
@@ -289,24 +295,46 @@ class TransformerDecoderWrapper(torch.nn.Module):
         return pred
 
     def beam_init(self, encoder_outputs, K):
-        """Tile for the batch of the encoder inputs."""
+        """Tile for the batch of the encoder inputs and create the key/value cache for incremental decoding."""
         encoder_outputs = TransformerEncoderOutput(
             repeat_batch(encoder_outputs.output, K),
             repeat_batch(encoder_outputs.src_mask, K)
         )
-        return encoder_outputs
+        return encoder_outputs, self.transformer_decoder.init_cache()
 
     def beam_step(self, paths, extra):
-        """Calculate the probs for the last item based on the full path."""
+        """Calculate the probs for the last item, reusing the cached keys and values of the earlier steps.
+
+        The embeddings still see the full path so that any positional information is the same as in `forward`,
+        but only the last step is run through the decoder layers.
+        """
+        encoder_outputs, cache = extra
         B, K, T = paths.size()
-        return self(extra, paths.view(B * K, T))[:, -1], extra
+        embed_out_bth = self.tgt_embeddings(paths.view(B * K, T))[:, -1:]
+        embed_out_bth = self.proj_to_hsz(embed_out_bth)
+        src_mask = encoder_outputs.src_mask.unsqueeze(1).unsqueeze(1)
+        output = self.transformer_decoder(embed_out_bth, encoder_outputs.output, src_mask, None, cache=cache)
+        output = self.proj_to_dsz(output)
+        return self.output(output)[:, -1], extra
 
     def beam_update(self, beams, extra):
-        """There is no state for the transformer so just pass it."""
-        return extra
+        """Select the cached keys and values of the best performing beams."""
+        encoder_outputs, cache = extra
+        return encoder_outputs, self.transformer_decoder.reorder_cache(cache, beams)
+
+    def beam_compact(self, rows, extra):
+        """Drop the finished examples from the encoder outputs and all of the cached keys and values."""
+        encoder_outputs, cache = extra
+        encoder_outputs = TransformerEncoderOutput(encoder_outputs.output[rows], encoder_outputs.src_mask[rows])
+        for layer in cache:
+            for attn in layer.values():
+                for k, v in attn.items():
+                    attn[k] = v[rows]
+        return encoder_outputs, cache
 
     def beam_search(self, encoder_outputs, **kwargs):
-        return beam_search(encoder_outputs, self.beam_init, self.beam_step, self.beam_update, **kwargs)
+        compact = self.beam_compact if kwargs.pop('compact', True) else None
+        return beam_search(encoder_outputs, self.beam_init, self.beam_step, self.beam_update, compact=compact, **kwargs)
 
 
 def update_lengths(lengths, eoses, idx):
@@ -398,6 +426,7 @@ def beam_search(
         encoder_outputs,
         init, step, update,
         length_penalty=no_length_penalty,
+        compact=None,
         **kwargs
 ):
     """Perform batched Beam Search.
@@ -420,6 +449,12 @@ def beam_search(
         A callable that generates a penalty based on the lengths. Lengths is
         [B, K] and the returned penalty should be [B, K, 1] (or [B, K, V] to
         have token based penalties?)
+    :param compact: `Callable(rows: torch.LongTensor, extra) -> extra:
+        An optional callable that selects the rows (in [0, B * K)) of all the
+        decoding state, including things like the encoder output that `update`
+        leaves alone. When this is given, examples whose beams have all hit EOS are
+        dropped from the search so the remaining steps only run on the unfinished
+        examples. The results are the same as without it.
 
     :Keyword Arguments:
     * *beam* -- `int`: The number of beams to use.
@@ -437,25 +472,36 @@ def beam_search(
     device = encoder_outputs.output.device
     with torch.no_grad():
         extra = init(encoder_outputs, K)
-        paths = torch.full((bsz, K, 1), Offsets.GO, dtype=torch.long, device=device)
+        # The paths are written into a buffer with room for every step (and a final EOS) instead of
+        # growing them each step. Unused steps are left as EOS, which is what finished beams produce.
+        paths = torch.full((bsz, K, mxlen + 1), Offsets.EOS, dtype=torch.long, device=device)
+        paths[:, :, 0] = Offsets.GO
+        T = 1
         # This tracks the log prob of each beam. This is distinct from score which
         # is based on the log prob and penalties.
         log_probs = torch.zeros((bsz, K), dtype=torch.float, device=device)
         # Tracks the lengths of the beams, unfinished beams have a lengths of zero.
         lengths = torch.zeros((bsz, K), dtype=torch.long, device=device)
-        last = paths[:, :, -1]  # [B, K]
+        best_scores = torch.zeros((bsz, K), dtype=torch.float, device=device)
+        # When compacting, the outputs of finished examples are moved here and `active` maps the
+        # rows that are still being searched back to the example they came from.
+        out_paths, out_lengths, out_scores = paths, lengths, best_scores
+        active = torch.arange(bsz, dtype=torch.long, device=device)
+        beam_range = torch.arange(K, dtype=torch.long, device=device)
+        offsets = torch.arange(bsz, dtype=torch.long, device=device) * K
+        eos_mask = None
 
         for i in range(mxlen - 1):
-            probs, extra = step(paths, extra)
+            probs, extra = step(paths[:, :, :T], extra)
             V = probs.size(-1)
             probs = probs.view((bsz, K, V))  # [B, K, V]
             if i > 0:
                 # This mask is for all beams that are done.
                 done_mask = (lengths != 0).unsqueeze(-1)  # [B, K, 1]
-                # Can creating this mask be moved out of the loop? It never changes but we don't have V
                 # This mask selects the EOS token
-                eos_mask = torch.zeros((1, 1, V), dtype=MASK_TYPE, device=device)
-                eos_mask[:, :, Offsets.EOS] = 1
+                if eos_mask is None:
+                    eos_mask = torch.zeros((1, 1, V), dtype=MASK_TYPE, device=device)
+                    eos_mask[:, :, Offsets.EOS] = 1
                 # This mask selects the EOS token of only the beams that are done.
                 mask = done_mask & eos_mask
                 # Put all probability mass on the EOS token for finished beams.
@@ -480,20 +526,19 @@ def beam_search(
             # Get the log_probs of the best scoring beams
             log_probs = probs.view(bsz, -1).gather(1, best_idx).view(bsz, K)
 
-            best_beams = best_idx / V  # Get which beam it came from
+            best_beams = best_idx // V  # Get which beam it came from
             best_idx = best_idx % V  # Get the index of the word regardless of which beam it is.
 
             # Best Beam index is relative within the batch (only [0, K)).
             # This makes the index global (e.g. best beams for the second
             # batch example is in [K, 2*K)).
-            offsets = torch.arange(bsz, dtype=torch.long, device=device) * K
             offset_beams = best_beams + offsets.unsqueeze(-1)
             flat_beams = offset_beams.view(bsz * K)
-            # Select the paths to extend based on the best beams
+            # Select the paths to extend based on the best beams and add the selected outputs
             flat_paths = paths.view(bsz * K, -1)
-            new_paths = flat_paths[flat_beams, :].view(bsz, K, -1)
-            # Add the selected outputs to the paths
-            paths = torch.cat([new_paths, best_idx.unsqueeze(-1)], dim=2)
+            flat_paths[:, :T] = flat_paths[flat_beams, :T]
+            paths[:, :, T] = best_idx
+            T += 1
 
             # Select the lengths to keep tracking based on the valid beams left.
             lengths = lengths.view(-1)[flat_beams].view((bsz, K))
@@ -501,15 +546,28 @@ def beam_search(
             extra = update(flat_beams, extra)
 
             # Updated lengths based on if we hit EOS
-            last = paths[:, :, -1]
-            eoses = (last == Offsets.EOS)
+            eoses = (best_idx == Offsets.EOS)
             lengths = update_lengths(lengths, eoses, i + 1)
-            if (lengths != 0).all():
+            done = (lengths != 0).all(1)
+            if done.all():
                 break
+            if compact is not None and done.any():
+                # Move the finished examples to the outputs and drop them from the search
+                finished = active[done]
+                out_paths[finished] = paths[done]
+                out_lengths[finished] = lengths[done]
+                out_scores[finished] = best_scores[done]
+                keep = (~done).nonzero().view(-1)
+                active = active[keep]
+                paths, lengths, log_probs = paths[keep], lengths[keep], log_probs[keep]
+                rows = (keep.unsqueeze(-1) * K + beam_range).view(-1)
+                extra = compact(rows, extra)
+                bsz = active.size(0)
+                offsets = offsets[:bsz]
         else:
             # This runs if the loop didn't break meaning one beam hit the max len
             # Add an EOS to anything that hasn't hit the end. This makes the scores real.
-            probs, extra = step(paths, extra)
+            probs, extra = step(paths[:, :, :T], extra)
 
             V = probs.size(-1)
             probs = probs.view((bsz, K, V))
@@ -517,11 +575,17 @@ def beam_search(
             # If any of the beams are done mask out the score of this EOS (they already had an EOS)
             probs = probs.masked_fill((lengths != 0), 0)
             log_probs = log_probs + probs
-            end_tokens = torch.full((bsz, K, 1), Offsets.EOS, device=device, dtype=paths.dtype)
-            paths = torch.cat([paths, end_tokens], dim=2)
+            # The buffer is already EOS at T
+            T += 1
             lengths = update_lengths(lengths, torch.ones_like(lengths) == 1, mxlen)
             best_scores = log_probs / length_penalty(lengths).squeeze(-1)
 
+        if out_paths is not paths:
+            out_paths[active] = paths
+            out_lengths[active] = lengths
+            out_scores[active] = best_scores
+            paths, lengths, best_scores = out_paths, out_lengths, out_scores
+
     # Slice off the Offsets.GO token
-    paths = paths[:, :, 1:]
+    paths = paths[:, :, 1:T]
     return paths, lengths, best_scores
@@ -6,8 +6,8 @@ from baseline.progress import create_progress_bar
 from baseline.utils import listify, get_model_file, get_metric_cmp
 from baseline.train import Trainer, create_trainer, register_trainer, register_training_func
 from baseline.pytorch.optz import OptimizerManager
-from baseline.bleu import bleu
-from baseline.utils import convert_seq2seq_golds, convert_seq2seq_preds
+from baseline.pytorch.torchy import MetricsAccumulator
+from baseline.bleu import BleuScorer, ids_to_tokens
 
 logger = logging.getLogger('baseline')
 
@@ -24,7 +24,8 @@ class Seq2SeqTrainerPyTorch(Trainer):
         self._input = model.make_input
         self._predict = model.predict
         self.crit = model.create_loss()
-        self.tgt_rlut = kwargs['tgt_rlut']
+        # Score on the index sequences, the reference statistics are cached across validation epochs
+        self.bleu = BleuScorer(processes=int(kwargs.get('bleu_processes', 1)))
         if self.gpu:
             self.model = torch.nn.DataParallel(model).cuda()
             self.crit.cuda()
@@ -44,7 +45,7 @@ class Seq2SeqTrainerPyTorch(Trainer):
             return self._evaluate(vs, reporting_fns, **kwargs)
 
         self.model.eval()
-        total_loss = total_toks = 0
+        acc = MetricsAccumulator()
         steps = len(vs)
         self.valid_epochs += 1
         preds = []
@@ -58,15 +59,13 @@ class Seq2SeqTrainerPyTorch(Trainer):
             tgt_lens = batch_dict['tgt_lengths']
             pred = self.model(input_)
             loss = self.crit(pred, tgt)
-            toks = self._num_toks(tgt_lens)
-            total_loss += loss.item() * toks
-            total_toks += toks
+            acc.add_loss(loss, self._num_toks(tgt_lens))
             greedy_preds = [p[0] for p in self._predict(input_, beam=1, make_input=False)]
-            preds.extend(convert_seq2seq_preds(greedy_preds, self.tgt_rlut))
-            golds.extend(convert_seq2seq_golds(tgt.cpu().numpy(), tgt_lens, self.tgt_rlut))
+            preds.extend(ids_to_tokens(greedy_preds))
+            golds.extend([gold] for gold in ids_to_tokens(tgt, tgt_lens))
 
-        metrics = self.calc_metrics(total_loss, total_toks)
-        metrics['bleu'] = bleu(preds, golds)[0]
+        metrics = self.calc_metrics(*acc.loss())
+        metrics['bleu'] = self.bleu.score(preds, golds)[0]
         self.report(
             self.valid_epochs, metrics, start,
             phase, 'EPOCH', reporting_fns
@@ -84,9 +83,9 @@ class Seq2SeqTrainerPyTorch(Trainer):
             tgt = batch_dict['tgt']
             tgt_lens = batch_dict['tgt_lengths']
             pred = [p[0] for p in self._predict(batch_dict, **kwargs)]
-            preds.extend(convert_seq2seq_preds(pred, self.tgt_rlut))
-            golds.extend(convert_seq2seq_golds(tgt, tgt_lens, self.tgt_rlut))
-        metrics = {'bleu': bleu(preds, golds)[0]}
+            preds.extend(ids_to_tokens(pred))
+            golds.extend([gold] for gold in ids_to_tokens(tgt, tgt_lens))
+        metrics = {'bleu': self.bleu.score(preds, golds)[0]}
         self.report(
             0, metrics, start, 'Test', 'EPOCH', reporting_fns
         )
@@ -96,8 +95,8 @@ class Seq2SeqTrainerPyTorch(Trainer):
     def train(self, ts, reporting_fns):
         self.model.train()
 
-        epoch_loss = 0
-        epoch_toks = 0
+        acc = MetricsAccumulator()
+        nstep_acc = MetricsAccumulator()
 
         start = time.time()
         self.nstep_start = start
@@ -114,21 +113,20 @@ class Seq2SeqTrainerPyTorch(Trainer):
             self.optimizer.step()
             tgt_lens = batch_dict['tgt_lengths']
             tok_count = self._num_toks(tgt_lens)
-            reporting_loss = loss.item() * tok_count
-            epoch_loss += reporting_loss
-            epoch_toks += tok_count
-            self.nstep_agg += reporting_loss
-            self.nstep_div += tok_count
+            acc.add_loss(loss, tok_count)
+            nstep_acc.add_loss(loss, tok_count)
 
             if (self.optimizer.global_step + 1) % self.nsteps == 0:
+                self.nstep_agg, self.nstep_div = nstep_acc.loss()
                 metrics = self.calc_metrics(self.nstep_agg, self.nstep_div)
                 self.report(
                     self.optimizer.global_step + 1, metrics, self.nstep_start,
                     'Train', 'STEP', reporting_fns, self.nsteps
                 )
                 self.reset_nstep()
+                nstep_acc.reset()
 
-        metrics = self.calc_metrics(epoch_loss, epoch_toks)
+        metrics = self.calc_metrics(*acc.loss())
         self.train_epochs += 1
         self.report(
             self.train_epochs, metrics, start,
@@ -2,10 +2,10 @@ import six
 import logging
 from baseline.progress import create_progress_bar
 from baseline.train import EpochReportingTrainer, create_trainer, register_trainer, register_training_func
-from baseline.utils import listify, to_spans, f_score, revlut, get_model_file, write_sentence_conll, get_metric_cmp
+from baseline.utils import listify, f_score, revlut, get_model_file, write_sentence_conll, get_metric_cmp
 from baseline.pytorch.torchy import *
 from baseline.pytorch.optz import OptimizerManager
-from baseline.utils import span_f1, per_entity_f1, conlleval_output
+from baseline.utils import SpanF1, conlleval_output
 
 logger = logging.getLogger('baseline')
 
@@ -39,43 +39,33 @@ class TaggerTrainerPyTorch(EpochReportingTrainer):
     def _get_batchsz(batch_dict):
         return batch_dict['y'].shape[0]
 
-    def process_output(self, guess, truth, sentence_lengths, ids, handle=None, txts=None):
+    def process_output(self, guess, truth, sentence_lengths, ids, handle=None, txts=None, spans=None):
 
         # For acc
-        correct_labels = 0
-        total_labels = 0
         truth_n = truth.cpu().numpy()
+        guesses = [g.cpu().numpy() for g in guess]
+        golds = [truth_n[b, :sl] for b, sl in enumerate(sentence_lengths)]
+        correct_labels = sum(np.sum(np.equal(g, p)) for g, p in zip(golds, guesses))
+        total_labels = sum(len(g) for g in golds)
         # For f1
-        gold_chunks = []
-        pred_chunks = []
-
-        # For each sentence
-        for b in range(len(guess)):
-            sentence = guess[b].cpu().numpy()
-            sentence_length = sentence_lengths[b]
-
-            gold = truth_n[b, :sentence_length]
-            correct_labels += np.sum(np.equal(sentence, gold))
-            total_labels += sentence_length
-            gold_chunks.append(set(to_spans(gold, self.idx2label, self.span_type, self.verbose)))
-            pred_chunks.append(set(to_spans(sentence, self.idx2label, self.span_type, self.verbose)))
-
-            # Should we write a file out?  If so, we have to have txts
-            if handle is not None and txts is not None:
+        if spans is not None:
+            spans.add_batch(golds, guesses)
+
+        # Should we write a file out?  If so, we have to have txts
+        if handle is not None and txts is not None:
+            for b, (sentence, gold) in enumerate(zip(guesses, golds)):
                 txt_id = ids[b]
                 txt = txts[txt_id]
                 write_sentence_conll(handle, sentence, gold, txt, self.idx2label)
 
-        return correct_labels, total_labels, gold_chunks, pred_chunks
+        return correct_labels, total_labels
 
     def _test(self, ts, **kwargs):
 
         self.model.eval()
         total_sum = 0
         total_correct = 0
-
-        gold_spans = []
-        pred_spans = []
+        spans = SpanF1(self.idx2label, self.span_type, self.verbose)
 
         metrics = {}
         steps = len(ts)
@@ -92,28 +82,26 @@ class TaggerTrainerPyTorch(EpochReportingTrainer):
             lengths = inputs['lengths']
             ids = inputs['ids']
             pred = self.model(inputs)
-            correct, count, golds, guesses = self.process_output(pred, y.data, lengths, ids, handle, txts)
+            correct, count = self.process_output(pred, y.data, lengths, ids, handle, txts, spans)
             total_correct += correct
             total_sum += count
-            gold_spans.extend(golds)
-            pred_spans.extend(guesses)
 
         total_acc = total_correct / float(total_sum)
         metrics['acc'] = total_acc
-        metrics['f1'] = span_f1(gold_spans, pred_spans)
+        metrics['f1'] = spans.get_f1()
         if self.verbose:
             # TODO: Add programmatic access to these metrics?
-            conll_metrics = per_entity_f1(gold_spans, pred_spans)
+            conll_metrics = spans.get_all_metrics()
             conll_metrics['acc'] = total_acc * 100
-            conll_metrics['tokens'] = total_sum.item()
+            conll_metrics['tokens'] = total_sum
             logger.info(conlleval_output(conll_metrics))
         return metrics
 
     def _train(self, ts, **kwargs):
         self.model.train()
         reporting_fns = kwargs.get('reporting_fns', [])
-        epoch_loss = 0
-        epoch_norm = 0
+        acc = MetricsAccumulator()
+        nstep_acc = MetricsAccumulator()
         steps = len(ts)
         pg = create_progress_bar(steps)
         for batch_dict in pg(ts):
@@ -124,20 +112,19 @@ class TaggerTrainerPyTorch(EpochReportingTrainer):
             torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip)
             self.optimizer.step()
             bsz = self._get_batchsz(batch_dict)
-            report_loss = loss.item() * bsz
-            epoch_loss += report_loss
-            epoch_norm += bsz
-            self.nstep_agg += report_loss
-            self.nstep_div += bsz
+            acc.add_loss(loss, bsz)
+            nstep_acc.add_loss(loss, bsz)
             if (self.optimizer.global_step + 1) % self.nsteps == 0:
+                self.nstep_agg, self.nstep_div = nstep_acc.loss()
                 metrics = self.calc_metrics(self.nstep_agg, self.nstep_div)
                 self.report(
                     self.optimizer.global_step + 1, metrics, self.nstep_start,
                     'Train', 'STEP', reporting_fns, self.nsteps
                 )
                 self.reset_nstep()
+                nstep_acc.reset()
 
-        metrics = self.calc_metrics(epoch_loss, epoch_norm)
+        metrics = self.calc_metrics(*acc.loss())
         return metrics
 
 
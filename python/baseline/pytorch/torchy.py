@@ -644,3 +644,65 @@ def unsort_batch(batch, perm_idx):
     extra_dims = [1] * diff
     perm_idx = perm_idx.view([-1] + extra_dims)
     return batch.scatter_(0, perm_idx.expand_as(batch), batch)
+
+
+class MetricsAccumulator(object):
+    """Accumulate losses and confusion counts on the device of the model
+
+    Calling `loss.item()` or moving predictions to the CPU every step forces the host to wait on
+    the device.  This keeps the running sums as tensors and only syncs when the values are read,
+    which the trainers do at `nsteps` reporting boundaries and at the end of an epoch.
+    """
+    def __init__(self, nc=None):
+        """Constructor
+
+        :param nc: The number of classes to track confusion counts for, or `None` for loss only
+        """
+        self.nc = nc
+        self.reset()
+
+    def reset(self):
+        self.agg = None
+        self.norm = 0
+        self.counts = None
+
+    def add_loss(self, loss, norm):
+        """Add a (mean) loss that was computed over `norm` items
+
+        :param loss: A scalar `torch.Tensor`
+        :param norm: The number of items (examples or tokens) in the batch
+        """
+        norm = float(norm)
+        loss = loss.detach().double() * norm
+        self.agg = loss if self.agg is None else self.agg + loss
+        self.norm += norm
+
+    def add_batch(self, truth, guess):
+        """Add a batch of predictions to the confusion counts
+
+        :param truth: A `torch.LongTensor` of gold labels
+        :param guess: A `torch.Tensor` of predicted labels, or of scores over the classes
+        """
+        if guess.dim() > truth.dim():
+            guess = guess.argmax(-1)
+        index = truth.reshape(-1).long() * self.nc + guess.reshape(-1).long()
+        counts = torch.bincount(index, minlength=self.nc * self.nc)
+        self.counts = counts if self.counts is None else self.counts + counts
+
+    def loss(self):
+        """Sync the loss sum to the host
+
+        :return: A tuple of the (``float``) loss sum and the (``float``) normalizer
+        """
+        if self.agg is None:
+            return 0.0, self.norm
+        return self.agg.item(), self.norm
+
+    def confusion(self):
+        """Sync the confusion counts to the host
+
+        :return: A `np.ndarray` of shape `[nc, nc]` indexed by truth then guess
+        """
+        if self.counts is None:
+            return np.zeros((self.nc, self.nc), dtype=np.int64)
+        return self.counts.view(self.nc, self.nc).cpu().numpy()
@@ -96,21 +96,32 @@ class MultiHeadedAttention(nn.Module):
         self.attn = None
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, query, key, value, mask=None):
+    def forward(self, query, key, value, mask=None, cache=None, static_kv=False):
         """Low-order projections of query, key and value into multiple heads, then attention application and dropout
 
         :param query: a query for alignment. Can come from self in case of self-attn or decoder in case of E/D
         :param key: a set of keys from encoder or self
         :param value: a set of values from encoder or self
         :param mask: masking (for destination) to prevent seeing what we shouldnt
+        :param cache: (``dict``) The projected keys and values from earlier decoding steps, this is updated in place
+        :param static_kv: (``bool``) The keys and values don't change between steps (E/D attention) so they are
+            only projected on the first step.  Otherwise the new keys and values are appended to the cached ones
         :return: Multi-head attention output, result of attention application to sequence (B, T, d_model)
         """
         batchsz = query.size(0)
 
         # (B, H, T, D)
         query = self.w_Q(query).view(batchsz, -1, self.h, self.d_k).transpose(1, 2)
-        key = self.w_K(key).view(batchsz, -1, self.h, self.d_k).transpose(1, 2)
-        value = self.w_V(value).view(batchsz, -1, self.h, self.d_k).transpose(1, 2)
+        if cache is not None and static_kv and 'key' in cache:
+            key, value = cache['key'], cache['value']
+        else:
+            key = self.w_K(key).view(batchsz, -1, self.h, self.d_k).transpose(1, 2)
+            value = self.w_V(value).view(batchsz, -1, self.h, self.d_k).transpose(1, 2)
+            if cache is not None:
+                if 'key' in cache:
+                    key = torch.cat([cache['key'], key], dim=2)
+                    value = torch.cat([cache['value'], value], dim=2)
+                cache['key'], cache['value'] = key, value
 
         x, self.attn = self.attn_fn(query, key, value, mask=mask, dropout=self.dropout)
 
@@ -164,13 +175,25 @@ class TransformerDecoder(nn.Module):
         self.ln3 = nn.LayerNorm(self.d_model, eps=1e-12)
         self.dropout = nn.Dropout(pdrop)
 
-    def forward(self, x, memory, src_mask, tgt_mask):
+    def forward(self, x, memory, src_mask, tgt_mask, cache=None):
+        """
+        :param x: The decoder input (B, T, d_model), just the newest step (B, 1, d_model) when decoding with a cache
+        :param memory: The encoder output
+        :param src_mask: The mask for the encoder output
+        :param tgt_mask: The mask for the decoder input, this can be `None` when decoding one step with a cache
+        :param cache: (``dict``) The self and src attention caches for this layer, see
+            `TransformerDecoderStack.init_cache`
+        :return: The output of this layer
+        """
+        self_cache = src_cache = None
+        if cache is not None:
+            self_cache, src_cache = cache['self'], cache['src']
 
         x = self.ln1(x)
-        x = x + self.dropout(self.self_attn(x, x, x, tgt_mask))
+        x = x + self.dropout(self.self_attn(x, x, x, tgt_mask, cache=self_cache))
 
         x = self.ln2(x)
-        x = x + self.dropout(self.src_attn(x, memory, memory, src_mask))
+        x = x + self.dropout(self.src_attn(x, memory, memory, src_mask, cache=src_cache, static_kv=True))
 
         x = self.ln3(x)
         x = x + self.dropout(self.ffn(x))
@@ -195,7 +218,42 @@ class TransformerDecoderStack(nn.Module):
         single_layer = TransformerDecoder(num_heads, d_model, pdrop, scale, activation_type, d_ff)
         self.layers = pytorch_clone_module(single_layer, layers)
 
-    def forward(self, x, memory, src_mask, tgt_mask):
-        for layer in self.layers:
-            x = layer(x, memory, src_mask, tgt_mask)
+    def forward(self, x, memory, src_mask, tgt_mask, cache=None):
+        """Run the decoder layers
+
+        For incremental decoding pass a cache from `init_cache` and only the newest step of `x`, the
+        keys and values from the earlier steps are reused so each step only does the work for one position
+
+        :param x: The decoder input (B, T, d_model)
+        :param memory: The encoder output
+        :param src_mask: The mask for the encoder output
+        :param tgt_mask: The mask for the decoder input
+        :param cache: (``list``) The per-layer caches from `init_cache`, updated in place
+        :return: The decoder output
+        """
+        for i, layer in enumerate(self.layers):
+            x = layer(x, memory, src_mask, tgt_mask, cache=None if cache is None else cache[i])
         return x
+
+    def init_cache(self):
+        """Create an empty cache of the keys and values for each layer for incremental decoding
+
+        :return: (``list``) A cache to pass to `forward`
+        """
+        return [{'self': {}, 'src': {}} for _ in self.layers]
+
+    @staticmethod
+    def reorder_cache(cache, beams):
+        """Select the cached keys and values for the beams that survived a beam search step
+
+        Only the self attention caches need to move, the E/D attention keys and values come from the
+        encoder output which is the same for all the beams of an example.
+
+        :param cache: (``list``) The cache from `init_cache`
+        :param beams: (``torch.LongTensor``) The flat index of the beam each new beam came from (B * K)
+        :return: The cache, updated in place
+        """
+        for layer in cache:
+            for k, v in layer['self'].items():
+                layer['self'][k] = v[beams]
+        return cache
@@ -3,16 +3,34 @@ from six.moves import filter
 
 import os
 import re
+import json
+import logging
 import codecs
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
 from itertools import chain
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import baseline.data
-from baseline.vectorizers import Dict1DVectorizer, GOVectorizer, Token1DVectorizer
-from baseline.utils import import_user_module, revlut, export, optional_params, Offsets, listify
+from baseline.vectorizers import Vectorizer, Dict1DVectorizer, GOVectorizer, Token1DVectorizer
+from baseline.utils import (
+    import_user_module,
+    revlut,
+    export,
+    optional_params,
+    Offsets,
+    listify,
+    read_json,
+    write_json,
+    file_sha1
+)
 
 __all__ = []
 exporter = export(__all__)
+logger = logging.getLogger('baseline')
 
 
 BASELINE_READERS = {}
@@ -100,7 +118,7 @@ def _read_from_col(col, files, col_splitter=r'\t', word_splitter=r'\s'):
     return text
 
 
-def _build_vocab_for_col(col, files, vectorizers, text=None, col_splitter=r'\t', word_splitter=r'\s'):
+def _build_vocab_for_col(col, files, vectorizers, text=None, col_splitter=r'\t', word_splitter=r'\s', num_workers=1):
     """Build vocab from a single column in file. (separated by `\t`).
 
     Used to read a vocab from a single conll column, read a vocab from the
@@ -112,17 +130,176 @@ def _build_vocab_for_col(col, files, vectorizers, text=None, col_splitter=r'\t',
     :param text: List[str]: The text from the columns or None
     :param col_splitter: `str`: The regex that splits a line into columns.
     :param word_splitter: `str`: The regex that will split a column into words.
+    :param num_workers: `int`: Count the files in this many processes.
 
     :returns: dict[str] -> dict[str] -> int: The vocabs.
     """
-    text = _read_from_col(col, files, col_splitter, word_splitter) if text is None else text
     vocab = {k: Counter() for k in vectorizers}
+    if text is None and num_workers > 1 and _can_fork():
+
+        def count(file_name, start, end):
+            _reset_lengths(vectorizers)
+            counts = {k: Counter() for k in vectorizers}
+            for line in _read_range(file_name, start, end):
+                line = line.rstrip('\n')
+                if line == "":
+                    continue
+                t = re.split(word_splitter, re.split(col_splitter, line)[col])
+                for k, vect in vectorizers.items():
+                    counts[k].update(vect.count(t))
+            return counts, _lengths_state(vectorizers)
+
+        for _, (counts, lengths) in _count_sharded(files, count, num_workers):
+            _merge_counts(vocab, counts)
+            _merge_lengths(vectorizers, lengths)
+        return vocab
+    text = _read_from_col(col, files, col_splitter, word_splitter) if text is None else text
     for t in text:
         for k, vect in vectorizers.items():
             vocab[k].update(vect.count(t))
     return vocab
 
 
+class _FileRange(object):
+    """A read only view of part of a file opened in binary mode, from where it is now up to `end`"""
+    def __init__(self, f, end):
+        self.f = f
+        self.end = end
+
+    def read(self, size=-1):
+        remaining = self.end - self.f.tell()
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self.f.read(max(size, 0))
+
+
+def _read_range(file_name, start, end):
+    """Read the lines of a file between two byte offsets, the same way `codecs.open` splits them
+
+    :param file_name: `str`: The file to read
+    :param start: `int`: The offset of the first byte to read, this should be the start of a line
+    :param end: `int`: The offset after the last byte to read, this should be the start of a line (or the file size)
+
+    :returns: A generator of lines
+    """
+    with open(file_name, 'rb') as f:
+        f.seek(start)
+        for line in codecs.getreader('utf-8')(_FileRange(f, end)):
+            yield line
+
+
+def _shard_file(file_name, num_shards, is_boundary=None):
+    """Split a file into byte ranges of about the same size that start at the beginning of a line
+
+    :param file_name: `str`: The file to split
+    :param num_shards: `int`: How many pieces to split it into (there can be fewer)
+    :param is_boundary: A function that takes a line (`bytes`), if given a shard only starts after a line where it
+        returns `True`, this is used when an example spans several lines
+
+    :returns: List[Tuple[int, int]]: The `(start, end)` offsets of each shard
+    """
+    size = os.path.getsize(file_name)
+    offsets = [0]
+    with open(file_name, 'rb') as f:
+        for i in range(1, num_shards):
+            pos = max(size * i // num_shards, offsets[-1])
+            if pos >= size:
+                break
+            # Move to the start of the next line
+            f.seek(max(pos - 1, 0))
+            if pos > 0:
+                f.readline()
+            if is_boundary is not None:
+                while True:
+                    line = f.readline()
+                    if not line or is_boundary(line):
+                        break
+            offsets.append(min(f.tell(), size))
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
+
+
+def _length_owner(vectorizer):
+    # Wrappers like the `GOVectorizer` keep their lengths on the vectorizer they wrap
+    while hasattr(vectorizer, 'vectorizer'):
+        vectorizer = vectorizer.vectorizer
+    return vectorizer
+
+
+def _lengths_state(vectorizers):
+    """Get the `max_seen*` lengths the vectorizers track while counting"""
+    state = {}
+    for k, vectorizer in vectorizers.items():
+        owner = _length_owner(vectorizer)
+        state[k] = {a: v for a, v in vars(owner).items() if a.startswith('max_seen')}
+    return state
+
+
+def _reset_lengths(vectorizers):
+    for vectorizer in vectorizers.values():
+        owner = _length_owner(vectorizer)
+        for a in list(vars(owner)):
+            if a.startswith('max_seen'):
+                setattr(owner, a, 0)
+
+
+def _merge_lengths(vectorizers, lengths):
+    """Update the vectorizers with the lengths seen in a shard, these are all maximums"""
+    for k, state in lengths.items():
+        owner = _length_owner(vectorizers[k])
+        for a, v in state.items():
+            setattr(owner, a, max(getattr(owner, a), v))
+
+
+def _merge_counts(vocabs, counts):
+    """Add shard counts to the vocabs, when this is done in file order the keys are in the same order as counting
+    serially, so the vocab indices are the same"""
+    for k, c in counts.items():
+        vocabs[k].update(c)
+
+
+def _can_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+# The function the vocab workers count with, this is set when the process starts
+_VOCAB_COUNT_FN = None
+
+
+def _init_vocab_worker(count_fn):
+    global _VOCAB_COUNT_FN
+    _VOCAB_COUNT_FN = count_fn
+
+
+def _count_vocab_shard(shard):
+    return _VOCAB_COUNT_FN(*shard)
+
+
+def _count_sharded(files, count_fn, num_workers, is_boundary=None):
+    """Split files into byte ranges and count each one in a pool of processes
+
+    The workers are forked so `count_fn` can use the reader and its vectorizers without pickling them.  Each
+    worker has its own copy of the vectorizers, so `count_fn` should reset and return their lengths.
+
+    :param files: List[str]: The files to count
+    :param count_fn: A function of `(file_name, start, end)` that counts a shard
+    :param num_workers: `int`: The number of processes
+    :param is_boundary: See `_shard_file`
+
+    :returns: A list of `(shard, result)` in file and then byte order
+    """
+    shards = []
+    for file_name in files:
+        if file_name is None:
+            continue
+        shards.extend((file_name, start, end) for start, end in _shard_file(file_name, num_workers, is_boundary))
+    ctx = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(num_workers, mp_context=ctx,
+                             initializer=_init_vocab_worker, initargs=(count_fn,)) as executor:
+        results = list(executor.map(_count_vocab_shard, shards))
+    return list(zip(shards, results))
+
+
 def _check_lens(vectorizers):
     failures = set()
     for k, vect in vectorizers.items():
@@ -140,10 +317,175 @@ def _vocab_allowed(vectorizers):
         raise RuntimeError(fail_str + vect_str)
 
 
+def _describe(obj):
+    """Give a stable, json serializable description of things that affect vectorization (used as a `json` default)."""
+    if isinstance(obj, Vectorizer):
+        return _vectorizer_state(obj, simple_only=False)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    code = getattr(obj, '__code__', None)
+    name = '{}.{}'.format(getattr(obj, '__module__', None), getattr(obj, '__qualname__', type(obj).__name__))
+    # Lambdas all share a name so include the byte code to tell them apart
+    if code is not None:
+        name = '{}:{}'.format(name, hashlib.sha1(code.co_code).hexdigest())
+    return name
+
+
+def _vectorizer_state(vectorizer, simple_only=True):
+    """Get the attributes of a vectorizer.
+
+    :param vectorizer: `Vectorizer` The vectorizer to inspect.
+    :param simple_only: `bool` Only return attributes with scalar values (and the state of nested vectorizers),
+        these are the ones that vectorizers update as they run (`mxlen`, `mxwlen`, ...)
+
+    :returns: `dict` The attributes.
+    """
+    state = {}
+    for k, v in vars(vectorizer).items():
+        if isinstance(v, Vectorizer):
+            state[k] = _vectorizer_state(v, simple_only)
+        elif v is None or isinstance(v, (bool, float) + six.integer_types + six.string_types):
+            state[k] = v
+        elif not simple_only:
+            state[k] = v
+    if not simple_only:
+        state['__type__'] = '{}.{}'.format(vectorizer.__class__.__module__, vectorizer.__class__.__name__)
+    return state
+
+
+def _restore_vectorizer_state(vectorizer, state):
+    for k, v in state.items():
+        current = getattr(vectorizer, k, None)
+        if isinstance(current, Vectorizer):
+            _restore_vectorizer_state(current, v)
+        else:
+            setattr(vectorizer, k, v)
+
+
+@exporter
+class VectorizedCache(object):
+    """An on-disk cache of vectorized examples.
+
+    Each entry is a directory under `cache_dir` named by a sha1 of the data file(s), the vectorizers, the vocabs and
+    any reader state that changes the output.  Each feature (`word`, `word_lengths`, `y`, ...) is stored as a single
+    flat `.npy` array so on later runs the data can be memory-mapped back in without any tokenization or vectorization.
+    """
+    META = 'meta.json'
+    TEXTS = 'texts.json'
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.expanduser(cache_dir)
+
+    def key(self, files, vectorizers, vocabs, **kwargs):
+        """Create the cache key.
+
+        :param files: `Union[str, List[str]]` The data file(s) the examples come from.
+        :param vectorizers: `dict[str] -> Vectorizer` The vectorizers used to create the examples.
+        :param vocabs: `dict[str] -> dict[str] -> int` The vocabs passed to the vectorizers.
+        :param kwargs: Any other (json serializable) state that effects the examples, for example the `label2index`.
+
+        :returns: `str` The key.
+        """
+        sha1 = hashlib.sha1()
+        for file_name in listify(files):
+            sha1.update(file_sha1(file_name, cache=False).encode('utf-8'))
+        for name in sorted(vectorizers):
+            sha1.update(name.encode('utf-8'))
+            sha1.update(json.dumps(vectorizers[name], sort_keys=True, default=_describe).encode('utf-8'))
+        for name in sorted(vocabs):
+            sha1.update(name.encode('utf-8'))
+            sha1.update(json.dumps(vocabs[name], sort_keys=True).encode('utf-8'))
+        sha1.update(json.dumps(kwargs, sort_keys=True, default=_describe).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def load(self, key, vectorizers):
+        """Load examples from the cache.
+
+        The vectorizers are updated to the state they were in after the examples were originally created so that
+        things like `mxlen` are the same as if the data was read from scratch.
+
+        :param key: `str` The cache key.
+        :param vectorizers: `dict[str] -> Vectorizer` The vectorizers to update.
+
+        :returns: `Tuple[dict[str] -> np.ndarray, Optional[list]]` The memory-mapped feature arrays and texts that
+            were saved with them, `None, None` when the key is not in the cache.
+        """
+        entry = os.path.join(self.cache_dir, key)
+        meta = read_json(os.path.join(entry, VectorizedCache.META))
+        if not meta:
+            return None, None
+        logger.info('Loading vectorized examples from %s', entry)
+        arrays = {k: np.load(os.path.join(entry, '{}.npy'.format(k)), mmap_mode='r') for k in meta['keys']}
+        for name, state in meta['vectorizers'].items():
+            if name in vectorizers:
+                _restore_vectorizer_state(vectorizers[name], state)
+        texts = read_json(os.path.join(entry, VectorizedCache.TEXTS), strict=True) if meta['texts'] else None
+        return arrays, texts
+
+    def save(self, key, arrays, vectorizers, texts=None):
+        """Write examples to the cache.
+
+        The entry is written to a temporary directory and then moved into place so that a partially written entry
+        is never read.
+
+        :param key: `str` The cache key.
+        :param arrays: `dict[str] -> np.ndarray` The stacked features to save (see `baseline.data.stack_examples`).
+        :param vectorizers: `dict[str] -> Vectorizer` The vectorizers used to create the examples.
+        :param texts: `list` Optional raw text to save with the examples.
+        """
+        entry = os.path.join(self.cache_dir, key)
+        if not arrays or os.path.exists(entry):
+            return
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        keys = list(arrays.keys())
+        tmp = tempfile.mkdtemp(prefix='.{}-'.format(key), dir=self.cache_dir)
+        try:
+            for k in keys:
+                np.save(os.path.join(tmp, '{}.npy'.format(k)), arrays[k])
+            if texts is not None:
+                write_json(texts, os.path.join(tmp, VectorizedCache.TEXTS))
+            meta = {
+                'keys': keys,
+                'num_examples': len(arrays[keys[0]]),
+                'texts': texts is not None,
+                'vectorizers': {k: _vectorizer_state(v) for k, v in vectorizers.items()},
+            }
+            write_json(meta, os.path.join(tmp, VectorizedCache.META))
+            os.rename(tmp, entry)
+            logger.info('Saved vectorized examples to %s', entry)
+        except OSError:
+            # Someone else wrote this entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _create_cache(cache_dir):
+    return VectorizedCache(cache_dir) if cache_dir is not None else None
+
+
+def _run_vectorizers(texts, vectorizers, vocabs):
+    """Vectorize all of the examples at once with `run_batch`
+
+    :param texts: A list of examples, each a list of tokens
+    :param vectorizers: A `dict` of vectorizers
+    :param vocabs: A `dict` of vocabs, one per vectorizer
+    :return: A `dict` of arrays, one row per example
+    """
+    arrays = {}
+    for k, vectorizer in vectorizers.items():
+        arrays[k], lengths = vectorizer.run_batch(texts, vocabs[k])
+        if lengths is not None:
+            arrays['{}_lengths'.format(k)] = lengths
+    return arrays
+
+
 @exporter
 class ParallelCorpusReader(object):
 
-    def __init__(self, vectorizers, trim=False, truncate=False):
+    def __init__(self, vectorizers, trim=False, truncate=False, cache_dir=None, num_buckets=None, max_tokens=None,
+                 vocab_workers=1, streaming=False, shuffle_buffer=10000):
         super(ParallelCorpusReader, self).__init__()
 
         self.src_vectorizers = {}
@@ -155,6 +497,12 @@ class ParallelCorpusReader(object):
                 self.src_vectorizers[k] = vectorizer
         self.trim = trim
         self.truncate = truncate
+        self.cache = _create_cache(cache_dir)
+        self.num_buckets = num_buckets
+        self.max_tokens = max_tokens
+        self.vocab_workers = int(vocab_workers or 1)
+        self.streaming = bool(streaming)
+        self.shuffle_buffer = shuffle_buffer
 
     def build_vocabs(self, files, **kwargs):
         pass
@@ -162,10 +510,33 @@ class ParallelCorpusReader(object):
     def load_examples(self, tsfile, vocab1, vocab2, shuffle, sort_key):
         pass
 
+    def iter_pairs(self, tsfile):
+        """Get the source and target tokens of the examples one at a time
+
+        :param tsfile: The file (or file prefix) to read
+        :return: An iterator over `(src_tokens, tgt_tokens)` tuples
+        """
+        pass
+
+    def _vectorize(self, pairs, src_vocabs, tgt_vocab, src_sort_key):
+        """Vectorize a list of `(src_tokens, tgt_tokens)` pairs into a (trimmed) batch"""
+        srcs, tgts = zip(*pairs) if pairs else ((), ())
+        arrays = _run_vectorizers(list(srcs), self.src_vectorizers, src_vocabs)
+        arrays['tgt'], arrays['tgt_lengths'] = self.tgt_vectorizer.run_batch(list(tgts), tgt_vocab)
+        examples = baseline.data.ArraySeq2SeqExamples(arrays, do_shuffle=False, src_sort_key=src_sort_key)
+        return examples.batch(0, len(pairs), trim=self.trim)
+
     def load(self, tsfile, vocab1, vocab2, batchsz, shuffle=False, sort_key=None):
+        if self.streaming and shuffle:
+            return baseline.data.StreamingDataFeed(lambda: self.iter_pairs(tsfile),
+                                                   lambda pairs: self._vectorize(pairs, vocab1, vocab2, sort_key),
+                                                   batchsz, shuffle=shuffle, shuffle_buffer=self.shuffle_buffer,
+                                                   truncate=self.truncate)
         examples = self.load_examples(tsfile, vocab1, vocab2, shuffle, sort_key)
-        return baseline.data.ExampleDataFeed(examples, batchsz,
-                                             shuffle=shuffle, trim=self.trim, sort_key=sort_key, truncate=self.truncate)
+        return baseline.data.create_example_feed(examples, batchsz,
+                                                 shuffle=shuffle, trim=self.trim, sort_key=sort_key,
+                                                 truncate=self.truncate, num_buckets=self.num_buckets,
+                                                 max_tokens=self.max_tokens)
 
 
 @register_reader(task='seq2seq', name='tsv')
@@ -173,7 +544,11 @@ class TSVParallelCorpusReader(ParallelCorpusReader):
 
     def __init__(self, vectorizers,
                  trim=False, truncate=False, src_col_num=0, tgt_col_num=1, **kwargs):
-        super(TSVParallelCorpusReader, self).__init__(vectorizers, trim, truncate)
+        super(TSVParallelCorpusReader, self).__init__(vectorizers, trim, truncate,
+                                                      kwargs.get('cache_dir'), kwargs.get('num_buckets'),
+                                                      kwargs.get('max_tokens'), kwargs.get('vocab_workers'),
+                                                      kwargs.get('streaming', False),
+                                                      kwargs.get('shuffle_buffer', 10000))
         self.src_col_num = src_col_num
         self.tgt_col_num = tgt_col_num
 
@@ -188,8 +563,10 @@ class TSVParallelCorpusReader(ParallelCorpusReader):
             src_vocab = _build_vocab_for_col(None, None, self.src_vectorizers, text=text)
             tgt_vocab = _build_vocab_for_col(None, None, {'tgt': self.tgt_vectorizer}, text=text)
             return src_vocab, tgt_vocab['tgt']
-        src_vocab = _build_vocab_for_col(self.src_col_num, files, self.src_vectorizers)
-        tgt_vocab = _build_vocab_for_col(self.tgt_col_num, files, {'tgt': self.tgt_vectorizer})
+        src_vocab = _build_vocab_for_col(self.src_col_num, files, self.src_vectorizers,
+                                         num_workers=self.vocab_workers)
+        tgt_vocab = _build_vocab_for_col(self.tgt_col_num, files, {'tgt': self.tgt_vectorizer},
+                                         num_workers=self.vocab_workers)
         min_f = kwargs.get('min_f', {})
         tgt_min_f = {'tgt': min_f.pop('tgt', -1)}
         src_vocab = _filter_vocab(src_vocab, min_f)
@@ -197,22 +574,35 @@ class TSVParallelCorpusReader(ParallelCorpusReader):
         return src_vocab, tgt_vocab['tgt']
 
     def load_examples(self, tsfile, src_vocabs, tgt_vocab, do_shuffle, src_sort_key):
-        ts = []
-        with codecs.open(tsfile, encoding='utf-8', mode='r') as f:
-            for line in f:
-                splits = re.split("\t", line.strip())
-                src = list(filter(lambda x: len(x) != 0, re.split("\s+", splits[0])))
-
+        arrays = None
+        if self.cache is not None:
+            all_vects = dict(self.src_vectorizers, tgt=self.tgt_vectorizer)
+            key = self.cache.key(tsfile, all_vects, dict(src_vocabs, tgt=tgt_vocab),
+                                 reader=self.__class__.__name__)
+            arrays, _ = self.cache.load(key, all_vects)
+        if arrays is None:
+            ts = []
+            for src, tgt in self.iter_pairs(tsfile):
                 example = {}
                 for k, vectorizer in self.src_vectorizers.items():
                     example[k], length = vectorizer.run(src, src_vocabs[k])
                     if length is not None:
                         example['{}_lengths'.format(k)] = length
 
-                tgt = list(filter(lambda x: len(x) != 0, re.split("\s+", splits[1])))
                 example['tgt'], example['tgt_lengths'] = self.tgt_vectorizer.run(tgt, tgt_vocab)
                 ts.append(example)
-        return baseline.data.Seq2SeqExamples(ts, do_shuffle=do_shuffle, src_sort_key=src_sort_key)
+            arrays = baseline.data.stack_examples(ts)
+            if self.cache is not None:
+                self.cache.save(key, arrays, all_vects)
+        return baseline.data.ArraySeq2SeqExamples(arrays, do_shuffle=do_shuffle, src_sort_key=src_sort_key)
+
+    def iter_pairs(self, tsfile):
+        with codecs.open(tsfile, encoding='utf-8', mode='r') as f:
+            for line in f:
+                splits = re.split("\t", line.strip())
+                src = list(filter(lambda x: len(x) != 0, re.split("\s+", splits[0])))
+                tgt = list(filter(lambda x: len(x) != 0, re.split("\s+", splits[1])))
+                yield src, tgt
 
 
 @exporter
@@ -220,7 +610,12 @@ class TSVParallelCorpusReader(ParallelCorpusReader):
 class MultiFileParallelCorpusReader(ParallelCorpusReader):
 
     def __init__(self, vectorizers, trim=False, truncate=False, **kwargs):
-        super(MultiFileParallelCorpusReader, self).__init__(vectorizers, trim, truncate)
+        super(MultiFileParallelCorpusReader, self).__init__(vectorizers, trim, truncate,
+                                                            num_buckets=kwargs.get('num_buckets'),
+                                                            max_tokens=kwargs.get('max_tokens'),
+                                                            vocab_workers=kwargs.get('vocab_workers'),
+                                                            streaming=kwargs.get('streaming', False),
+                                                            shuffle_buffer=kwargs.get('shuffle_buffer', 10000))
         pair_suffix = kwargs['pair_suffix']
 
         self.src_suffix = pair_suffix[0]
@@ -241,8 +636,10 @@ class MultiFileParallelCorpusReader(ParallelCorpusReader):
             src_vocab = _build_vocab_for_col(None, None, self.src_vectorizers, text=text)
             tgt_vocab = _build_vocab_for_col(None, None, {'tgt': self.tgt_vectorizer}, text=text)
             return src_vocab, tgt_vocab['tgt']
-        src_vocab = _build_vocab_for_col(0, [f + self.src_suffix for f in files], self.src_vectorizers)
-        tgt_vocab = _build_vocab_for_col(0, [f + self.tgt_suffix for f in files], {'tgt': self.tgt_vectorizer})
+        src_vocab = _build_vocab_for_col(0, [f + self.src_suffix for f in files], self.src_vectorizers,
+                                         num_workers=self.vocab_workers)
+        tgt_vocab = _build_vocab_for_col(0, [f + self.tgt_suffix for f in files], {'tgt': self.tgt_vectorizer},
+                                         num_workers=self.vocab_workers)
         min_f = kwargs.get('min_f', {})
         tgt_min_f = {'tgt': min_f.pop('tgt', -1)}
         src_vocab = _filter_vocab(src_vocab, min_f)
@@ -251,20 +648,21 @@ class MultiFileParallelCorpusReader(ParallelCorpusReader):
 
     def load_examples(self, tsfile, src_vocabs, tgt_vocab, do_shuffle, src_sort_key):
         ts = []
+        for src, tgt in self.iter_pairs(tsfile):
+            example = {}
+            for k, vectorizer in self.src_vectorizers.items():
+                example[k], length = vectorizer.run(src, src_vocabs[k])
+                if length is not None:
+                    example['{}_lengths'.format(k)] = length
+            example['tgt'], example['tgt_lengths'] = self.tgt_vectorizer.run(tgt, tgt_vocab)
+            ts.append(example)
+        return baseline.data.ArraySeq2SeqExamples.from_list(ts, do_shuffle=do_shuffle, src_sort_key=src_sort_key)
 
+    def iter_pairs(self, tsfile):
         with codecs.open(tsfile + self.src_suffix, encoding='utf-8', mode='r') as fsrc:
             with codecs.open(tsfile + self.tgt_suffix, encoding='utf-8', mode='r') as ftgt:
                 for src, tgt in zip(fsrc, ftgt):
-                    example = {}
-                    src = re.split("\s+", src.strip())
-                    for k, vectorizer in self.src_vectorizers.items():
-                        example[k], length = vectorizer.run(src, src_vocabs[k])
-                        if length is not None:
-                            example['{}_lengths'.format(k)] = length
-                    tgt = re.split("\s+", tgt.strip())
-                    example['tgt'], example['tgt_lengths'] = self.tgt_vectorizer.run(tgt, tgt_vocab)
-                    ts.append(example)
-        return baseline.data.Seq2SeqExamples(ts, do_shuffle=do_shuffle, src_sort_key=src_sort_key)
+                    yield re.split("\s+", src.strip()), re.split("\s+", tgt.strip())
 
 
 @exporter
@@ -281,6 +679,12 @@ class SeqPredictReader(object):
             Offsets.VALUES[Offsets.EOS]: Offsets.EOS
         }
         self.label_vectorizer = Dict1DVectorizer(fields='y', mxlen=mxlen)
+        self.cache = _create_cache(kwargs.get('cache_dir'))
+        self.num_buckets = kwargs.get('num_buckets')
+        self.max_tokens = kwargs.get('max_tokens')
+        self.streaming = bool(kwargs.get('streaming', False))
+        self.shuffle_buffer = kwargs.get('shuffle_buffer', 10000)
+        self.vocab_workers = int(kwargs.get('vocab_workers') or 1)
 
     def build_vocab(self, files, **kwargs):
         pre_vocabs = None
@@ -299,16 +703,19 @@ class SeqPredictReader(object):
         labels = Counter()
 
         #if not pre_vocabs:
-        for file in files:
-            if file is None:
-                continue
+        if self.vocab_workers > 1 and hasattr(self, '_read_range_examples') and _can_fork():
+            self._count_parallel(files, vocabs, labels)
+        else:
+            for file in files:
+                if file is None:
+                    continue
 
-            examples = self.read_examples(file)
-            for example in examples:
-                labels.update(self.label_vectorizer.count(example))
-                for k, vectorizer in self.vectorizers.items():
-                    vocab_example = vectorizer.count(example)
-                    vocabs[k].update(vocab_example)
+                examples = self.read_examples(file)
+                for example in examples:
+                    labels.update(self.label_vectorizer.count(example))
+                    for k, vectorizer in self.vectorizers.items():
+                        vocab_example = vectorizer.count(example)
+                        vocabs[k].update(vocab_example)
 
         if pre_labels and not pre_vocabs:
             return vocabs
@@ -321,29 +728,80 @@ class SeqPredictReader(object):
             vocabs = pre_vocabs
         return vocabs
 
+    def _count_parallel(self, files, vocabs, labels):
+        """Count the files in `vocab_workers` processes, this gives the same results as counting them serially
+
+        This needs the reader to be able to read the examples in part of a file with `_read_range_examples` and to
+        tell where one example ends with `_is_example_end`
+        """
+        label_vectorizers = {'y': self.label_vectorizer}
+
+        def count(file_name, start, end):
+            _reset_lengths(self.vectorizers)
+            _reset_lengths(label_vectorizers)
+            counts = {k: Counter() for k in self.vectorizers}
+            label_counts = Counter()
+            for example in self._read_range_examples(file_name, start, end):
+                label_counts.update(self.label_vectorizer.count(example))
+                for k, vectorizer in self.vectorizers.items():
+                    counts[k].update(vectorizer.count(example))
+            return counts, label_counts, _lengths_state(self.vectorizers), _lengths_state(label_vectorizers)
+
+        shards = _count_sharded(files, count, self.vocab_workers, self._is_example_end)
+        for _, (counts, label_counts, lengths, label_lengths) in shards:
+            _merge_counts(vocabs, counts)
+            labels.update(label_counts)
+            _merge_lengths(self.vectorizers, lengths)
+            _merge_lengths(label_vectorizers, label_lengths)
+
     def read_examples(self):
         pass
 
-    def load(self, filename, vocabs, batchsz, shuffle=False, sort_key=None):
+    def iter_examples(self, filename):
+        """Get the examples in a file one at a time
 
-        ts = []
-        texts = self.read_examples(filename)
+        :param filename: The file to read
+        :return: An iterator over the examples, by default this reads them all with `read_examples`
+        """
+        return iter(self.read_examples(filename))
+
+    def _cache_state(self):
+        return {'reader': self.__class__.__name__, 'label2index': self.label2index}
+
+    def _vectorize(self, examples, vocabs):
+        """Vectorize a list of `(id, example_tokens)` pairs into a dictionary of arrays"""
+        ids, texts = zip(*examples) if examples else ((), ())
+        arrays = _run_vectorizers(list(texts), self.vectorizers, vocabs)
+        arrays['y'], arrays['y_lengths'] = self.label_vectorizer.run_batch(list(texts), self.label2index)
+        arrays['ids'] = np.array(ids, dtype=int)
+        return arrays
+
+    def load(self, filename, vocabs, batchsz, shuffle=False, sort_key=None):
 
         if sort_key is not None and not sort_key.endswith('_lengths'):
             sort_key += '_lengths'
 
-        for i, example_tokens in enumerate(texts):
-            example = {}
-            for k, vectorizer in self.vectorizers.items():
-                example[k], lengths = vectorizer.run(example_tokens, vocabs[k])
-                if lengths is not None:
-                    example['{}_lengths'.format(k)] = lengths
-            example['y'], lengths = self.label_vectorizer.run(example_tokens, self.label2index)
-            example['y_lengths'] = lengths
-            example['ids'] = i
-            ts.append(example)
-        examples = baseline.data.DictExamples(ts, do_shuffle=shuffle, sort_key=sort_key)
-        return baseline.data.ExampleDataFeed(examples, batchsz=batchsz, shuffle=shuffle, trim=self.trim, truncate=self.truncate), texts
+        if self.streaming and shuffle:
+            return baseline.data.StreamingDataFeed(lambda: enumerate(self.iter_examples(filename)),
+                                                   lambda examples: self._vectorize(examples, vocabs),
+                                                   batchsz, shuffle=shuffle, shuffle_buffer=self.shuffle_buffer,
+                                                   trim=self.trim, sort_key=sort_key, truncate=self.truncate), None
+
+        arrays = None
+        all_vects = dict(self.vectorizers, y=self.label_vectorizer)
+        if self.cache is not None:
+            key = self.cache.key(filename, all_vects, vocabs, **self._cache_state())
+            arrays, texts = self.cache.load(key, all_vects)
+
+        if arrays is None:
+            texts = self.read_examples(filename)
+            arrays = self._vectorize(list(enumerate(texts)), vocabs)
+            if self.cache is not None:
+                self.cache.save(key, arrays, all_vects, texts)
+        examples = baseline.data.ArrayExamples(arrays, do_shuffle=shuffle, sort_key=sort_key)
+        return baseline.data.create_example_feed(examples, batchsz=batchsz, shuffle=shuffle, trim=self.trim,
+                                                 truncate=self.truncate, num_buckets=self.num_buckets,
+                                                 max_tokens=self.max_tokens), texts
 
 
 @exporter
@@ -354,34 +812,49 @@ class CONLLSeqReader(SeqPredictReader):
         super(CONLLSeqReader, self).__init__(vectorizers, trim, truncate, mxlen, **kwargs)
         self.named_fields = kwargs.get('named_fields', {})
 
+    def _cache_state(self):
+        state = super(CONLLSeqReader, self)._cache_state()
+        state['named_fields'] = self.named_fields
+        return state
+
     def read_examples(self, tsfile):
+        return list(self.iter_examples(tsfile))
+
+    def iter_examples(self, tsfile):
+        with codecs.open(tsfile, encoding='utf-8', mode='r') as f:
+            for example in self._parse_examples(f, tsfile):
+                yield example
+
+    def _read_range_examples(self, tsfile, start, end):
+        return self._parse_examples(_read_range(tsfile, start, end), tsfile)
+
+    @staticmethod
+    def _is_example_end(line):
+        return len(re.split("\s", line.decode('utf-8', 'replace').strip())) <= 1
 
+    def _parse_examples(self, lines, tsfile):
         tokens = []
-        examples = []
+        for i, line in enumerate(lines):
+            states = re.split("\s", line.strip())
+
+            token = dict()
+            if len(states) > 1:
+                for j in range(len(states)):
+                    noff = j - len(states)
+                    if noff >= 0:
+                        noff = j
+                    field_name = self.named_fields.get(str(j),
+                                                       self.named_fields.get(str(noff), str(j)))
+                    token[field_name] = states[j]
+                tokens.append(token)
 
-        with codecs.open(tsfile, encoding='utf-8', mode='r') as f:
-            for i, line in enumerate(f):
-                states = re.split("\s", line.strip())
-
-                token = dict()
-                if len(states) > 1:
-                    for j in range(len(states)):
-                        noff = j - len(states)
-                        if noff >= 0:
-                            noff = j
-                        field_name = self.named_fields.get(str(j),
-                                                           self.named_fields.get(str(noff), str(j)))
-                        token[field_name] = states[j]
-                    tokens.append(token)
-
-                else:
-                    if len(tokens) == 0:
-                        raise Exception("Unexpected empty line ({}) in {}".format(i, tsfile))
-                    examples.append(tokens)
-                    tokens = []
-            if len(tokens) > 0:
-                examples.append(tokens)
-        return examples
+            else:
+                if len(tokens) == 0:
+                    raise Exception("Unexpected empty line ({}) in {}".format(i, tsfile))
+                yield tokens
+                tokens = []
+        if len(tokens) > 0:
+            yield tokens
 
 
 def _norm_ext(ext):
@@ -444,8 +917,10 @@ class ParallelSeqReader(SeqPredictReader):
             example['ids'] = i
             ts.append(example)
             raw_texts.append([{'text': t, 'y': l} for t, l in zip(example_tokens, tag_tokens)])
-        examples = baseline.data.DictExamples(ts, do_shuffle=shuffle, sort_key=sort_key)
-        return baseline.data.ExampleDataFeed(examples, batchsz=batchsz, shuffle=shuffle, trim=self.trim, truncate=self.truncate), raw_texts
+        examples = baseline.data.ArrayExamples.from_list(ts, do_shuffle=shuffle, sort_key=sort_key)
+        return baseline.data.create_example_feed(examples, batchsz=batchsz, shuffle=shuffle, trim=self.trim,
+                                                 truncate=self.truncate, num_buckets=self.num_buckets,
+                                                 max_tokens=self.max_tokens), raw_texts
 
 
 @exporter
@@ -495,6 +970,12 @@ class TSVSeqLabelReader(SeqLabelReader):
             self.clean_fn = lambda x: x
         self.trim = trim
         self.truncate = truncate
+        self.cache = _create_cache(kwargs.get('cache_dir'))
+        self.num_buckets = kwargs.get('num_buckets')
+        self.max_tokens = kwargs.get('max_tokens')
+        self.streaming = bool(kwargs.get('streaming', False))
+        self.shuffle_buffer = kwargs.get('shuffle_buffer', 10000)
+        self.vocab_workers = int(kwargs.get('vocab_workers') or 1)
 
     SPLIT_ON = '[\t\s]+'
 
@@ -547,6 +1028,16 @@ class TSVSeqLabelReader(SeqLabelReader):
                 files = [files]
         vocab = {k: Counter() for k in self.vectorizers.keys()}
 
+        if self.vocab_workers > 1 and _can_fork():
+            for _, (counts, labels, lengths) in _count_sharded(files, self._count_range, self.vocab_workers):
+                _merge_counts(vocab, counts)
+                _merge_lengths(self.vectorizers, lengths)
+                for label in labels:
+                    if label not in self.label2index:
+                        self.label2index[label] = label_idx
+                        label_idx += 1
+            files = []
+
         for file_name in files:
             if file_name is None:
                 continue
@@ -568,12 +1059,48 @@ class TSVSeqLabelReader(SeqLabelReader):
 
         return vocab, self.get_labels()
 
+    def _count_range(self, file_name, start, end):
+        """Count part of a file in a vocab worker, see `_count_sharded`
+
+        :return: The counts, the labels in the order they were first seen and the vectorizer lengths
+        """
+        _reset_lengths(self.vectorizers)
+        counts = {k: Counter() for k in self.vectorizers}
+        labels = []
+        seen = set()
+        for line in _read_range(file_name, start, end):
+            label, text = TSVSeqLabelReader.label_and_sentence(line, self.clean_fn)
+            if len(text) == 0:
+                continue
+            for k, vectorizer in self.vectorizers.items():
+                counts[k].update(vectorizer.count(text))
+            if label not in seen:
+                seen.add(label)
+                labels.append(label)
+        return counts, labels, _lengths_state(self.vectorizers)
+
     def get_labels(self):
         labels = [''] * len(self.label2index)
         for label, index in self.label2index.items():
             labels[index] = label
         return labels
 
+    def _iter_examples(self, filename):
+        """Read the `(label index, tokens)` of each (non-empty) example in a file, one at a time"""
+        with codecs.open(filename, encoding='utf-8', mode='r') as f:
+            for line in f:
+                label, text = TSVSeqLabelReader.label_and_sentence(line, self.clean_fn)
+                if len(text) == 0:
+                    continue
+                yield self.label2index[label], text
+
+    def _vectorize(self, examples, vocabs):
+        """Vectorize a list of `(label index, tokens)` pairs into a dictionary of arrays"""
+        ys, texts = zip(*examples) if examples else ((), ())
+        arrays = _run_vectorizers(list(texts), self.vectorizers, vocabs)
+        arrays['y'] = np.array(ys, dtype=int)
+        return arrays
+
     def load_text(self, filename, vocabs, batchsz, **kwargs):
 
         shuffle = kwargs.get('shuffle', False)
@@ -598,10 +1125,12 @@ class TSVSeqLabelReader(SeqLabelReader):
 
                 example_dict['y'] = y
                 examples.append(example_dict)
-        return baseline.data.ExampleDataFeed(baseline.data.DictExamples(examples,
-                                                                        do_shuffle=shuffle,
-                                                                        sort_key=sort_key),
-                                             batchsz=batchsz, shuffle=shuffle, trim=self.trim, truncate=self.truncate), texts
+        return baseline.data.create_example_feed(baseline.data.ArrayExamples.from_list(examples,
+                                                                                       do_shuffle=shuffle,
+                                                                                       sort_key=sort_key),
+                                                 batchsz=batchsz, shuffle=shuffle, trim=self.trim,
+                                                 truncate=self.truncate, num_buckets=self.num_buckets,
+                                                 max_tokens=self.max_tokens), texts
 
     def load(self, filename, vocabs, batchsz, **kwargs):
     
@@ -610,26 +1139,28 @@ class TSVSeqLabelReader(SeqLabelReader):
         if sort_key is not None and not sort_key.endswith('_lengths'):
             sort_key += '_lengths'
     
-        examples = []
-    
-        with codecs.open(filename, encoding='utf-8', mode='r') as f:
-            for il, line in enumerate(f):
-                label, text = TSVSeqLabelReader.label_and_sentence(line, self.clean_fn)
-                if len(text) == 0:
-                    continue
-                y = self.label2index[label]
-                example_dict = dict()
-                for k, vectorizer in self.vectorizers.items():
-                    example_dict[k], lengths = vectorizer.run(text, vocabs[k])
-                    if lengths is not None:
-                        example_dict['{}_lengths'.format(k)] = lengths
-            
-                example_dict['y'] = y
-                examples.append(example_dict)
-        return baseline.data.ExampleDataFeed(baseline.data.DictExamples(examples,
-                                                                        do_shuffle=shuffle,
-                                                                        sort_key=sort_key),
-                                             batchsz=batchsz, shuffle=shuffle, trim=self.trim, truncate=self.truncate)
+        if self.streaming and shuffle:
+            return baseline.data.StreamingDataFeed(lambda: self._iter_examples(filename),
+                                                   lambda examples: self._vectorize(examples, vocabs),
+                                                   batchsz, shuffle=shuffle, shuffle_buffer=self.shuffle_buffer,
+                                                   trim=self.trim, sort_key=sort_key, truncate=self.truncate)
+
+        arrays = None
+        if self.cache is not None:
+            key = self.cache.key(filename, self.vectorizers, vocabs,
+                                 reader=self.__class__.__name__, label2index=self.label2index, clean_fn=self.clean_fn)
+            arrays, _ = self.cache.load(key, self.vectorizers)
+
+        if arrays is None:
+            arrays = self._vectorize(list(self._iter_examples(filename)), vocabs)
+            if self.cache is not None:
+                self.cache.save(key, arrays, self.vectorizers)
+        return baseline.data.create_example_feed(baseline.data.ArrayExamples(arrays,
+                                                                             do_shuffle=shuffle,
+                                                                             sort_key=sort_key),
+                                                 batchsz=batchsz, shuffle=shuffle, trim=self.trim,
+                                                 truncate=self.truncate, num_buckets=self.num_buckets,
+                                                 max_tokens=self.max_tokens)
 
 
 @exporter
@@ -639,6 +1170,7 @@ class LineSeqReader(object):
     def __init__(self, vectorizers, trim, **kwargs):
         self.nctx = kwargs['nctx']
         self.vectorizers = vectorizers
+        self.vocab_workers = int(kwargs.get('vocab_workers') or 1)
 
     def build_vocab(self, files, **kwargs):
         vocab_file = kwargs.get('vocab_file')
@@ -648,6 +1180,10 @@ class LineSeqReader(object):
 
         vocabs = {k: Counter() for k in self.vectorizers.keys()}
 
+        if self.vocab_workers > 1 and _can_fork():
+            self._count_parallel(files, vocabs)
+            files = []
+
         for file in files:
             if file is None:
                 continue
@@ -662,6 +1198,33 @@ class LineSeqReader(object):
         vocabs = _filter_vocab(vocabs, kwargs.get('min_f', {}))
         return vocabs
 
+    def _count_parallel(self, files, vocabs):
+        """Count the files in `vocab_workers` processes, this gives the same results as counting them serially
+
+        Each file is counted as a single example, so the lengths of its shards add up to the length of the file,
+        except for the longest word (`max_seen_char`) which is a maximum
+        """
+        def count(file_name, start, end):
+            _reset_lengths(self.vectorizers)
+            sentences = []
+            for line in _read_range(file_name, start, end):
+                sentences += line.split() + ['<EOS>']
+            counts = {k: vectorizer.count(sentences) for k, vectorizer in self.vectorizers.items()}
+            return counts, _lengths_state(self.vectorizers)
+
+        file_lengths = []
+        for (_, start, _), (counts, lengths) in _count_sharded(files, count, self.vocab_workers):
+            _merge_counts(vocabs, counts)
+            # The first shard of each file starts at 0
+            if start == 0:
+                file_lengths.append({k: {} for k in lengths})
+            totals = file_lengths[-1]
+            for k, state in lengths.items():
+                for a, v in state.items():
+                    totals[k][a] = max(totals[k].get(a, 0), v) if a == 'max_seen_char' else totals[k].get(a, 0) + v
+        for totals in file_lengths:
+            _merge_lengths(self.vectorizers, totals)
+
     def load(self, filename, vocabs, batchsz, tgt_key='x'):
 
         x = dict()
@@ -1,7 +1,12 @@
-from six.moves.http_client import HTTPConnection
+import six
+from six.moves.http_client import HTTPConnection, HTTPException
 from six.moves.urllib.parse import urlparse
 
 import json
+import time
+import socket
+import threading
+from collections import deque
 import numpy as np
 from baseline.utils import (
     import_user_module, export, optional_params, register, listify
@@ -39,6 +44,184 @@ def verify_example(examples, keys):
         raise ValueError("Data should have keys: {}\n {} are missing.".format(keys, missing_keys))
 
 
+# The `DataType` enum from tensorflow/core/framework/types.proto (`baseline.protos.types_pb2`), these are here so
+# this module can be imported without `protobuf`
+DT_FLOAT = 1
+DT_DOUBLE = 2
+DT_INT32 = 3
+DT_UINT8 = 4
+DT_INT16 = 5
+DT_INT8 = 6
+DT_STRING = 7
+DT_INT64 = 9
+DT_BOOL = 10
+
+TF_TO_NP_DTYPE = {
+    DT_FLOAT: np.float32,
+    DT_DOUBLE: np.float64,
+    DT_INT32: np.int32,
+    DT_UINT8: np.uint8,
+    DT_INT16: np.int16,
+    DT_INT8: np.int8,
+    DT_INT64: np.int64,
+    DT_BOOL: np.bool_,
+}
+NP_TO_TF_DTYPE = {v: k for k, v in TF_TO_NP_DTYPE.items()}
+
+# The repeated field that holds the values of each type when `tensor_content` isn't used
+_TF_VALUE_FIELD = {
+    DT_FLOAT: 'float_val',
+    DT_DOUBLE: 'double_val',
+    DT_INT32: 'int_val',
+    DT_UINT8: 'int_val',
+    DT_INT16: 'int_val',
+    DT_INT8: 'int_val',
+    DT_INT64: 'int64_val',
+    DT_BOOL: 'bool_val',
+    DT_STRING: 'string_val',
+}
+
+
+@exporter
+def fill_tensor_proto(tensor, value, shape=None, dtype=None):
+    """Fill in a `TensorProto` from numpy data, this replaces `tf.make_tensor_proto`
+
+    Numeric data is written as raw little endian bytes into `tensor_content`, strings go into `string_val`
+
+    :param tensor: The `TensorProto` to fill in, for example `request.inputs[key]`
+    :param value: The data, anything `np.asarray` accepts
+    :param shape: The shape of the tensor (defaults to the shape of `value`)
+    :param dtype: The `DataType` of the tensor (defaults to the closest match to the type of `value`)
+    :return: The `TensorProto`
+    """
+    value = np.asarray(value)
+    if dtype is None:
+        dtype = DT_STRING if value.dtype.kind in 'OSU' else NP_TO_TF_DTYPE[value.dtype.type]
+    shape = value.shape if shape is None else shape
+    tensor.dtype = dtype
+    for size in shape:
+        tensor.tensor_shape.dim.add().size = int(size)
+    if dtype == DT_STRING:
+        tensor.string_val.extend(x if isinstance(x, bytes) else six.text_type(x).encode('utf-8') for x in value.ravel())
+    else:
+        np_dtype = np.dtype(TF_TO_NP_DTYPE[dtype]).newbyteorder('<')
+        tensor.tensor_content = np.ascontiguousarray(value, dtype=np_dtype).tobytes()
+    return tensor
+
+
+@exporter
+def tensor_proto_to_ndarray(tensor):
+    """Decode a `TensorProto` into a numpy array, this replaces `tf.make_ndarray`
+
+    When the server sends `tensor_content` the array is a read-only view on those bytes (no copy).
+
+    :param tensor: The `TensorProto`
+    :return: An `np.ndarray`, strings come back as an object array of `bytes`
+    """
+    shape = [dim.size for dim in tensor.tensor_shape.dim]
+    size = int(np.prod(shape))
+    if tensor.dtype == DT_STRING:
+        return np.array(list(tensor.string_val), dtype=object).reshape(shape)
+    np_dtype = np.dtype(TF_TO_NP_DTYPE[tensor.dtype]).newbyteorder('<')
+    if tensor.tensor_content:
+        return np.frombuffer(tensor.tensor_content, dtype=np_dtype).reshape(shape)
+    values = np.array(getattr(tensor, _TF_VALUE_FIELD[tensor.dtype]), dtype=np_dtype)
+    # A tensor where every value is the same can be sent as a single value
+    if len(values) != size:
+        values = np.full(size, values[-1] if len(values) else 0, dtype=np_dtype)
+    return values.reshape(shape)
+
+
+def _to_json(x):
+    """Let `json.dumps` handle numpy arrays and scalars"""
+    if isinstance(x, (np.ndarray, np.generic)):
+        return x.tolist()
+    raise TypeError('{} is not JSON serializable'.format(type(x)))
+
+
+@exporter
+class HTTPConnectionPool(object):
+    """A pool of keep-alive `HTTPConnection`s to a single host
+
+    At most `size` requests are in flight at once, each on its own connection.  Connections are returned to the
+    pool after the response is read so later requests skip the TCP handshake.  If a reused connection turns out to
+    have been closed by the server the request is retried once on a new connection.
+    """
+    def __init__(self, hostname, port, size=4, timeout=None):
+        """Create a pool, connections are opened lazily
+
+        :param hostname: The host to connect to
+        :param port: The port to connect to
+        :param size: The max number of connections
+        :param timeout: The socket timeout in seconds (defaults to the global default)
+        """
+        self.hostname = hostname
+        self.port = int(port)
+        self.size = size
+        self.timeout = timeout
+        self.num_connections = 0
+        self._idle = six.moves.queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            self.num_connections += 1
+        if self.timeout is None:
+            return HTTPConnection(self.hostname, self.port)
+        return HTTPConnection(self.hostname, self.port, timeout=self.timeout)
+
+    @staticmethod
+    def _send(conn, method, path, body, headers):
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request on a pooled connection
+
+        :param method: The HTTP method
+        :param path: The path on the host
+        :param body: The request body
+        :param headers: The request headers
+        :return: A tuple of the response status and the response body
+        """
+        headers = {} if headers is None else headers
+        with self._slots:
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except six.moves.queue.Empty:
+                conn, reused = self._connect(), False
+            try:
+                response, data = self._send(conn, method, path, body, headers)
+            except (HTTPException, socket.error):
+                conn.close()
+                if not reused:
+                    raise
+                conn = self._connect()
+                try:
+                    response, data = self._send(conn, method, path, body, headers)
+                except Exception:
+                    conn.close()
+                    raise
+            except Exception:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+            return response.status, data
+
+    def close(self):
+        """Close the idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except six.moves.queue.Empty:
+                break
+
+
 class RemoteModel(object):
     def __init__(
             self,
@@ -50,6 +233,9 @@ class RemoteModel(object):
             inputs=None,
             version=None,
             return_labels=None,
+            pool_size=4,
+            timeout=None,
+            stats_window=1000,
     ):
         """A remote model where the actual inference is done on a server.
 
@@ -65,6 +251,9 @@ class RemoteModel(object):
         :param return_labels: Whether the remote model returns class indices or
             the class labels directly. This depends on the `return_labels`
             parameter in exporters
+        :param pool_size: The max number of requests in flight at once (defaults to 4)
+        :param timeout: The request timeout in seconds (defaults to None)
+        :param stats_window: How many recent requests to compute the latency percentiles over
         """
         inputs = [] if inputs is None else inputs
         self.remote = remote
@@ -76,6 +265,13 @@ class RemoteModel(object):
         self.labels = labels
         self.version = version
         self.return_labels = return_labels
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._executor = None
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=stats_window)
+        self._num_requests = 0
+        self._num_errors = 0
 
     def get_labels(self):
         """Return the model's labels
@@ -88,6 +284,67 @@ class RemoteModel(object):
         """Run inference on examples."""
         pass
 
+    def predict_arrays(self, examples):
+        """Run inference on examples and get the outputs back as whole (padded) arrays
+
+        This skips building a python object per token or class, the services use it to post-process the batch
+        with numpy ops.
+
+        :param examples: The input examples
+        :return: (`dict`) The `classes` (and for `predict_text`, the `scores`) as `np.ndarray`s
+        """
+        return self.predict(examples, batched=True)
+
+    def predict_async(self, examples, **kwargs):
+        """Run inference on examples from asyncio code
+
+        Up to `pool_size` of these requests are sent concurrently.
+
+        :param examples: The input examples
+        :return: (`asyncio.Future`) An awaitable with the same result as `predict`
+        """
+        import asyncio
+        with self._stats_lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size)
+        return asyncio.wrap_future(self._executor.submit(self.predict, examples, **kwargs))
+
+    def _record(self, start, error=False):
+        with self._stats_lock:
+            self._num_requests += 1
+            if error:
+                self._num_errors += 1
+            else:
+                self._latencies.append(time.time() - start)
+
+    def stats(self):
+        """Get the request stats
+
+        Latencies are in milliseconds, measured around the round trip to the server (including (de)serialization)
+        of successful requests, and are over the most recent requests.
+
+        :return: (`dict`) The request count, error count and latency stats
+        """
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000.0
+            stats = {'requests': self._num_requests, 'errors': self._num_errors}
+        if len(latencies):
+            stats['latency_ms'] = {
+                'mean': float(np.mean(latencies)),
+                'p50': float(np.percentile(latencies, 50)),
+                'p95': float(np.percentile(latencies, 95)),
+                'p99': float(np.percentile(latencies, 99)),
+                'max': float(np.max(latencies)),
+            }
+        return stats
+
+    def close(self):
+        """Release the connections held by this client"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
     def deserialize_response(self, examples, predict_response):
         """Convert the response into a standard format."""
         pass
@@ -110,9 +367,14 @@ class RemoteModelREST(RemoteModel):
             inputs=None,
             version=None,
             return_labels=None,
+            pool_size=4,
+            timeout=None,
+            stats_window=1000,
     ):
         """A remote model with REST transport
 
+        Requests are sent over a pool of keep-alive connections (see `HTTPConnectionPool`)
+
         :param remote: The remote endpoint
         :param name:  The name of the model
         :param signature: The model signature
@@ -123,9 +385,13 @@ class RemoteModelREST(RemoteModel):
         :param version: The model version (defaults to None)
         :param return_labels: Whether the remote model returns class indices or the class labels directly. This depends
         on the `return_labels` parameter in exporters
+        :param pool_size: The max number of connections, and so concurrent requests (defaults to 4)
+        :param timeout: The socket timeout in seconds (defaults to None)
+        :param stats_window: How many recent requests to compute the latency percentiles over
         """
         super(RemoteModelREST, self).__init__(
-            remote, name, signature, labels, beam, lengths_key, inputs, version, return_labels
+            remote, name, signature, labels, beam, lengths_key, inputs, version, return_labels,
+            pool_size, timeout, stats_window
         )
         url = urlparse(self.remote)
         if len(url.netloc.split(":")) != 2:
@@ -135,6 +401,7 @@ class RemoteModelREST(RemoteModel):
         path = url.path if url.path.endswith("/") else "{}/".format(url.path)
         self.path = '{}v1/models/{}{}:predict'.format(path, self.name, v_str)
         self.headers = {'Content-type': 'application/json'}
+        self.pool = HTTPConnectionPool(self.hostname, self.port, pool_size, timeout)
 
     def predict(self, examples, **kwargs):
         """Run prediction over HTTP/REST.
@@ -145,17 +412,31 @@ class RemoteModelREST(RemoteModel):
 
         verify_example(examples, self.input_keys)
 
-        request = self.create_request(examples)
-        conn = HTTPConnection(self.hostname, self.port)
-        conn.request('POST', self.path, json.dumps(request), self.headers)
-        response = conn.getresponse().read()
-        outcomes_list = json.loads(response)
-        if "error" in outcomes_list:
-            raise ValueError("remote server returns error: {0}".format(outcomes_list["error"]))
-        outcomes_list = outcomes_list["outputs"]
-        outcomes_list = self.deserialize_response(examples, outcomes_list)
+        start = time.time()
+        try:
+            request = self.create_request(examples)
+            # Send the body as bytes so it goes out with the headers instead of in a second packet
+            body = json.dumps(request, default=_to_json).encode('utf-8')
+            _, response = self.pool.request('POST', self.path, body, self.headers)
+            outcomes_list = json.loads(response)
+            if "error" in outcomes_list:
+                raise ValueError("remote server returns error: {0}".format(outcomes_list["error"]))
+            outcomes_list = outcomes_list["outputs"]
+            if kwargs.get('batched', False):
+                outcomes_list = self.deserialize_arrays(examples, outcomes_list)
+            else:
+                outcomes_list = self.deserialize_response(examples, outcomes_list)
+        except Exception:
+            self._record(start, error=True)
+            raise
+        self._record(start)
         return outcomes_list
 
+    def close(self):
+        """Close the pooled connections"""
+        super(RemoteModelREST, self).close()
+        self.pool.close()
+
     def deserialize_response(self, examples, predict_response):
         """Read the JSON response and decode it according to the signature.
 
@@ -168,50 +449,60 @@ class RemoteModelREST(RemoteModel):
             tensor = tensor.transpose(1, 2, 0)
             return tensor
 
-        num_ex = len(predict_response['classes'])
-
         if self.signature == 'tag_text':
-            classes = predict_response['classes']
+            classes = self.deserialize_arrays(examples, predict_response)['classes']
             lengths = examples[self.lengths_key]
-            result = []
-            for i in range(num_ex):
-                length_i = lengths[i]
-                classes_i = classes[i]
-                if self.return_labels:
-                    d = [np.array(classes_i[j]) for j in range(length_i)]
-                else:
-                    d = [np.array(np.int32(classes_i[j])) for j in range(length_i)]
-                result.append(d)
-
-            return result
+            return [classes[i, :length] for i, length in enumerate(lengths)]
 
         if self.signature == 'predict_text':
-            scores = predict_response['scores']
-            classes = predict_response['classes']
-            result = []
-            for i in range(num_ex):
-                score_i = scores[i]
-                classes_i = classes[i]
-                if self.return_labels:
-                    d = [(c, np.float32(s)) for c, s in zip(classes_i, score_i)]
-                else:
-                    d = [(np.int32(c), np.float32(s)) for c, s in zip(classes_i, score_i)]
-                result.append(d)
+            outputs = self.deserialize_arrays(examples, predict_response)
+            return [list(zip(classes_i, scores_i)) for classes_i, scores_i in zip(outputs['classes'], outputs['scores'])]
 
         if self.signature == 'embed_text':
             result = np.array(predict_response['scores'])
 
         return result
 
+    def deserialize_arrays(self, examples, predict_response):
+        """Decode a `tag_text` or `predict_text` JSON response into whole arrays
+
+        :param examples: Input examples
+        :param predict_response: an HTTP/REST output
+        :return: (`dict`) The `classes` and `scores` (`predict_text` only) as `np.ndarray`s
+        """
+        if self.signature not in ('tag_text', 'predict_text'):
+            raise ValueError("Batched outputs are not supported for {}".format(self.signature))
+        classes = np.array(predict_response['classes'])
+        outputs = {'classes': classes if self.return_labels else classes.astype(np.int32)}
+        if self.signature == 'predict_text':
+            outputs['scores'] = np.array(predict_response['scores'], dtype=np.float32)
+        return outputs
+
 
 @exporter
 class RemoteModelGRPC(RemoteModel):
 
-    def __init__(self, remote, name, signature, labels=None, beam=None, lengths_key=None, inputs=None, version=None, return_labels=False):
+    def __init__(
+            self,
+            remote,
+            name, signature,
+            labels=None,
+            beam=None,
+            lengths_key=None,
+            inputs=None,
+            version=None,
+            return_labels=False,
+            pool_size=4,
+            timeout=None,
+            stats_window=1000,
+    ):
         """A remote model with gRPC transport
 
-        When using this type of model, there is an external dependency on the `grpc` package, as well as the
-        TF serving protobuf stub files.  There is also currently a dependency on `tensorflow`
+        When using this type of model, there is an external dependency on the `grpc` and `protobuf` packages.  The
+        TF serving messages come from `baseline.protos` and are converted with `fill_tensor_proto` and
+        `tensor_proto_to_ndarray`, so TensorFlow is not imported
+
+        A single channel and stub are shared by all requests, gRPC multiplexes concurrent calls over it
 
         :param remote: The remote endpoint
         :param name:  The name of the model
@@ -223,19 +514,27 @@ class RemoteModelGRPC(RemoteModel):
         :param version: The model version (defaults to None)
         :param return_labels: Whether the remote model returns class indices or the class labels directly. This depends
         on the `return_labels` parameter in exporters
+        :param pool_size: The max number of concurrent requests from `predict_async` (defaults to 4)
+        :param timeout: The request deadline in seconds (defaults to None)
+        :param stats_window: How many recent requests to compute the latency percentiles over
         """
         super(RemoteModelGRPC, self).__init__(
-            remote, name, signature, labels, beam, lengths_key, inputs, version, return_labels
+            remote, name, signature, labels, beam, lengths_key, inputs, version, return_labels,
+            pool_size, timeout, stats_window
         )
-        self.predictpb = import_user_module('tensorflow_serving.apis.predict_pb2')
-        self.servicepb = import_user_module('tensorflow_serving.apis.prediction_service_pb2_grpc')
-        self.metadatapb = import_user_module('tensorflow_serving.apis.get_model_metadata_pb2')
+        self.predictpb = import_user_module('baseline.protos.predict_pb2')
+        self.servicepb = import_user_module('baseline.protos.prediction_service_pb2_grpc')
         self.grpc = import_user_module('grpc')
         self.channel = self.grpc.insecure_channel(remote)
+        self.stub = self.servicepb.PredictionServiceStub(self.channel)
 
     def decode_output(self, x):
         return x.decode('ascii') if self.return_labels else np.int32(x)
 
+    def decode_outputs(self, x):
+        """Decode a whole array of outputs, like `decode_output`"""
+        return np.char.decode(x.astype(np.bytes_), 'ascii') if self.return_labels else x.astype(np.int32)
+
     def get_labels(self):
         """Return the model's labels
 
@@ -251,17 +550,54 @@ class RemoteModelGRPC(RemoteModel):
         """
         verify_example(examples, self.input_keys)
 
-        request = self.create_request(examples)
-        stub = self.servicepb.PredictionServiceStub(self.channel)
-        outcomes_list = stub.Predict(request)
-        outcomes_list = self.deserialize_response(examples, outcomes_list)
-
+        start = time.time()
+        try:
+            request = self.create_request(examples)
+            outcomes_list = self.stub.Predict(request, self.timeout)
+            if kwargs.get('batched', False):
+                outcomes_list = self.deserialize_arrays(examples, outcomes_list)
+            else:
+                outcomes_list = self.deserialize_response(examples, outcomes_list)
+        except Exception:
+            self._record(start, error=True)
+            raise
+        self._record(start)
         return outcomes_list
 
-    def create_request(self, examples):
-        # TODO: Remove TF dependency client side
-        import tensorflow as tf
+    def predict_async(self, examples, **kwargs):
+        """Run prediction over gRPC from asyncio code, without tying up a thread per request
 
+        :param examples: The input examples
+        :return: (`asyncio.Future`) An awaitable with the same result as `predict`
+        """
+        import asyncio
+        verify_example(examples, self.input_keys)
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        start = time.time()
+        call = self.stub.Predict.future(self.create_request(examples), self.timeout)
+
+        def finish(call):
+            if future.cancelled():
+                return
+            try:
+                outcomes_list = self.deserialize_response(examples, call.result())
+            except Exception as e:
+                self._record(start, error=True)
+                future.set_exception(e)
+                return
+            self._record(start)
+            future.set_result(outcomes_list)
+
+        call.add_done_callback(lambda call: loop.call_soon_threadsafe(finish, call))
+        return future
+
+    def close(self):
+        """Close the channel"""
+        super(RemoteModelGRPC, self).close()
+        self.channel.close()
+
+    def create_request(self, examples):
         request = self.predictpb.PredictRequest()
         request.model_spec.name = self.name
         request.model_spec.signature_name = self.signature
@@ -275,14 +611,11 @@ class RemoteModelGRPC(RemoteModel):
                 shape = [1]
 
             dtype = examples[feature].dtype.type
-            if issubclass(dtype, np.integer): dtype = tf.int32
-            elif issubclass(dtype, np.floating): dtype = tf.float32
-            else: dtype = tf.string
+            if issubclass(dtype, np.integer): dtype = DT_INT32
+            elif issubclass(dtype, np.floating): dtype = DT_FLOAT
+            else: dtype = DT_STRING
 
-            tensor_proto = tf.contrib.util.make_tensor_proto(examples[feature], shape=shape, dtype=dtype)
-            request.inputs[feature].CopyFrom(
-                tensor_proto
-            )
+            fill_tensor_proto(request.inputs[feature], examples[feature], shape=shape, dtype=dtype)
 
         return request
 
@@ -301,45 +634,36 @@ class RemoteModelGRPC(RemoteModel):
                     as defined in tensorflow_serving proto files
         """
 
-        example_len = predict_response.outputs.get('classes').tensor_shape.dim[1].size
-        num_examples = predict_response.outputs.get('classes').tensor_shape.dim[0].size
-
         if self.signature == 'suggest_text':
             # s2s returns int values.
-            classes = predict_response.outputs.get('classes')
-            shape = [dim.size for dim in classes.tensor_shape.dim]
-            results = np.reshape(np.array(classes.int_val), shape)
-            results = results.transpose(1, 2, 0)
+            classes = tensor_proto_to_ndarray(predict_response.outputs.get('classes'))
+            results = classes.transpose(1, 2, 0)
             return results
 
         if self.signature == 'tag_text':
-            if self.return_labels:
-                classes = predict_response.outputs.get('classes').string_val
-            else:
-                classes = predict_response.outputs.get('classes').int_val
+            classes = self.deserialize_arrays(examples, predict_response)['classes']
             lengths = examples[self.lengths_key]
-            result = []
-            for i in range(num_examples):
-                length = lengths[i]
-                tmp = [self.decode_output(x) for x in classes[example_len*i:example_len*(i+1)][:length]]
-                result.append(tmp)
-
-            return result
+            return [classes[i, :length] for i, length in enumerate(lengths)]
 
         if self.signature == 'predict_text':
-            scores = predict_response.outputs.get('scores').float_val
-            if self.return_labels:
-                classes = predict_response.outputs.get('classes').string_val
-            else:
-                classes = predict_response.outputs.get('classes').int_val
-            result = []
-            length = len(self.get_labels())
-            for i in range(num_examples):   # wrap in numpy because the local models send that dtype out
-                d = [(self.decode_output(c), np.float32(s)) for c, s in zip(classes[example_len*i:example_len*(i+1)][:length], scores[length*i:length*(i+1)][:length])]
-                result.append(d)
-            return result
+            outputs = self.deserialize_arrays(examples, predict_response)
+            return [list(zip(classes_i, scores_i)) for classes_i, scores_i in zip(outputs['classes'], outputs['scores'])]
 
         if self.signature == 'embed_text':
-            scores = predict_response.outputs.get('scores')
-            shape = [dim.size for dim in scores.tensor_shape.dim]
-            return np.reshape(np.array(scores.float_val), shape)
+            return tensor_proto_to_ndarray(predict_response.outputs.get('scores'))
+
+    def deserialize_arrays(self, examples, predict_response):
+        """Decode a `tag_text` or `predict_text` protobuf response into whole arrays
+
+        :param examples: Input examples
+        :param predict_response: a PredictResponse protobuf object
+        :return: (`dict`) The `classes` and `scores` (`predict_text` only) as `np.ndarray`s
+        """
+        if self.signature not in ('tag_text', 'predict_text'):
+            raise ValueError("Batched outputs are not supported for {}".format(self.signature))
+        classes = self.decode_outputs(tensor_proto_to_ndarray(predict_response.outputs.get('classes')))
+        if self.signature == 'tag_text':
+            return {'classes': classes}
+        length = len(self.get_labels())
+        scores = tensor_proto_to_ndarray(predict_response.outputs.get('scores'))
+        return {'classes': classes[:, :length], 'scores': scores[:, :length].astype(np.float32)}
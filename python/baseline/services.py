@@ -1,8 +1,12 @@
 import six
 
 import os
+import time
 import pickle
-from collections import defaultdict
+import hashlib
+import threading
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import Future
 import numpy as np
 import baseline
 import logging
@@ -19,6 +23,7 @@ from baseline.utils import (
     load_vocabs,
     lookup_sentence,
     normalize_backend,
+    file_sha1,
 )
 from baseline.model import load_model_for
 logger = logging.getLogger('baseline')
@@ -28,6 +33,23 @@ __all__ = []
 exporter = export(__all__)
 
 
+def _vectorize_batch(tokens_seq, vectorizers, vocabs):
+    """Vectorize a whole batch with each vectorizer
+
+    :param tokens_seq: `List[List[str]]`: The input text batch.
+    :param vectorizers: `dict[str] -> Vectorizer`: The vectorizers
+    :param vocabs: `dict[str] -> dict`: The vocab for each vectorizer
+
+    :returns: dict[str] -> np.ndarray: The vectorized batch.
+    """
+    examples = defaultdict(list)
+    for k, vectorizer in vectorizers.items():
+        examples[k], lengths = vectorizer.run_batch(tokens_seq, vocabs[k])
+        if lengths is not None:
+            examples['{}_lengths'.format(k)] = lengths
+    return examples
+
+
 class Service(object):
 
     def __init__(self, vocabs=None, vectorizers=None, model=None, preproc='client'):
@@ -112,21 +134,7 @@ class Service(object):
 
         :returns: dict[str] -> np.ndarray: The vectorized batch.
         """
-        examples = defaultdict(list)
-        for i, tokens in enumerate(tokens_seq):
-            for k, vectorizer in self.vectorizers.items():
-                vec, length = vectorizer.run(tokens, self.vocabs[k])
-                examples[k].append(vec)
-                if length is not None:
-                    lengths_key = '{}_lengths'.format(k)
-                    examples[lengths_key].append(length)
-
-        for k in self.vectorizers.keys():
-            examples[k] = np.stack(examples[k])
-            lengths_key = '{}_lengths'.format(k)
-            if lengths_key in examples:
-                examples[lengths_key] = np.stack(examples[lengths_key])
-        return examples
+        return _vectorize_batch(tokens_seq, self.vectorizers, self.vocabs)
 
     @classmethod
     def load(cls, bundle, **kwargs):
@@ -134,8 +142,12 @@ class Service(object):
 
         This can be either a local model or a remote, exported model.
 
+        Pass `cache=True` to get the service from (or add it to) the process wide `SERVICE_CACHE`
+
         :returns a Service implementation
         """
+        if kwargs.pop('cache', False):
+            return SERVICE_CACHE.load(cls, bundle, **kwargs)
         # can delegate
         if os.path.isdir(bundle):
             directory = bundle
@@ -156,7 +168,9 @@ class Service(object):
             model, preproc = Service._create_remote_model(
                 directory, be, remote, name, cls.signature_name(), beam,
                 preproc=kwargs.get('preproc', 'client'),
-                version=kwargs.get('version')
+                version=kwargs.get('version'),
+                pool_size=kwargs.get('pool_size', 4),
+                timeout=kwargs.get('timeout')
             )
             return cls(vocabs, vectorizers, model, preproc)
 
@@ -209,6 +223,8 @@ class Service(object):
             beam=beam,
             return_labels=return_labels,
             version=version,
+            pool_size=kwargs.get('pool_size', 4),
+            timeout=kwargs.get('timeout'),
         )
         return model, preproc
 
@@ -223,6 +239,7 @@ class ClassifierService(Service):
             self.return_labels = True  # keeping the default classifier behavior
         if not self.return_labels:
             self.label_vocab = {index: label for index, label in enumerate(self.get_labels())}
+            self.label_array = np.array(self.get_labels())
 
     @classmethod
     def task_name(cls):
@@ -251,15 +268,31 @@ class ClassifierService(Service):
                         self.model.lengths_key: featurized_examples[self.model.lengths_key]
             }
 
-        outcomes_list = self.model.predict(examples)
-        results = []
-        for outcomes in outcomes_list:
-            if self.return_labels:
-                results += [list(map(lambda x: (x[0], x[1].item()), sorted(outcomes, key=lambda tup: tup[1], reverse=True)))]
-            else:
-                results += [list(map(lambda x: (self.label_vocab[x[0].item()], x[1].item()),
-                                     sorted(outcomes, key=lambda tup: tup[1], reverse=True)))]
-        return results
+        if hasattr(self.model, 'predict_arrays'):
+            outcomes = self.model.predict_arrays(examples)
+            classes, scores = outcomes['classes'], outcomes['scores']
+        else:
+            outcomes_list = self.model.predict(examples)
+            classes = np.array([[c for c, _ in outcomes] for outcomes in outcomes_list])
+            scores = np.array([[float(s) for _, s in outcomes] for outcomes in outcomes_list])
+        return self.top_k(classes, scores)
+
+    def top_k(self, classes, scores, k=None):
+        """Sort the classes for each example by score, and look up their labels if the model returned indices
+
+        Ties keep the order the model returned them in
+
+        :param classes: (`np.ndarray`) The class labels or indices, `[B, C]`
+        :param scores: (`np.ndarray`) The score for each, `[B, C]`
+        :param k: (`int`) How many to keep for each example, defaults to all of them
+        :return: A `list` of `(label, score)` `list`s, best first
+        """
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        classes = np.take_along_axis(classes, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        if not self.return_labels:
+            classes = self.label_array[classes]
+        return [list(zip(c, s)) for c, s in zip(classes.tolist(), scores.tolist())]
 
 @exporter
 class EmbeddingsService(Service):
@@ -301,6 +334,7 @@ class TaggerService(Service):
             self.return_labels = False  # keeping the default tagger behavior
         if not self.return_labels:
             self.label_vocab = revlut(self.get_labels())
+            self.label_array = np.array([self.label_vocab.get(i) for i in range(max(self.label_vocab) + 1)], dtype=object)
 
     @classmethod
     def task_name(cls):
@@ -415,18 +449,23 @@ class TaggerService(Service):
             unfeaturized_examples[self.model.lengths_key] = examples[self.model.lengths_key]  # remote model
             examples = unfeaturized_examples
 
-        outcomes = self.model.predict(examples)
+        if hasattr(self.model, 'predict_arrays'):
+            outcomes = self.model.predict_arrays(examples)['classes']
+        else:
+            outcomes = self.model.predict(examples)
 
         outputs = []
         for i, outcome in enumerate(outcomes):
+            # Slice off the padding and look up the whole sentence at once
+            outcome = outcome[:len(tokens_seq[i])]
+            # Local PyTorch models return tensors, maybe on the GPU
+            outcome = outcome.cpu().numpy() if hasattr(outcome, 'cpu') else np.asarray(outcome)
+            labels = outcome.tolist() if self.return_labels else self.label_array[outcome].tolist()
             output = []
-            for j, token in enumerate(tokens_seq[i]):
+            for token, label in zip(tokens_seq[i], labels):
                 new_token = dict()
                 new_token.update(token)
-                if self.return_labels:
-                    new_token[label_field] = outcome[j]
-                else:
-                    new_token[label_field] = self.label_vocab[outcome[j].item()]
+                new_token[label_field] = label
                 output += [new_token]
             outputs += [output]
         return outputs
@@ -541,21 +580,7 @@ class EncoderDecoderService(Service):
                 vectorizer.mxwlen = mxwlen
 
     def vectorize(self, tokens_seq):
-        examples = defaultdict(list)
-        for i, tokens in enumerate(tokens_seq):
-            for k, vectorizer in self.src_vectorizers.items():
-                vec, length = vectorizer.run(tokens, self.src_vocabs[k])
-                examples[k] += [vec]
-                if length is not None:
-                    lengths_key = '{}_lengths'.format(k)
-                    examples[lengths_key] += [length]
-
-        for k in self.src_vectorizers.keys():
-            examples[k] = np.stack(examples[k])
-            lengths_key = '{}_lengths'.format(k)
-            if lengths_key in examples:
-                examples[lengths_key] = np.array(examples[lengths_key])
-        return examples
+        return _vectorize_batch(tokens_seq, self.src_vectorizers, self.src_vocabs)
 
     def predict(self, tokens, K=1, **kwargs):
         tokens_seq, mxlen, mxwlen = self.batch_input(tokens)
@@ -580,3 +605,401 @@ class EncoderDecoderService(Service):
             if K > 1:
                 results.append(n_best_result)
         return results
+
+
+@exporter
+class BatchingService(object):
+    """Coalesce concurrent `predict` calls on a loaded `Service` into single batches
+
+    Requests from any number of threads (or asyncio tasks, using `predict_async`) are queued.  A
+    worker thread takes the first waiting request, keeps collecting requests until `max_batch_size`
+    examples are waiting or `max_latency_ms` has passed, runs one `predict` over all of them and gives
+    each caller back its part of the results, so each caller sees what it would have gotten from calling
+    the service directly.  Only requests with the same keyword arguments are batched together.  Since
+    all calls to the wrapped service come from the worker thread, the service is never run concurrently.
+
+    ```
+    service = BatchingService(ClassifierService.load(bundle), max_batch_size=64, max_latency_ms=5)
+    service.predict(['this', 'is', 'great'])
+    service.stats()
+    ```
+    """
+
+    def __init__(self, service, max_batch_size=32, max_latency_ms=5, stats_window=1000):
+        """Wrap a service
+
+        :param service: (`Service`) A loaded service
+        :param max_batch_size: (`int`) The max number of examples to send in one `predict`
+        :param max_latency_ms: (`float`) How long to wait for more requests after the first one arrives
+        :param stats_window: (`int`) How many recent requests to compute the latency percentiles over
+        """
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue = six.moves.queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=stats_window)
+        self._batch_sizes = deque(maxlen=stats_window)
+        self._num_requests = 0
+        self._num_examples = 0
+        self._num_batches = 0
+        self._max_queue_depth = 0
+        self._start = time.time()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='batching-service')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def __getattr__(self, name):
+        # Things like `get_labels` and `get_vocab` just go to the wrapped service
+        if name == 'service':
+            raise AttributeError(name)
+        return getattr(self.service, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _split(tokens):
+        """Get the examples in a request and if it was a single example (not a batch)"""
+        if len(tokens) > 0 and isinstance(tokens[0], (six.string_types, dict)):
+            return [tokens], True
+        return list(tokens), False
+
+    def submit(self, tokens, **kwargs):
+        """Queue a request
+
+        :param tokens: The input, in any format the wrapped service's `predict` takes
+        :param kwargs: Passed to the wrapped service's `predict`
+        :return: (`concurrent.futures.Future`) The future for the result of `predict`
+        """
+        if self._closed:
+            raise RuntimeError('BatchingService is closed')
+        future = Future()
+        examples, single = self._split(tokens)
+        key = tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+        self._queue.put((future, examples, single, key, kwargs, time.time()))
+        with self._lock:
+            self._num_requests += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def predict(self, tokens, **kwargs):
+        """Run `predict` on the wrapped service as part of a batch, blocking until it is done
+
+        :param tokens: The input, in any format the wrapped service's `predict` takes
+        :param kwargs: Passed to the wrapped service's `predict`
+        :return: The same result as the wrapped service's `predict`
+        """
+        return self.submit(tokens, **kwargs).result()
+
+    def predict_async(self, tokens, **kwargs):
+        """Run `predict` on the wrapped service as part of a batch from asyncio code
+
+        :param tokens: The input, in any format the wrapped service's `predict` takes
+        :param kwargs: Passed to the wrapped service's `predict`
+        :return: (`asyncio.Future`) An awaitable with the same result as the wrapped service's `predict`
+        """
+        import asyncio
+        return asyncio.wrap_future(self.submit(tokens, **kwargs))
+
+    def _collect(self, first):
+        """Gather requests that arrive before the deadline into groups with the same kwargs"""
+        groups = defaultdict(list)
+        groups[first[3]].append(first)
+        size = len(first[1])
+        deadline = time.time() + self.max_latency
+        while size < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except six.moves.queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            groups[request[3]].append(request)
+            size += len(request[1])
+        return groups.values()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            for requests in self._collect(first):
+                self._run_batch(requests)
+
+    def _run_batch(self, requests):
+        batch = [example for request in requests for example in request[1]]
+        try:
+            results = self.service.predict(batch, **requests[0][4]) if batch else []
+        except Exception as e:
+            for request in requests:
+                request[0].set_exception(e)
+            return
+        now = time.time()
+        offset = 0
+        with self._lock:
+            self._num_batches += 1
+            self._num_examples += len(batch)
+            self._batch_sizes.append(len(batch))
+            for future, examples, single, _, _, start in requests:
+                self._latencies.append(now - start)
+        for future, examples, single, _, _, _ in requests:
+            future.set_result(results[offset:offset + len(examples)])
+            offset += len(examples)
+
+    def stats(self):
+        """Get the serving stats
+
+        Latencies are in milliseconds, measured from when the request was queued to when its result was ready,
+        and are over the most recent requests.
+
+        :return: (`dict`) The throughput, latency, batch size and queue depth stats
+        """
+        with self._lock:
+            elapsed = time.time() - self._start
+            latencies = np.array(self._latencies) * 1000.0
+            stats = {
+                'requests': self._num_requests,
+                'examples': self._num_examples,
+                'batches': self._num_batches,
+                'examples_per_sec': self._num_examples / elapsed if elapsed > 0 else 0.0,
+                'avg_batch_size': float(np.mean(self._batch_sizes)) if self._batch_sizes else 0.0,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+            }
+        if len(latencies):
+            stats['latency_ms'] = {
+                'mean': float(np.mean(latencies)),
+                'p50': float(np.percentile(latencies, 50)),
+                'p95': float(np.percentile(latencies, 95)),
+                'p99': float(np.percentile(latencies, 99)),
+                'max': float(np.max(latencies)),
+            }
+        return stats
+
+    def close(self):
+        """Finish the queued requests and stop the worker thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+
+def _rss():
+    """The resident memory of this process in bytes (0 if we can't tell)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return 0
+
+
+def _tensor_bytes(model):
+    """The size of a PyTorch model's parameters and buffers (0 for other models)"""
+    if not hasattr(model, 'parameters') or not hasattr(model, 'buffers'):
+        return 0
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+def _bundle_hash(bundle):
+    """Identify a bundle by its contents: the SHA1 of a zip, or the names, sizes and mtimes in a directory"""
+    if not os.path.isdir(bundle):
+        return file_sha1(bundle)
+    sha1 = hashlib.sha1()
+    for root, dirs, files in os.walk(bundle):
+        dirs.sort()
+        for f in sorted(files):
+            path = os.path.join(root, f)
+            stat = os.stat(path)
+            sha1.update('{}:{}:{}\n'.format(os.path.relpath(path, bundle), stat.st_size, stat.st_mtime).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def _service_classes(cls=Service):
+    classes = {}
+    for sub in cls.__subclasses__():
+        try:
+            classes[sub.task_name()] = sub
+        except Exception:
+            pass
+        classes.update(_service_classes(sub))
+    return classes
+
+
+@exporter
+class ServiceCache(object):
+    """A process wide LRU cache of loaded services
+
+    Loading a bundle unzips it, reads the vocabs, unpickles the vectorizers, imports the backend and loads the
+    weights.  This keeps the loaded `Service`s around so loading the same bundle (with the same `backend` and other
+    arguments) again just returns the one that is already loaded.  When the cached services take more than
+    `max_memory` bytes, or there are more than `max_services` of them, the least recently used ones are dropped.
+    Services that are preloaded with `pin=True` are never dropped.
+
+    Memory is estimated per service as the larger of the growth in the process RSS while loading it and, for PyTorch
+    models, the size of its tensors.
+
+    ```
+    SERVICE_CACHE.max_memory = 8 * 1024 ** 3
+    SERVICE_CACHE.preload([{'task': 'classify', 'bundle': 'sst2.zip', 'backend': 'pytorch'}])
+    service = ClassifierService.load('sst2.zip', backend='pytorch', cache=True)
+    ```
+    """
+
+    def __init__(self, max_memory=None, max_services=None):
+        """Create a cache
+
+        :param max_memory: (`int`) The memory budget in bytes, defaults to no limit
+        :param max_services: (`int`) The max number of services to keep, defaults to no limit
+        """
+        self.max_memory = max_memory
+        self.max_services = max_services
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def key(cls, bundle, kwargs):
+        """The cache key for loading `bundle` with `cls.load(bundle, **kwargs)`"""
+        backend = normalize_backend(kwargs.get('backend', 'tf'))
+        kwargs = tuple(sorted((k, repr(v)) for k, v in kwargs.items() if k != 'backend'))
+        return _bundle_hash(bundle), cls.__name__, backend, kwargs
+
+    def load(self, cls, bundle, **kwargs):
+        """Get a loaded service, loading it if it isn't in the cache
+
+        If another thread is loading the same service this waits for it rather than loading it twice.
+
+        :param cls: (`Type[Service]`) The service to load
+        :param bundle: (`str`) The bundle, a zip file or a directory
+        :param kwargs: Passed to `cls.load`
+        :return: (`Service`) The loaded service
+        """
+        return self._load(cls, bundle, False, kwargs)
+
+    def _load(self, cls, bundle, pin, kwargs):
+        key = self.key(cls, bundle, kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = self._entries.pop(key)
+                entry['hits'] += 1
+                entry['pinned'] = entry['pinned'] or pin
+                self._hits += 1
+                return entry['service']
+            future = self._loading.get(key)
+            loader = future is None
+            if loader:
+                self._misses += 1
+                future = Future()
+                self._loading[key] = future
+        if not loader:
+            return future.result()
+
+        try:
+            start_mem = _rss()
+            start = time.time()
+            service = cls.load(bundle, **kwargs)
+            load_time = time.time() - start
+            memory = max(_rss() - start_mem, _tensor_bytes(getattr(service, 'model', None)))
+        except Exception as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        logger.info("Loaded %s from %s in %.2fs (%.1fMB)", cls.__name__, bundle, load_time, memory / 1024.0 ** 2)
+        with self._lock:
+            del self._loading[key]
+            self._entries[key] = {
+                'service': service,
+                'bundle': bundle,
+                'load_time': load_time,
+                'memory': memory,
+                'hits': 0,
+                'pinned': pin,
+            }
+            self._evict()
+        future.set_result(service)
+        return service
+
+    def _evict(self):
+        """Drop least recently used services until we are under budget, the lock must be held"""
+        def over():
+            if self.max_services is not None and len(self._entries) > self.max_services:
+                return True
+            return self.max_memory is not None and sum(e['memory'] for e in self._entries.values()) > self.max_memory
+
+        for key in list(self._entries):
+            if not over():
+                break
+            # Keep pinned services and the one that was just loaded
+            if self._entries[key]['pinned'] or key == next(reversed(self._entries)):
+                continue
+            entry = self._entries.pop(key)
+            self._evictions += 1
+            logger.info("Evicting %s from %s", type(entry['service']).__name__, entry['bundle'])
+
+    def preload(self, services, pin=True):
+        """Load a warm pool of services, for example at startup
+
+        :param services: `List[dict]` Each has the `task` (like `classify`, or a `Service` class), the `bundle` and
+            any other keyword arguments for `load`
+        :param pin: (`bool`) Keep these services loaded regardless of the memory budget
+        :return: `List[Service]` The loaded services
+        """
+        classes = _service_classes()
+        loaded = []
+        for spec in services:
+            kwargs = dict(spec)
+            task = kwargs.pop('task')
+            cls = classes[task] if isinstance(task, six.string_types) else task
+            loaded.append(self._load(cls, kwargs.pop('bundle'), pin, kwargs))
+        return loaded
+
+    def clear(self):
+        """Drop everything from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Get the cache stats
+
+        :return: (`dict`) The hit, miss and eviction counts, the total memory and the load time (in seconds), memory
+            (in bytes) and hits of each cached service, most recently used last
+        """
+        with self._lock:
+            entries = [
+                {
+                    'service': type(e['service']).__name__,
+                    'bundle': e['bundle'],
+                    'load_time': e['load_time'],
+                    'memory': e['memory'],
+                    'hits': e['hits'],
+                    'pinned': e['pinned'],
+                } for e in self._entries.values()
+            ]
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'memory': sum(e['memory'] for e in entries),
+                'services': entries,
+            }
+
+
+SERVICE_CACHE = ServiceCache()
@@ -1,5 +1,5 @@
 import numpy as np
-from baseline.remote import RemoteModelREST, RemoteModelGRPC, register_remote
+from baseline.remote import RemoteModelREST, RemoteModelGRPC, register_remote, fill_tensor_proto
 
 
 @register_remote('http')
@@ -25,9 +25,6 @@ class RemoteModelGRPCTensorFlow(RemoteModelGRPC): pass
 class RemoteModelGRPCTensorFlowPreproc(RemoteModelGRPCTensorFlow):
 
     def create_request(self, examples):
-        # TODO: Remove TF dependency client side
-        import tensorflow as tf
-
         request = self.predictpb.PredictRequest()
         request.model_spec.name = self.name
         request.model_spec.signature_name = self.signature
@@ -37,9 +34,7 @@ class RemoteModelGRPCTensorFlowPreproc(RemoteModelGRPCTensorFlow):
         for key in examples:
             if key.endswith('lengths'):
                 continue
-            request.inputs[key].CopyFrom(
-                tf.contrib.util.make_tensor_proto(examples[key], shape=[len(examples[key]), 1])
-            )
+            fill_tensor_proto(request.inputs[key], examples[key], shape=[len(examples[key]), 1])
         return request
 
 
@@ -2,6 +2,7 @@ import time
 import logging
 import numpy as np
 from baseline.utils import export, optional_params, register, listify
+from baseline.data import create_prefetch_feed
 import math
 
 
@@ -356,6 +357,9 @@ def fit(model, ts, vs, es, **kwargs):
     This use-case is expected to be extremely uncommon.  More common behavior would be to override the Trainer and use
     the provided fit function.
 
+    If `prefetch` is set (in the mead `train` block) the datasets are wrapped in a `baseline.data.PrefetchDataFeed`
+    so that batches are built in the background, see `baseline.data.create_prefetch_feed` for the options.
+
     :param model:
     :param ts:
     :param vs:
@@ -363,6 +367,7 @@ def fit(model, ts, vs, es, **kwargs):
     :param kwargs:
     :return:
     """
+    ts, vs, es = (create_prefetch_feed(feed, **kwargs) for feed in (ts, vs, es))
     fit_func_name = kwargs.get('fit_func', 'default')
     return BASELINE_FIT_FUNC[model.task_name][fit_func_name](model, ts, vs, es, **kwargs)
 
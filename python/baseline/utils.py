@@ -6,10 +6,12 @@ import re
 import sys
 import json
 import pickle
+import shutil
 import inspect
 import hashlib
 import logging
 import zipfile
+import tempfile
 import platform
 import importlib
 from itertools import chain
@@ -1448,6 +1450,176 @@ def per_entity_f1(golds, preds, delim="@"):
     return metrics
 
 
+@exporter
+class SpanF1(object):
+    """Accumulate span level F1 over integer tag sequences.
+
+    This gives the same results as `to_spans` + `span_f1`/`per_entity_f1`
+    without building chunk strings. The (prefix, type) of each label is looked
+    up once, the spans of a whole batch are found with array ops and only the
+    per type counts are kept, so memory doesn't grow with the eval set.
+    """
+    OUTSIDE, BEGIN, INSIDE, END, SINGLE = range(5)
+
+    def __init__(self, idx2label, span_type='iob', verbose=False):
+        """Constructor
+
+        :param idx2label: `Dict[int] -> str` A mapping for integers to tag names.
+        :param span_type: `str` The tagging scheme.
+        :param verbose: `bool` Should we output warning on illegal transitions.
+            These come from `to_spans` so this is slow.
+        """
+        self.idx2label = idx2label
+        self.span_type = span_type
+        self.verbose = verbose
+        size = max(idx2label.keys()) + 1
+        self.prefixes = np.full(size, SpanF1.OUTSIDE, dtype=np.int64)
+        names = [None] * size
+        for idx, label in idx2label.items():
+            self.prefixes[idx], names[idx] = self._parse(label, span_type)
+        self.types = sorted(set(n for n in names if n is not None))
+        type_ids = {t: i for i, t in enumerate(self.types)}
+        self.type_ids = np.array([type_ids.get(n, -1) for n in names], dtype=np.int64)
+        self.reset()
+
+    @staticmethod
+    def _parse(label, span_type):
+        """Get the prefix and entity type of a label, these follow `to_chunks` exactly"""
+        if span_type == 'iobes':
+            for prefix, code in (('B-', SpanF1.BEGIN), ('S-', SpanF1.SINGLE), ('I-', SpanF1.INSIDE), ('E-', SpanF1.END)):
+                if label.startswith(prefix):
+                    return code, label.replace(prefix, '')
+            return SpanF1.OUTSIDE, None
+        if label.startswith('I-'):
+            return SpanF1.INSIDE, label.replace('I-', '')
+        if label == 'O':
+            return SpanF1.OUTSIDE, None
+        return SpanF1.BEGIN, label.replace('B-', '')
+
+    def reset(self):
+        nt = len(self.types)
+        self.overlap = np.zeros(nt, dtype=np.int64)
+        self.gold_total = np.zeros(nt, dtype=np.int64)
+        self.pred_total = np.zeros(nt, dtype=np.int64)
+
+    def spans(self, tags, first):
+        """Find the spans in a flat sequence of tags
+
+        :param tags: `np.ndarray` The tags of one or more sentences concatenated.
+        :param first: `np.ndarray` A `bool` mask that is true for the first token of each sentence.
+
+        :returns: `np.ndarray` The spans as `[N, 3]` rows of (type, start, end), end is inclusive.
+        """
+        prefix = self.prefixes[tags]
+        types = self.type_ids[tags]
+        inside = prefix != SpanF1.OUTSIDE
+        same_type = types == np.roll(types, 1)
+        if self.span_type == 'iobes':
+            # A chunk is only left open by a B or I
+            prev_open = np.roll((prefix == SpanF1.BEGIN) | (prefix == SpanF1.INSIDE), 1) & ~first
+            starts = (prefix == SpanF1.BEGIN) | (prefix == SpanF1.SINGLE) | ~(prev_open & same_type)
+        else:
+            prev_open = np.roll(inside, 1) & ~first
+            starts = (prefix == SpanF1.BEGIN) | ~(prev_open & same_type)
+        starts &= inside
+        # Token `i` closes its chunk unless token `i + 1` extends it
+        extends = np.roll(inside & ~starts, -1)
+        extends[-1:] = False
+        ends = inside & ~extends
+        start_idx = np.nonzero(starts)[0]
+        end_idx = np.nonzero(ends)[0]
+        return np.stack([types[start_idx], start_idx, end_idx], axis=1)
+
+    def add(self, gold, pred):
+        """Add a single sentence
+
+        :param gold: `List[int]` The gold tags
+        :param pred: `List[int]` The predicted tags
+        """
+        self.add_batch([gold], [pred])
+
+    def add_batch(self, golds, preds, lengths=None):
+        """Add a batch of sentences
+
+        :param golds: The gold tags, either a list of sequences or a `[B, T]` array when `lengths` is given
+        :param preds: The predicted tags, in the same form as `golds`
+        :param lengths: The optional lengths of each sentence
+        """
+        if lengths is not None:
+            golds = [g[:l] for g, l in zip(golds, lengths)]
+            preds = [p[:l] for p, l in zip(preds, lengths)]
+        golds = [np.asarray(g, dtype=np.int64).reshape(-1) for g in golds]
+        preds = [np.asarray(p, dtype=np.int64).reshape(-1) for p in preds]
+        if self.verbose:
+            for g, p in zip(golds, preds):
+                to_spans(g, self.idx2label, self.span_type, True)
+                to_spans(p, self.idx2label, self.span_type, True)
+        sizes = np.array([len(g) for g in golds], dtype=np.int64)
+        if sizes.sum() == 0 or not self.types:
+            return
+        first = np.zeros(sizes.sum(), dtype=bool)
+        first[(np.cumsum(sizes) - sizes)[sizes > 0]] = True
+        gold_spans = self.spans(np.concatenate(golds), first)
+        pred_spans = self.spans(np.concatenate(preds), first)
+        nt = len(self.types)
+        self.gold_total += np.bincount(gold_spans[:, 0], minlength=nt)
+        self.pred_total += np.bincount(pred_spans[:, 0], minlength=nt)
+        # Encode each span as a single integer, the spans in a sequence never share a start
+        n = len(first)
+        gold_keys = (gold_spans[:, 1] * n + gold_spans[:, 2]) * nt + gold_spans[:, 0]
+        pred_keys = (pred_spans[:, 1] * n + pred_spans[:, 2]) * nt + pred_spans[:, 0]
+        overlap = np.intersect1d(gold_keys, pred_keys, assume_unique=True)
+        self.overlap += np.bincount(overlap % nt, minlength=nt)
+
+    def merge(self, other):
+        """Add the counts from another `SpanF1` over the same labels into this one
+
+        :param other: A `SpanF1`
+        :return: This `SpanF1`
+        """
+        if self.types != other.types:
+            raise ValueError('Cannot merge span counts with different entity types')
+        self.overlap += other.overlap
+        self.gold_total += other.gold_total
+        self.pred_total += other.pred_total
+        return self
+
+    def get_f1(self):
+        """Get the span level F1, this matches `span_f1`
+
+        :returns: `float` The f1 score.
+        """
+        return f_score(self.overlap.sum(), self.gold_total.sum(), self.pred_total.sum())
+
+    def get_all_metrics(self):
+        """Get the metrics with break downs per entity type, this matches `per_entity_f1`
+
+        :returns: `dict` The metrics at a global level and fine grained entity level performance.
+        """
+        overlap, gold_total, pred_total = (int(x.sum()) for x in (self.overlap, self.gold_total, self.pred_total))
+        metrics = {
+            'overlap': overlap,
+            'gold_total': gold_total,
+            'pred_total': pred_total,
+            'precision': precision(overlap, pred_total) * 100,
+            'recall': recall(overlap, gold_total) * 100,
+            'f1': f_score(overlap, gold_total, pred_total) * 100,
+            'types': [],
+        }
+        for i, t in enumerate(self.types):
+            if self.gold_total[i] == 0 and self.pred_total[i] == 0:
+                continue
+            o, g, p = int(self.overlap[i]), int(self.gold_total[i]), int(self.pred_total[i])
+            metrics['types'].append({
+                'ent': t,
+                'precision': precision(o, p) * 100,
+                'recall': recall(o, g) * 100,
+                'f1': f_score(o, g, p) * 100,
+                'count': p
+            })
+        return metrics
+
+
 @exporter
 def conlleval_output(results):
     """Create conlleval formated output.
@@ -1537,6 +1709,76 @@ def f_score(overlap_count, gold_count, guess_count, f=1):
     return f
 
 
+@exporter
+def file_sha1(path, chunk_size=1 << 20, cache=True):
+    """Get the SHA1 of a file, reading it in chunks so large files don't need to fit in memory
+
+    When `cache` is set the hash is saved next to the file (as `<path>.sha1`) along with the file's size and
+    modification time and reused while those stay the same.  If the sidecar can't be written the hash is just
+    not cached.
+
+    :param path: (`str`) The file to hash
+    :param chunk_size: (`int`) How many bytes to read at a time
+    :param cache: (`bool`) Use and update the sidecar hash cache
+    :return: (`str`) The hex digest
+    """
+    stat = os.stat(path)
+    key = {'size': stat.st_size, 'mtime': getattr(stat, 'st_mtime_ns', stat.st_mtime)}
+    sidecar = '{}.sha1'.format(path)
+    if cache:
+        try:
+            cached = read_json(sidecar)
+            if cached.get('size') == key['size'] and cached.get('mtime') == key['mtime']:
+                return cached['sha1']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(partial(f.read, chunk_size), b''):
+            sha1.update(chunk)
+    sha1 = sha1.hexdigest()
+    if cache:
+        key['sha1'] = sha1
+        try:
+            # Write then rename so a reader never sees a partial sidecar
+            tmp = '{}.{}'.format(sidecar, os.getpid())
+            write_json(key, tmp)
+            os.rename(tmp, sidecar)
+        except (IOError, OSError):
+            logger.debug("Couldn't cache the sha1 of %s", path)
+    return sha1
+
+
+@exporter
+def atomic_unzip(zip_path, output_dir):
+    """Extract a zip file into `output_dir` unless it is already there
+
+    The archive is extracted into a temporary directory next to `output_dir` which is then renamed into place, so
+    `output_dir` either doesn't exist or is complete.  When several processes extract the same archive at once the
+    first rename wins and the others throw their copies away.
+
+    :param zip_path: (`str`) The zip file
+    :param output_dir: (`str`) Where to extract it
+    :return: (`str`) The `output_dir`
+    """
+    if os.path.exists(output_dir):
+        return output_dir
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    tmp_dir = tempfile.mkdtemp(prefix='.{}-'.format(os.path.basename(output_dir)), dir=parent)
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            zip_ref.extractall(tmp_dir)
+        os.rename(tmp_dir, output_dir)
+    except OSError:
+        # Someone else finished first
+        if not os.path.isdir(output_dir):
+            raise
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return output_dir
+
+
 @exporter
 def unzip_model(path):
     """If the path for a model file is a zip file, unzip it in /tmp and return the unzipped path"""
@@ -1547,13 +1789,10 @@ def unzip_model(path):
         return path
     from baseline.mime_type import mime_type
     if mime_type(path) == 'application/zip':
-        with open(path, 'rb') as f:
-            sha1 = hashlib.sha1(f.read()).hexdigest()
-        temp_dir = os.path.join("/tmp/", sha1)
+        temp_dir = os.path.join("/tmp/", file_sha1(path))
         if not os.path.exists(temp_dir):
             logger.info("unzipping model")
-            with zipfile.ZipFile(path, "r") as zip_ref:
-                zip_ref.extractall(temp_dir)
+            atomic_unzip(path, temp_dir)
         if len(os.listdir(temp_dir)) == 1:  # a directory was zipped v files
             temp_dir = os.path.join(temp_dir, os.listdir(temp_dir)[0])
         path = os.path.join(temp_dir, [x[:-6] for x in os.listdir(temp_dir) if 'index' in x][0])
@@ -1618,15 +1857,12 @@ def unzip_files(zip_path):
         return zip_path
     from baseline.mime_type import mime_type
     if mime_type(zip_path) == 'application/zip':
-        with open(zip_path, 'rb') as f:
-            sha1 = hashlib.sha1(f.read()).hexdigest()
-            temp_dir = os.path.join("/tmp/", sha1)
-            if not os.path.exists(temp_dir):
-                logger.info("unzipping model")
-                with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                    zip_ref.extractall(temp_dir)
-            if len(os.listdir(temp_dir)) == 1:  # a directory was zipped v files
-                temp_dir = os.path.join(temp_dir, os.listdir(temp_dir)[0])
+        temp_dir = os.path.join("/tmp/", file_sha1(zip_path))
+        if not os.path.exists(temp_dir):
+            logger.info("unzipping model")
+            atomic_unzip(zip_path, temp_dir)
+        if len(os.listdir(temp_dir)) == 1:  # a directory was zipped v files
+            temp_dir = os.path.join(temp_dir, os.listdir(temp_dir)[0])
         return temp_dir
     return zip_path
 
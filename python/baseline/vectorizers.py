@@ -1,4 +1,6 @@
+import six
 import numpy as np
+from itertools import chain, repeat
 from baseline.utils import export, optional_params, listify, register, Offsets
 import collections
 
@@ -25,6 +27,26 @@ class Vectorizer(object):
     def iterable(self, tokens):
         pass
 
+    def run_batch(self, batch_tokens, vocab):
+        """Vectorize a batch of examples
+
+        This gives the same results as calling `run` on each example and stacking them.  This version does exactly
+        that, sub-classes can do it all at once
+
+        :param batch_tokens: A list of examples, each a list of tokens
+        :param vocab: The vocab
+        :return: (``np.ndarray``) The stacked vectors and (``np.ndarray``) the lengths, or `None` if `run` gives none
+        """
+        vecs = []
+        lengths = []
+        for tokens in batch_tokens:
+            vec, length = self.run(tokens, vocab)
+            vecs.append(vec)
+            lengths.append(length)
+        if len(vecs) == 0:
+            return np.zeros((0,) + tuple(self.get_dims()), dtype=int), np.zeros(0, dtype=int)
+        return np.stack(vecs), None if lengths[0] is None else np.array(lengths)
+
 BASELINE_VECTORIZERS = {}
 
 
@@ -51,6 +73,14 @@ class AbstractVectorizer(Vectorizer):
         for tok in tokens:
             yield self.transform_fn(tok)
 
+    def _atoms(self, batch_tokens):
+        """Get the list of atoms from `iterable` for each example in a batch"""
+        if type(self).iterable is AbstractVectorizer.iterable:
+            if self.transform_fn is identity_trans_fn:
+                return [tokens if isinstance(tokens, list) else list(tokens) for tokens in batch_tokens]
+            return [list(map(self.transform_fn, tokens)) for tokens in batch_tokens]
+        return [list(self.iterable(tokens)) for tokens in batch_tokens]
+
     def _next_element(self, tokens, vocab):
         for atom in self.iterable(tokens):
             value = vocab.get(atom)
@@ -99,6 +129,44 @@ class Token1DVectorizer(AbstractVectorizer):
             return vec1d, None
         return vec1d, valid_length
 
+    def run_batch(self, batch_tokens, vocab):
+        """Vectorize a batch of examples at once
+
+        All of the tokens in the batch are looked up in the vocab in one pass and scattered into a single
+        output array.  The results are the same as `run` on each example
+
+        :param batch_tokens: A list of examples, each a list of tokens
+        :param vocab: The vocab
+        :return: (``np.ndarray``) The `[B, mxlen]` vectors and (``np.ndarray``) the `[B]` lengths (`None` if reversed)
+        """
+        if type(self).run is not Token1DVectorizer.run:
+            return super(Token1DVectorizer, self).run_batch(batch_tokens, vocab)
+        if self.mxlen < 0:
+            self.mxlen = self.max_seen
+
+        atoms = self._atoms(batch_tokens)
+        counts = np.fromiter(map(len, atoms), dtype=np.int64, count=len(atoms))
+        unk = vocab.get('<UNK>', -1)
+        # Without an <UNK> an example stops at its first OOV token, find these with a value that can't be an index
+        missing = unk if unk != -1 else np.iinfo(np.int64).min
+        ids = np.fromiter(map(vocab.get, chain.from_iterable(atoms), repeat(missing)), dtype=np.int64)
+
+        example = np.repeat(np.arange(len(atoms)), counts)
+        pos = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+        seen = counts.copy()
+        if unk == -1:
+            oov = ids == missing
+            np.minimum.at(seen, example[oov], pos[oov])
+        limit = np.minimum(seen, self.mxlen)
+        keep = pos < limit[example]
+
+        vecs = np.zeros((len(atoms), self.mxlen), dtype=int)
+        vecs[example[keep], pos[keep]] = ids[keep]
+        if self.time_reverse:
+            return vecs[:, ::-1], None
+        # An empty example still reports a length of 1 in `run`
+        return vecs, np.where(seen == 0, 1, limit)
+
     def get_dims(self):
         return self.mxlen,
 
@@ -123,6 +191,14 @@ class GOVectorizer(Vectorizer):
         vec1d[valid_length+1] = Offsets.EOS
         return vec1d, valid_length + 2
 
+    def run_batch(self, batch_tokens, vocab):
+        vecs, lengths = self.vectorizer.run_batch(batch_tokens, vocab)
+        B = len(vecs)
+        vecs = np.concatenate([np.full((B, 1), Offsets.GO, dtype=vecs.dtype), vecs,
+                               np.full((B, 1), Offsets.PAD, dtype=vecs.dtype)], axis=1)
+        vecs[np.arange(B), lengths + 1] = Offsets.EOS
+        return vecs, lengths + 2
+
     def get_dims(self):
         return self.vectorizer.get_dims()[0] + 2,
 
@@ -166,6 +242,24 @@ class AbstractCharVectorizer(AbstractVectorizer):
             yield EOW
 
 
+def _char_ids(words, vocab, oov):
+    """Look up all of the characters in a list of words
+
+    For strings, each distinct code point is looked up once and then mapped back to every character
+
+    :param words: A list of words
+    :param vocab: The character vocab
+    :param oov: The id for characters not in the vocab
+    :return: (``np.ndarray``) The id of each character, in order
+    """
+    if all(isinstance(word, six.text_type) for word in words):
+        codes = np.frombuffer(u''.join(words).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        unique, inverse = np.unique(codes, return_inverse=True)
+        table = np.fromiter((vocab.get(six.unichr(c), oov) for c in unique), dtype=np.int64, count=len(unique))
+        return table[inverse]
+    return np.fromiter(map(vocab.get, chain.from_iterable(words), repeat(oov)), dtype=np.int64)
+
+
 @exporter
 @register_vectorizer(name='char2d')
 class Char2DVectorizer(AbstractCharVectorizer):
@@ -225,6 +319,54 @@ class Char2DVectorizer(AbstractCharVectorizer):
         valid_length = i
         return vec2d, valid_length
 
+    def run_batch(self, batch_tokens, vocab):
+        """Vectorize a batch of examples at once
+
+        The characters of the whole batch are looked up in one pass, with an end of word id after each token.  Each
+        run of characters between end of word ids fills a row (up to `mxwlen` characters), which is how `run` reads
+        the same stream, so the results are the same as `run` on each example
+
+        :param batch_tokens: A list of examples, each a list of tokens
+        :param vocab: The vocab
+        :return: (``np.ndarray``) The `[B, mxlen, mxwlen]` vectors and (``np.ndarray``) the `[B]` lengths
+        """
+        if type(self).run is not Char2DVectorizer.run:
+            return super(Char2DVectorizer, self).run_batch(batch_tokens, vocab)
+        if self.mxlen < 0:
+            self.mxlen = self.max_seen_tok
+        if self.mxwlen < 0:
+            self.mxwlen = self.max_seen_char
+
+        OOV = vocab['<UNK>']
+        EOW = vocab.get('<EOW>', vocab.get(' ', Offsets.PAD))
+        words = self._atoms(batch_tokens)
+        B = len(words)
+        num_words = np.fromiter(map(len, words), dtype=np.int64, count=B)
+        words = list(chain.from_iterable(words))
+        word_lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        chars = _char_ids(words, vocab, OOV)
+        stream = np.insert(chars, np.cumsum(word_lengths), EOW)
+
+        # Each example's stream is its characters plus an EOW per word
+        word_ends = np.concatenate([[0], np.cumsum(word_lengths + 1)])
+        last_word = np.cumsum(num_words)
+        example = np.repeat(np.arange(B), word_ends[last_word] - word_ends[last_word - num_words])
+
+        is_eow = stream == EOW
+        eow_positions = np.flatnonzero(is_eow)
+        segment = np.cumsum(is_eow) - is_eow
+        segment_start = np.concatenate([[0], eow_positions[:-1] + 1]).astype(np.int64)
+        segments = np.bincount(example[is_eow], minlength=B)
+        first_segment = np.cumsum(segments) - segments
+
+        row = segment - first_segment[example]
+        col = np.arange(len(stream)) - segment_start[segment]
+        keep = ~is_eow & (row < self.mxlen) & (col < self.mxwlen)
+
+        vecs = np.zeros((B, self.mxlen, self.mxwlen), dtype=int)
+        vecs[example[keep], row[keep], col[keep]] = stream[keep]
+        return vecs, np.minimum(segments, self.mxlen)
+
     def get_dims(self):
         return self.mxlen, self.mxwlen
 
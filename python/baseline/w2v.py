@@ -1,10 +1,14 @@
 import io
+import os
+import json
+import bisect
+import shutil
 import logging
 import collections
 import contextlib
 import copy
 import numpy as np
-from baseline.utils import export, write_json, read_config_file, Offsets
+from baseline.utils import export, write_json, read_json, read_config_file, Offsets
 from baseline.mime_type import mime_type
 __all__ = []
 exporter = export(__all__)
@@ -63,6 +67,80 @@ def write_word2vec_file(filename, vocab, word_vectors):
             f.write(bytes('{} '.format(word), encoding='utf-8') + vec_str)
 
 
+BINARY_WEIGHTS = 'weights.f32'
+BINARY_VOCAB = 'vocab.json'
+BINARY_META = 'meta.json'
+
+
+def _iter_word2vec_file(filename):
+    with io.open(filename, "rb") as f:
+        header = f.readline()
+        vsz, dsz = map(int, header.split())
+        width = 4 * dsz
+        for i in range(vsz):
+            word = PretrainedEmbeddingsModel._readtospc(f)
+            yield word, np.frombuffer(f.read(width), dtype=np.float32)
+
+
+def _iter_text_file(filename):
+    with io.open(filename, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            values = line.rstrip("\n ").split(" ")
+            if i == 0 and len(values) == 2:
+                continue
+            yield values[0], np.asarray(values[1:], dtype=np.float32)
+
+
+@exporter
+def is_binary_embeddings(filename):
+    """Is this a directory written by `convert_embeddings`
+
+    :param filename: (`str`) The path to check
+    :return: (`bool`) True if it is in the binary format
+    """
+    return os.path.isdir(filename) and os.path.exists(os.path.join(filename, BINARY_META))
+
+
+@exporter
+def convert_embeddings(filename, target=None):
+    """Convert a word2vec or GloVe file to a binary directory that can be memory-mapped
+
+    The directory holds the vectors as one contiguous float32 matrix (rows in file order),
+    the vocab sorted with the row of each word, and a small metadata file.  As with the other
+    readers only the first vector for a word is kept.  Loading it with `PretrainedEmbeddingsModel`
+    only touches the rows for the `known_vocab`, which are found by binary search of the vocab.
+
+    :param filename: (`str`) A word2vec binary or GloVe text file
+    :param target: (`str`) The output directory, defaults to `filename + '.bemb'`
+    :return: (`str`) The output directory
+    """
+    target = filename + '.bemb' if target is None else target
+    iter_fn = _iter_text_file if mime_type(filename) == 'text/plain' else _iter_word2vec_file
+    tmp = '{}.tmp{}'.format(target, os.getpid())
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    rows = {}
+    dsz = None
+    with io.open(os.path.join(tmp, BINARY_WEIGHTS), 'wb') as f:
+        for word, vec in iter_fn(filename):
+            if word in rows:
+                continue
+            if dsz is None:
+                dsz = len(vec)
+            rows[word] = len(rows)
+            f.write(vec.astype(np.float32).tobytes())
+    words = sorted(rows)
+    with io.open(os.path.join(tmp, BINARY_VOCAB), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'words': words, 'rows': [rows[w] for w in words]}, ensure_ascii=False))
+    write_json({'vsz': len(rows), 'dsz': dsz, 'dtype': 'float32', 'source': os.path.basename(filename)},
+               os.path.join(tmp, BINARY_META))
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.rename(tmp, target)
+    return target
+
+
 @exporter
 class EmbeddingsModel(object):
     def __init__(self):
@@ -168,22 +246,27 @@ class PretrainedEmbeddingsModel(WordEmbeddingsModel):
         special_tokens = [self.nullv]
         for i in range(1, len(Offsets.VALUES)):
             special_tokens.append(np.random.uniform(-uw, uw, self.dsz).astype(np.float32))
-        word_vectors = special_tokens + word_vectors
         # Add "well-known" values to the vocab
         for i, name in enumerate(Offsets.VALUES):
             self.vocab[name] = i
 
+        unknown_vectors = []
+
         if known_vocab is not None:
             # Remove "well-known" values
             for name in Offsets.VALUES:
                 known_vocab.pop(name, 0)
             unknown = {v: cnt for v, cnt in known_vocab.items() if cnt > 0}
             for v in unknown:
-                word_vectors.append(np.random.uniform(-uw, uw, self.dsz).astype(np.float32))
+                unknown_vectors.append(np.random.uniform(-uw, uw, self.dsz).astype(np.float32))
                 self.vocab[v] = idx
                 idx += 1
 
-        self.weights = np.array(word_vectors)
+        self.weights = np.concatenate([
+            np.stack(special_tokens),
+            np.asarray(word_vectors, dtype=np.float32).reshape(-1, self.dsz),
+            np.asarray(unknown_vectors, dtype=np.float32).reshape(-1, self.dsz)
+        ])
         if normalize is True:
             self.weights = norm_weights(self.weights)
 
@@ -191,6 +274,15 @@ class PretrainedEmbeddingsModel(WordEmbeddingsModel):
         assert self.weights.dtype == np.float32
 
     def _read_vectors(self, filename, idx, known_vocab, keep_unused, **kwargs):
+        if kwargs.get('use_binary', False) and not is_binary_embeddings(filename):
+            target = filename + '.bemb'
+            meta = os.path.join(target, BINARY_META)
+            if not os.path.exists(meta) or os.path.getmtime(meta) < os.path.getmtime(filename):
+                logger.info('Converting %s to binary embeddings at %s', filename, target)
+                convert_embeddings(filename, target)
+            filename = target
+        if is_binary_embeddings(filename):
+            return self._read_binary(filename, idx, known_vocab, keep_unused)
         use_mmap = bool(kwargs.get('use_mmap', False))
         read_fn = self._read_word2vec_file
         is_glove_file = mime_type(filename) == 'text/plain'
@@ -204,6 +296,31 @@ class PretrainedEmbeddingsModel(WordEmbeddingsModel):
 
         return read_fn(filename, idx, known_vocab, keep_unused)
 
+    def _read_binary(self, filename, idx, known_vocab, keep_unused):
+        meta = read_json(os.path.join(filename, BINARY_META), strict=True)
+        vsz, dsz = meta['vsz'], meta['dsz']
+        with io.open(os.path.join(filename, BINARY_VOCAB), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        words, rows = index['words'], index['rows']
+        if keep_unused is True or not known_vocab:
+            found = sorted(zip(rows, words))
+        else:
+            found = []
+            for word in known_vocab:
+                i = bisect.bisect_left(words, word)
+                if i < len(words) and words[i] == word:
+                    found.append((rows[i], word))
+            # Keep the file order so the indices match the other readers
+            found.sort()
+        for _, word in found:
+            if known_vocab and word in known_vocab:
+                known_vocab[word] = 0
+            self.vocab[word] = idx
+            idx += 1
+        weights = np.memmap(os.path.join(filename, BINARY_WEIGHTS), dtype=np.float32, mode='r', shape=(vsz, dsz))
+        word_vectors = np.asarray(weights[[row for row, _ in found]])
+        return word_vectors, dsz, known_vocab, idx
+
     def _read_word2vec_file(self, filename, idx, known_vocab, keep_unused):
         word_vectors = []
         with io.open(filename, "rb") as f:
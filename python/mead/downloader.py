@@ -1,4 +1,5 @@
-from six.moves.urllib.request import urlretrieve
+from six.moves.urllib.request import Request, urlopen
+from six.moves.urllib.error import HTTPError
 
 import os
 import re
@@ -8,9 +9,16 @@ import tarfile
 import zipfile
 import hashlib
 import shutil
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 from baseline.mime_type import mime_type
 from baseline.progress import create_progress_bar
-from baseline.utils import export, read_json, write_json, validate_url
+from baseline.utils import export, read_json, write_json, validate_url, file_sha1
 
 __all__ = []
 exporter = export(__all__)
@@ -60,48 +68,187 @@ def extract_zip(file_loc):
 
 
 @exporter
-def extractor(filepath, cache_dir, extractor_func):
-    with open(filepath, 'rb') as f:
-        sha1 = hashlib.sha1(f.read()).hexdigest()
+def extractor(filepath, cache_dir, extractor_func, sha1=None):
+    # The download is a one off temp file so there is no point caching its hash
+    sha1 = file_sha1(filepath, cache=False) if sha1 is None else sha1
     logger.info("extracting file..")
     path_to_save = filepath if extractor_func is None else extractor_func(filepath)
     if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
     path_to_save_sha1 = os.path.join(cache_dir, sha1)
+    # Move it into the cache dir under a temp name first (this can be a copy across file systems) so that
+    # the final rename is atomic and other processes never see a partial copy
+    tmp_path = os.path.join(cache_dir, '.{}-{}'.format(sha1, os.getpid()))
+    delete_old_copy(tmp_path)
+    shutil.move(path_to_save, tmp_path)
     delete_old_copy(path_to_save_sha1)
-    shutil.move(path_to_save, path_to_save_sha1)
+    try:
+        os.rename(tmp_path, path_to_save_sha1)
+    except OSError:
+        # Another process put the same data in place first
+        if not os.path.exists(path_to_save_sha1):
+            raise
+        delete_old_copy(tmp_path)
     logger.info("downloaded data saved in {}".format(path_to_save_sha1))
     return path_to_save_sha1
 
 
 @exporter
-def web_downloader(url):
-    # Use a class to simulate the nonlocal keyword in 2.7
-    class Context:
-        pg = None
-
-    def _report_hook(count, block_size, total_size):
-        if Context.pg is None:
-            length = int((total_size + block_size - 1) / float(block_size)) if total_size != -1 else 1
-            Context.pg = create_progress_bar(length)
-        Context.pg.update()
-
-    path_to_save = "/tmp/data.dload-{}".format(os.getpid())
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `path` (created if needed) for the duration of the block
+
+    This is an advisory `flock`, so it works across processes (and threads that open the file separately).  On
+    platforms without `fcntl` there is no locking.
+
+    :param path: (`str`) The lock file
+    """
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@exporter
+def fetch_url(url, path, sha1=None, chunk_size=1 << 16):
+    """Download `url` to `path`, hashing it as it is written
+
+    If `path` already holds the start of the file (from a download that was cut off) only the rest is requested
+    with an HTTP range request.  If the server doesn't support ranges the download starts over.  The partial file is
+    kept when the connection fails so the next call can resume it.
+
+    :param url: (`str`) The URL to download
+    :param path: (`str`) Where to write the file
+    :param sha1: (`str`) The expected SHA1, if given a mismatch deletes the file and raises a `RuntimeError`
+    :param chunk_size: (`int`) How many bytes to read at a time
+    :return: (`str`) The SHA1 of the file
+    """
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    request = Request(url)
+    if offset:
+        request.add_header('Range', 'bytes={}-'.format(offset))
+    response = None
     try:
-        path_to_save, _ = urlretrieve(url, path_to_save, reporthook=_report_hook)
-        Context.pg.done()
+        response = urlopen(request)
+    except HTTPError as e:
+        # 416 means there is nothing past what we already have
+        if e.code != 416 or not offset:
+            raise RuntimeError("failed to download data from [url]: {} [to]: {}".format(url, path))
     except Exception:  # this is too broad but there are too many exceptions to handle separately
-        raise RuntimeError("failed to download data from [url]: {} [to]: {}".format(url, path_to_save))
+        raise RuntimeError("failed to download data from [url]: {} [to]: {}".format(url, path))
+    if response is not None and offset and response.getcode() != 206:
+        logger.info("server doesn't support resuming downloads, starting {} over".format(url))
+        offset = 0
+
+    digest = hashlib.sha1()
+    if offset:
+        logger.info("resuming download of {} from byte {}".format(url, offset))
+        with open(path, 'rb') as f:
+            for chunk in iter(partial(f.read, chunk_size), b''):
+                digest.update(chunk)
+    if response is not None:
+        length = response.headers.get('Content-Length')
+        pg = create_progress_bar((int(length) + chunk_size - 1) // chunk_size if length else 1)
+        received = 0
+        try:
+            with open(path, 'ab' if offset else 'wb') as f:
+                for chunk in iter(partial(response.read, chunk_size), b''):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    received += len(chunk)
+                    pg.update()
+        except Exception:
+            raise RuntimeError("failed to download data from [url]: {} [to]: {}".format(url, path))
+        finally:
+            response.close()
+        # A dropped connection can look like the end of the file
+        if length and received < int(length):
+            raise RuntimeError("failed to download data from [url]: {} [to]: {}".format(url, path))
+        pg.done()
+    digest = digest.hexdigest()
+    if sha1 is not None and digest != sha1:
+        delete_old_copy(path)
+        raise RuntimeError("The sha1 of the downloaded file does not match with the provided one")
+    return digest
+
+
+@exporter
+def web_downloader(url, path_to_save=None):
+    if path_to_save is None:
+        path_to_save = delete_old_copy("/tmp/data.dload-{}".format(os.getpid()))
+    fetch_url(url, path_to_save)
     return path_to_save
 
 
+def _edit_cache(data_download_cache, url, path=None):
+    """Add (or with no `path` remove) an entry in the cache json, which several processes can be updating at once"""
+    dcache_path = os.path.join(data_download_cache, DATA_CACHE_CONF)
+    if path is None and not os.path.exists(dcache_path):
+        return
+    with file_lock('{}.lock'.format(dcache_path)):
+        dcache = read_json(dcache_path)
+        if path is None:
+            if url not in dcache:
+                return
+            del dcache[url]
+        else:
+            dcache[url] = path
+        tmp_path = '{}.{}'.format(dcache_path, os.getpid())
+        write_json(dcache, tmp_path)
+        os.rename(tmp_path, dcache_path)
+
+
+@exporter
+def download_to_cache(url, data_download_cache, sha1=None, use_cache=True):
+    """Download `url` into the cache, extracting it if it's an archive
+
+    The data ends up at `<data_download_cache>/<sha1 of the download>`, and the cache json maps `url` to it.  A lock
+    file per URL makes sure parallel jobs only download it once: whoever gets the lock second finds it in the cache.
+    An interrupted download is resumed by the next call.
+
+    :param url: (`str`) The URL to download
+    :param data_download_cache: (`str`) The cache dir
+    :param sha1: (`str`) The expected SHA1 of the download
+    :param use_cache: (`bool`) Use a copy that is already in the cache
+    :return: (`str`) The location of the data in the cache
+    """
+    if not os.path.exists(data_download_cache):
+        try:
+            os.makedirs(data_download_cache)
+        except OSError:
+            if not os.path.isdir(data_download_cache):
+                raise
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    with file_lock(os.path.join(data_download_cache, '.{}.lock'.format(key))):
+        if use_cache:
+            dcache = read_json(os.path.join(data_download_cache, DATA_CACHE_CONF))
+            if url in dcache and os.path.exists(dcache[url]):
+                logger.info("file for {} found in cache, not downloading".format(url))
+                return dcache[url]
+        logger.info("using {} as data/embeddings cache".format(data_download_cache))
+        part_file = os.path.join(data_download_cache, '.{}.part'.format(key))
+        digest = fetch_url(url, part_file, sha1)
+        dload_file = extractor(filepath=part_file, cache_dir=data_download_cache,
+                               extractor_func=Downloader.ZIPD.get(mime_type(part_file), None), sha1=digest)
+        # The archive (and any intermediate files) are left behind when it was extracted
+        for f in os.listdir(data_download_cache):
+            if f.startswith('.{}.part'.format(key)):
+                delete_old_copy(os.path.join(data_download_cache, f))
+        _edit_cache(data_download_cache, url, dload_file)
+    return dload_file
+
+
 @exporter
 def update_cache(key, data_download_cache):
-    dcache = read_json(os.path.join(data_download_cache, DATA_CACHE_CONF))
-    if key not in dcache:
-        return
-    del dcache[key]
-    write_json(dcache, os.path.join(data_download_cache, DATA_CACHE_CONF))
+    _edit_cache(data_download_cache, key)
 
 
 def _verify_file(file_loc):
@@ -199,24 +346,18 @@ class SingleFileDownloader(Downloader):
                 logger.info("file for {} found in cache, not downloading".format(url))
                 return dcache[url]
             else:  # download the file in the cache, update the json
-                cache_dir = self.data_download_cache
-                logger.info("using {} as data/embeddings cache".format(cache_dir))
-                temp_file = web_downloader(url)
-                dload_file = extractor(filepath=temp_file, cache_dir=cache_dir,
-                                       extractor_func=Downloader.ZIPD.get(mime_type(temp_file), None))
-                dcache.update({url: dload_file})
-                write_json(dcache, os.path.join(self.data_download_cache, DATA_CACHE_CONF))
-                return dload_file
+                return download_to_cache(url, self.data_download_cache, use_cache=not self.cache_ignore)
         raise RuntimeError("the file [{}] is not in cache and can not be downloaded".format(file_loc))
 
 
 @exporter
 class DataDownloader(Downloader):
-    def __init__(self, dataset_desc, data_download_cache, enc_dec=False, cache_ignore=False):
+    def __init__(self, dataset_desc, data_download_cache, enc_dec=False, cache_ignore=False, max_workers=4):
         super(DataDownloader, self).__init__(data_download_cache, cache_ignore)
         self.dataset_desc = dataset_desc
         self.data_download_cache = data_download_cache
         self.enc_dec = enc_dec
+        self.max_workers = max_workers
 
     def download(self):
         dload_bundle = self.dataset_desc.get("download", None)
@@ -234,22 +375,22 @@ class DataDownloader(Downloader):
                 if not validate_url(dload_bundle):
                     raise RuntimeError("can not download from the given url")
                 else:
-                    cache_dir = self.data_download_cache
-                    temp_file = web_downloader(dload_bundle)
-
-                    download_dir = extractor(filepath=temp_file, cache_dir=cache_dir,
-                                             extractor_func=Downloader.ZIPD.get(mime_type(temp_file), None))
-                    if "sha1" in self.dataset_desc:
-                        if os.path.split(download_dir)[-1] != self.dataset_desc["sha1"]:
-                            raise RuntimeError("The sha1 of the downloaded file does not match with the provided one")
-                    dcache.update({dload_bundle: download_dir})
-                    write_json(dcache, os.path.join(self.data_download_cache, DATA_CACHE_CONF))
+                    download_dir = download_to_cache(
+                        dload_bundle, self.data_download_cache, self.dataset_desc.get("sha1"),
+                        use_cache=not self.cache_ignore
+                    )
                     return {k: os.path.join(download_dir, self.dataset_desc[k]) for k in self.dataset_desc
                             if k.endswith("_file")}
         else:  # we have download links to every file or they exist
             if not self.enc_dec:
-                    return {k: SingleFileDownloader(self.dataset_desc[k], self.data_download_cache).download()
-                        for k in self.dataset_desc if k.endswith("_file") and self.dataset_desc[k]}
+                # Fetch the files at the same time
+                keys = [k for k in self.dataset_desc if k.endswith("_file") and self.dataset_desc[k]]
+                with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(keys)))) as pool:
+                    futures = {
+                        k: pool.submit(SingleFileDownloader(self.dataset_desc[k], self.data_download_cache).download)
+                        for k in keys
+                    }
+                return {k: future.result() for k, future in futures.items()}
             else:
                 return {k: self.dataset_desc[k] for k in self.dataset_desc if k.endswith("_file")}
                 # these files can not be downloaded because there's a post processing on them.
@@ -293,13 +434,5 @@ class EmbeddingDownloader(Downloader):
             if not validate_url(url):
                 raise RuntimeError("can not download from the given url")
             else:
-                cache_dir = self.data_download_cache
-                temp_file = web_downloader(url)
-                download_loc = extractor(filepath=temp_file, cache_dir=cache_dir,
-                                         extractor_func=Downloader.ZIPD.get(mime_type(temp_file), None))
-                if self.sha1 is not None:
-                    if os.path.split(download_loc)[-1] != self.sha1:
-                        raise RuntimeError("The sha1 of the downloaded file does not match with the provided one")
-                dcache.update({url: download_loc})
-                write_json(dcache, os.path.join(self.data_download_cache, DATA_CACHE_CONF))
+                download_loc = download_to_cache(url, self.data_download_cache, self.sha1, use_cache=not self.cache_ignore)
                 return self._get_embedding_file(download_loc, self.embedding_key)
@@ -0,0 +1,306 @@
+"""A local server for PyTorch models exported with `mead-export`
+
+It speaks the same REST `:predict` protocol that `RemoteModelRESTPytorch` sends, so an exported bundle can be served
+on CPU without TF-Serving:
+
+```
+mead-serve-pytorch --model tagger=models/server/tagger --port 8501 --workers 4
+```
+
+Requests for a model are batched across connections with a `BatchingService`.  When there is more than one worker,
+the listening socket is opened once and shared by worker processes, each with its own copy of the models and
+`threads` intra-op threads.
+"""
+import os
+import re
+import sys
+import signal
+import json
+import logging
+import argparse
+import multiprocessing
+import numpy as np
+import torch
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from baseline.utils import export
+from baseline.services import BatchingService
+from mead.utils import convert_path, configure_logger
+
+
+__all__ = []
+exporter = export(__all__)
+DEFAULT_LOGGING_LOC = 'config/logging.json'
+logger = logging.getLogger('mead')
+
+PREDICT_PATH = re.compile(r'^/v1/models/(?P<name>[^/:]+)(?:/versions/(?P<version>\d+))?:predict$')
+STATS_PATH = re.compile(r'^/v1/models/(?P<name>[^/:]+)/stats$')
+
+
+@exporter
+def find_torchscript_model(path):
+    """Find the `model.pt` in an export
+
+    :param path: (`str`) The `model.pt` file, a version dir that holds one, or the dir above the versions (the
+        latest version is used)
+    :return: (`str`) The path to the `model.pt`
+    """
+    if os.path.isfile(path):
+        return path
+    model_file = os.path.join(path, 'model.pt')
+    if os.path.isfile(model_file):
+        return model_file
+    versions = [d for d in os.listdir(path) if d.isdigit() and os.path.isfile(os.path.join(path, d, 'model.pt'))]
+    if not versions:
+        raise ValueError("No model.pt found in {}".format(path))
+    return os.path.join(path, max(versions, key=int), 'model.pt')
+
+
+@exporter
+class TorchScriptModel(object):
+    """Run a traced `ExportingTagger` or `ExportingClassifier` over a batch of single examples
+
+    The examples can come from different requests so they are padded (with `Offsets.PAD`) to the longest in the batch
+    before the model is run once over all of them.  RNN encoders pack the batch, which needs it sorted by length, so
+    the examples are run longest first and the outputs are put back in the order they came in.
+    """
+
+    def __init__(self, model):
+        """Wrap a model
+
+        :param model: A loaded TorchScript model that takes a tuple of features and the lengths
+        """
+        self.model = model
+
+    @classmethod
+    def load(cls, path):
+        """Load a model for inference on the CPU
+
+        :param path: (`str`) A path that `find_torchscript_model` understands
+        :return: (`TorchScriptModel`) The model
+        """
+        model = torch.jit.load(find_torchscript_model(path), map_location='cpu')
+        model.eval()
+        return cls(model)
+
+    @staticmethod
+    def pad(features):
+        """Stack the examples for each feature into one array
+
+        :param features: `List[np.ndarray]` One example of a feature (without the batch dim) each
+        :return: (`np.ndarray`) The zero padded batch
+        """
+        shape = np.max([f.shape for f in features], axis=0)
+        batch = np.zeros([len(features)] + shape.tolist(), dtype=features[0].dtype)
+        for i, f in enumerate(features):
+            batch[(i,) + tuple(slice(0, s) for s in f.shape)] = f
+        return batch
+
+    def predict(self, examples, signature_name='tag_text'):
+        """Run the model on a batch
+
+        :param examples: `List[Tuple[Tuple[np.ndarray], int]]` The features and length of each example
+        :param signature_name: (`str`) `tag_text` or `predict_text`, which decides how the outputs are read
+        :return: `List[dict]` The `classes` (and `scores`) for each example
+        """
+        if signature_name not in ('tag_text', 'predict_text'):
+            raise ValueError("Unsupported signature {}".format(signature_name))
+        order = np.argsort([-length for _, length in examples], kind='stable')
+        batch = [examples[i] for i in order]
+        num_features = len(batch[0][0])
+        features = tuple(
+            torch.from_numpy(self.pad([features[i] for features, _ in batch])) for i in range(num_features)
+        )
+        lengths = torch.LongTensor([length for _, length in batch])
+        with torch.no_grad():
+            outputs = self.model(features, lengths)
+        results = [None] * len(examples)
+        if signature_name == 'tag_text':
+            # The paths are [T, B]
+            classes = outputs.transpose(0, 1).numpy()
+            for j, i in enumerate(order):
+                results[i] = {'classes': classes[j, :examples[i][0][0].shape[0]]}
+        else:
+            scores = torch.softmax(outputs, dim=-1).numpy()
+            classes = np.arange(scores.shape[1])
+            for j, i in enumerate(order):
+                results[i] = {'classes': classes, 'scores': scores[j]}
+        return results
+
+
+def parse_request(request):
+    """Split a request from `RemoteModelRESTPytorch` into single examples
+
+    :param request: (`dict`) The request JSON
+    :return: `List[Tuple[Tuple[np.ndarray], int]]` The features and length of each example
+    """
+    inputs = request['inputs']
+    features = [np.array(data).reshape(shape) for data, shape in zip(inputs['data'], inputs['shapes'])]
+    return [(tuple(f[i] for f in features), length) for i, length in enumerate(inputs['lengths'])]
+
+
+def create_response(results):
+    """Merge the results for the examples of a request
+
+    :param results: `List[dict]` The output of `TorchScriptModel.predict` for each example
+    :return: (`dict`) The response JSON
+    """
+    outputs = {}
+    for k in results[0]:
+        outputs[k] = np.stack([r[k] for r in results]).tolist()
+    return {'outputs': outputs}
+
+
+class _PredictHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _send(self, code, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        match = STATS_PATH.match(self.path)
+        if match is None or match.group('name') not in self.server.models:
+            return self._send(404, {'error': 'Unknown path {}'.format(self.path)})
+        stats = self.server.models[match.group('name')].stats()
+        stats['pid'] = os.getpid()
+        self._send(200, stats)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        match = PREDICT_PATH.match(self.path)
+        if match is None or match.group('name') not in self.server.models:
+            return self._send(404, {'error': 'Unknown model for {}'.format(self.path)})
+        try:
+            request = json.loads(body.decode('utf-8'))
+            examples = parse_request(request)
+            signature_name = request.get('signature_name', 'tag_text')
+            results = self.server.models[match.group('name')].predict(examples, signature_name=signature_name)
+            response = create_response(results)
+        except Exception as e:
+            logger.exception('Prediction failed')
+            return self._send(400, {'error': str(e)})
+        self._send(200, response)
+
+
+@exporter
+class TorchScriptServer(ThreadingMixIn, HTTPServer):
+    """An HTTP server for `TorchScriptModel`s, each connection is handled in its own thread"""
+    daemon_threads = True
+
+    def __init__(self, address, models=None, bind_and_activate=True):
+        """Create the server
+
+        :param address: `Tuple[str, int]` The host and port to listen on
+        :param models: `dict[str] -> BatchingService` The models by name, these can be set after the fork
+        :param bind_and_activate: (`bool`) Open the socket now
+        """
+        HTTPServer.__init__(self, address, _PredictHandler, bind_and_activate)
+        self.models = models if models is not None else {}
+
+
+@exporter
+def load_models(model_paths, max_batch_size=32, max_latency_ms=5):
+    """Load each model behind its own `BatchingService`
+
+    :param model_paths: `dict[str] -> str` The path to each model by name
+    :param max_batch_size: (`int`) The max number of examples to run at once
+    :param max_latency_ms: (`float`) How long to wait for more requests to batch
+    :return: `dict[str] -> BatchingService` The models
+    """
+    models = {}
+    for name, path in model_paths.items():
+        logger.info("Loading %s from %s", name, path)
+        models[name] = BatchingService(TorchScriptModel.load(path), max_batch_size, max_latency_ms)
+    return models
+
+
+def set_threads(threads):
+    """Use `threads` intra-op threads and a single inter-op thread in this process"""
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # This can only be set before any parallel work has run
+        pass
+
+
+def _worker(server, model_paths, threads, max_batch_size, max_latency_ms):
+    set_threads(threads)
+    server.models = load_models(model_paths, max_batch_size, max_latency_ms)
+    logger.info("Worker %d serving on %s:%d", os.getpid(), *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@exporter
+def serve(model_paths, host='0.0.0.0', port=8501, workers=1, threads=None, max_batch_size=32, max_latency_ms=5):
+    """Serve the models until interrupted
+
+    :param model_paths: `dict[str] -> str` The path to each model by name
+    :param host: (`str`) The interface to listen on
+    :param port: (`int`) The port to listen on
+    :param workers: (`int`) How many worker processes to run
+    :param threads: (`int`) The intra-op threads for each worker, defaults to splitting the CPUs between the workers
+    :param max_batch_size: (`int`) The max number of examples to run at once
+    :param max_latency_ms: (`float`) How long to wait for more requests to batch
+    """
+    if threads is None:
+        threads = max(1, multiprocessing.cpu_count() // workers)
+    server = TorchScriptServer((host, port))
+    logger.info("Serving %s with %d worker(s) and %d thread(s) each", ', '.join(model_paths), workers, threads)
+    if workers == 1:
+        return _worker(server, model_paths, threads, max_batch_size, max_latency_ms)
+    # Fork before loading anything so each worker sets up its own torch thread pool
+    ctx = multiprocessing.get_context('fork')
+    procs = [
+        ctx.Process(target=_worker, args=(server, model_paths, threads, max_batch_size, max_latency_ms))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    server.socket.close()
+    # Take the workers down with us when we are stopped
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+            p.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve exported PyTorch models over REST')
+    parser.add_argument('--model', help='name=path for each model to serve, the path is a model.pt, a version dir or '
+                                        'the dir of versions (the latest is used)', nargs='+', required=True)
+    parser.add_argument('--host', help='interface to listen on', default='0.0.0.0')
+    parser.add_argument('--port', help='port to listen on', default=8501, type=int)
+    parser.add_argument('--workers', help='number of worker processes', default=1, type=int)
+    parser.add_argument('--threads', help='intra-op threads per worker (defaults to cpus / workers)', default=None, type=int)
+    parser.add_argument('--max_batch_size', help='max examples per forward pass, use 1 for models that were traced '
+                                                 'with ops that fix the batch size', default=32, type=int)
+    parser.add_argument('--max_latency_ms', help='how long to wait for more requests to batch', default=5, type=float)
+    parser.add_argument('--logging', help='json file for logging', default=DEFAULT_LOGGING_LOC, type=convert_path)
+    args = parser.parse_args()
+    configure_logger(args.logging)
+
+    model_paths = dict(m.split('=', 1) for m in args.model)
+    serve(model_paths, args.host, args.port, args.workers, args.threads, args.max_batch_size, args.max_latency_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+from baseline.pytorch.crf import crf_init_alphas, viterbi_from_alphas
 
 
 class InferenceCRF(torch.jit.ScriptModule):
@@ -16,12 +17,7 @@ class InferenceCRF(torch.jit.ScriptModule):
     def decode(self, unary, length):
         if self.batch_first:
             unary = unary.transpose(0, 1)
-        unary = unary.squeeze(1)
-        return script_viterbi(unary, self.transitions, self.start_idx, self.end_idx)
-
-    # @torch.jit.script_method
-    # def viterbi(self, unary):
-    #     return script_viterbi(unary, self.transitions, self.start_idx, self.end_idx)
+        return script_viterbi(unary, self.transitions, length, self.start_idx, self.end_idx)
 
 
 class InferenceGreedyDecoder(nn.Module):
@@ -31,34 +27,20 @@ class InferenceGreedyDecoder(nn.Module):
 
 
 @torch.jit.script
-def script_viterbi(unary, trans, start_idx, end_idx):
-    # type: (Tensor, Tensor, int, int) -> Tuple[Tensor, Tensor]
-    backpointers = []
-    alphas = torch.full((1, unary.size(1)), -1e4, dtype=unary.dtype, device=unary.device)
-    alphas[0, start_idx] = 0
-
-    for i in range(unary.size(0)):
-        unary_t = unary[i, :]
-        next_tag_var = alphas + trans
-        viterbi, best_tag_ids = torch.max(next_tag_var, 1)
-        backpointers.append(best_tag_ids)
-        alphas = viterbi + unary_t
-        alphas = alphas.unsqueeze(0)
-
-    terminal_vars = alphas.squeeze(0) + trans[end_idx, :]
-    path_score, best_tag_id = torch.max(terminal_vars, 0)
-
-    best_path = [best_tag_id]
-    for i in range(len(backpointers)):
-        i = len(backpointers) - i - 1
-        best_tag_id = backpointers[i][best_tag_id]
-        best_path.append(best_tag_id)
-
-    new_path = []
-    for i in range(len(best_path)):
-        i = len(best_path) - i - 1
-        new_path.append(best_path[i])
-    return torch.stack(new_path[1:]), path_score
+def script_viterbi(unary, trans, lengths, start_idx, end_idx):
+    # type: (Tensor, Tensor, Tensor, int, int) -> Tuple[Tensor, Tensor]
+    """Viterbi decode a whole batch, this is `baseline.pytorch.crf.viterbi` compiled with TorchScript.
+
+    :param unary: torch.FloatTensor: [T, B, N]
+    :param trans: torch.FloatTensor: [N, N]
+    :param lengths: torch.LongTensor: [B]
+    :param start_idx: int: The index of the go token
+    :param end_idx: int: The index of the eos token
+
+    :return: torch.LongTensor: [T, B] the padded paths
+    :return: torch.FloatTensor: [B] the path scores
+    """
+    return viterbi_from_alphas(unary, trans.unsqueeze(0), lengths, crf_init_alphas(unary, start_idx), end_idx)
 
 
 if __name__ == '__main__':
@@ -71,24 +53,16 @@ if __name__ == '__main__':
 
     icrf = InferenceCRF(torch.nn.Parameter(trans.squeeze(0)), 0, 1, False)
 
-    u = torch.rand(20, 1, 10)
-    l = torch.full((1,), 20, dtype=torch.long)
+    u = torch.rand(20, 4, 10)
+    l = torch.LongTensor([20, 17, 9, 20])
     print(crf.decode(u, l))
     print(icrf.decode(u, l))
 
-    u = torch.rand(15, 1, 10)
-    traced_model = torch.jit.trace(icrf.decode, (u, l))
-    traced_model.save('crf.pt')
-    traced_model = torch.jit.load('crf.pt')
-
-    u = torch.rand(8, 1, 10)
-    l = torch.full((1,), 8, dtype=torch.long)
-
-    print(crf.decode(u, l))
-    print(traced_model(u, l))
+    icrf.save('crf.pt')
+    loaded = torch.jit.load('crf.pt')
 
-    u = torch.rand(22, 1, 10)
-    l = torch.full((1,), 22, dtype=torch.long)
+    u = torch.rand(8, 3, 10)
+    l = torch.LongTensor([8, 2, 5])
 
     print(crf.decode(u, l))
-    print(traced_model(u, l))
+    print(loaded.decode(u, l))
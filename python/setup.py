@@ -64,6 +64,7 @@ def main():
         packages=find_packages(exclude=['tests', 'xpctl*', 'hpctl*', 'tensorflow_serving*']),
         package_data={
             'mead': get_configs('mead/config'),
+            'baseline': ['protos/*.proto'],
         },
         include_package_data=True,
         install_requires=[
@@ -74,6 +75,7 @@ def main():
             'test': ['pytest', 'mock', 'contextdecorator', 'pytest-forked'],
             'report': ['visdom', 'tensorboardX'],
             'yaml': ['pyyaml'],
+            'grpc': ['grpcio', 'protobuf>=3.20'],
         },
         entry_points={
             'console_scripts': [
@@ -81,6 +83,7 @@ def main():
                 'mead-export = mead.export:main',
                 'mead-clean = mead.clean:main',
                 'mead-eval = mead.eval:main',
+                'mead-serve-pytorch = mead.pytorch.serve:main',
                 'bleu = baseline.bleu:main',
                 'conlleval = baseline.conlleval:main',
             ]
@@ -0,0 +1,100 @@
+import threading
+import pytest
+from baseline.services import BatchingService
+
+
+class FakeService(object):
+    """Returns the length of each example and remembers the batches it was called with."""
+    def __init__(self):
+        self.batches = []
+
+    def get_labels(self):
+        return ['a', 'b']
+
+    def predict(self, tokens, **kwargs):
+        tokens = [tokens] if isinstance(tokens[0], str) else tokens
+        self.batches.append((len(tokens), kwargs))
+        if kwargs.get('fail'):
+            raise ValueError('bad batch')
+        return [len(t) + kwargs.get('add', 0) for t in tokens]
+
+
+def _run_threads(service, inputs):
+    results = [None] * len(inputs)
+
+    def run(i):
+        results[i] = service.predict(inputs[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(inputs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_results_match_direct_calls():
+    fake = FakeService()
+    inputs = [['a'] * (i + 1) for i in range(20)] + [[['a', 'b'], ['c']]]
+    with BatchingService(fake, max_batch_size=64, max_latency_ms=50) as service:
+        results = _run_threads(service, inputs)
+    direct = FakeService()
+    assert results == [direct.predict(x) for x in inputs]
+
+
+def test_requests_are_coalesced():
+    fake = FakeService()
+    with BatchingService(fake, max_batch_size=64, max_latency_ms=200) as service:
+        _run_threads(service, [['a', 'b']] * 16)
+        stats = service.stats()
+    assert len(fake.batches) < 16
+    assert sum(b for b, _ in fake.batches) == 16
+    assert stats['requests'] == 16
+    assert stats['examples'] == 16
+    assert stats['batches'] == len(fake.batches)
+    assert stats['latency_ms']['p50'] <= stats['latency_ms']['max']
+
+
+def test_max_batch_size():
+    fake = FakeService()
+    with BatchingService(fake, max_batch_size=4, max_latency_ms=200) as service:
+        futures = [service.submit(['a']) for _ in range(10)]
+        assert [f.result() for f in futures] == [[1]] * 10
+    assert all(b <= 4 for b, _ in fake.batches)
+
+
+def test_kwargs_not_mixed():
+    fake = FakeService()
+    with BatchingService(fake, max_batch_size=64, max_latency_ms=100) as service:
+        f1 = service.submit(['a'], add=1)
+        f2 = service.submit(['a'])
+        assert f1.result() == [2]
+        assert f2.result() == [1]
+    assert sorted(kw.get('add', 0) for _, kw in fake.batches) == [0, 1]
+
+
+def test_error_goes_to_callers():
+    with BatchingService(FakeService(), max_latency_ms=1) as service:
+        with pytest.raises(ValueError):
+            service.predict(['a'], fail=True)
+        assert service.predict(['a']) == [1]
+
+
+def test_delegates_and_closes():
+    service = BatchingService(FakeService(), max_latency_ms=1)
+    assert service.get_labels() == ['a', 'b']
+    service.close()
+    with pytest.raises(RuntimeError):
+        service.submit(['a'])
+
+
+def test_predict_async():
+    asyncio = pytest.importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+    try:
+        with BatchingService(FakeService(), max_latency_ms=50) as service:
+            asyncio.set_event_loop(loop)
+            futures = [service.predict_async(['a'] * i) for i in range(1, 5)]
+            assert loop.run_until_complete(asyncio.gather(*futures)) == [[1], [2], [3], [4]]
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,115 @@
+import pytest
+import numpy as np
+torch = pytest.importorskip('torch')
+from baseline.utils import Offsets
+
+
+V = 12
+
+
+@pytest.fixture
+def table():
+    torch.manual_seed(1337)
+    return torch.randn(8, V, V)
+
+
+def make_fns(table, eos_rates):
+    """A fake decoder whose state is just the example index of each row.
+
+    EOS gets more likely each step at a different rate for each example so they finish at different steps.
+    """
+    def init(encoder_outputs, K):
+        return torch.arange(encoder_outputs.output.size(0)).unsqueeze(-1).repeat(1, K).view(-1)
+
+    def step(paths, extra):
+        B, K, T = paths.size()
+        last = paths[:, :, -1].contiguous().view(-1)
+        logits = table[extra, last].clone()
+        logits[:, Offsets.EOS] += eos_rates[extra] * T
+        return torch.log_softmax(logits, -1), extra
+
+    def update(beams, extra):
+        return extra[beams]
+
+    def compact(rows, extra):
+        return extra[rows]
+
+    return init, step, update, compact
+
+
+class FakeOutputs(object):
+    def __init__(self, B):
+        self.output = torch.zeros(B, 1)
+
+
+@pytest.mark.parametrize('mxlen', [4, 30])
+@pytest.mark.parametrize('K', [1, 3])
+def test_compact_matches_full(table, mxlen, K):
+    from baseline.pytorch.seq2seq.decoders import beam_search, gnmt_length_penalty
+    eos_rates = torch.Tensor([2.0, 0.0, 0.5, 0.1, 1.0, 0.0, 0.2, 3.0])
+    init, step, update, compact = make_fns(table, eos_rates)
+    gold = beam_search(FakeOutputs(8), init, step, update, beam=K, mxlen=mxlen)
+    compacted = beam_search(FakeOutputs(8), init, step, update, compact=compact, beam=K, mxlen=mxlen)
+    for g, c in zip(gold, compacted):
+        np.testing.assert_allclose(c.numpy(), g.numpy())
+    penalty = lambda x: gnmt_length_penalty(x, alpha=0.6)
+    gold = beam_search(FakeOutputs(8), init, step, update, length_penalty=penalty, beam=K, mxlen=mxlen)
+    compacted = beam_search(FakeOutputs(8), init, step, update, length_penalty=penalty, compact=compact, beam=K, mxlen=mxlen)
+    for g, c in zip(gold, compacted):
+        np.testing.assert_allclose(c.numpy(), g.numpy())
+
+
+def test_compact_runs_fewer_rows(table):
+    from baseline.pytorch.seq2seq.decoders import beam_search
+    eos_rates = torch.Tensor([5.0, 0.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0])
+    init, step, update, compact = make_fns(table, eos_rates)
+    rows = []
+
+    def counting_step(paths, extra):
+        rows.append(paths.size(0))
+        return step(paths, extra)
+
+    paths, lengths, _ = beam_search(FakeOutputs(8), init, counting_step, update, compact=compact, beam=2, mxlen=20)
+    assert rows[0] == 8
+    assert rows[-1] < 8
+    assert paths.size(2) == lengths.max().item()
+    assert (paths[lengths < paths.size(2)][..., -1] == Offsets.EOS).all()
+
+
+def _compare_decoder(decoder, encoder_outputs):
+    decoder.eval()
+    gold = decoder.beam_search(encoder_outputs, beam=3, mxlen=15, compact=False)
+    # Make sure some examples were finished before the others
+    lengths = gold[1].max(1)[0]
+    assert lengths.min() < lengths.max()
+    compacted = decoder.beam_search(encoder_outputs, beam=3, mxlen=15)
+    np.testing.assert_equal(compacted[0].numpy(), gold[0].numpy())
+    np.testing.assert_equal(compacted[1].numpy(), gold[1].numpy())
+    np.testing.assert_allclose(compacted[2].numpy(), gold[2].numpy(), atol=1e-5)
+
+
+def test_rnn_decoder_compact():
+    from baseline.pytorch.embeddings import LookupTableEmbeddings
+    from baseline.pytorch.seq2seq.encoders import RNNEncoderOutput
+    from baseline.pytorch.seq2seq.decoders import RNNDecoderWithAttn
+    torch.manual_seed(0)
+    decoder = RNNDecoderWithAttn(LookupTableEmbeddings('tgt', vsz=V, dsz=8), hsz=8, rnntype='lstm', layers=1)
+    B, S = 6, 5
+    hidden = (torch.rand(1, B, 8), torch.rand(1, B, 8))
+    src_mask = torch.ones(B, S, dtype=torch.uint8)
+    src_mask[2, 3:] = 0
+    _compare_decoder(decoder, RNNEncoderOutput(torch.rand(B, S, 8), hidden, src_mask))
+
+
+def test_transformer_decoder_compact():
+    from baseline.pytorch.embeddings import LookupTableEmbeddings
+    from baseline.pytorch.seq2seq.encoders import TransformerEncoderOutput
+    from baseline.pytorch.seq2seq.decoders import TransformerDecoderWrapper
+    torch.manual_seed(0)
+    decoder = TransformerDecoderWrapper(LookupTableEmbeddings('tgt', vsz=V, dsz=8), layers=2, num_heads=2)
+    # So that some examples finish before others
+    decoder.preds.bias.data[Offsets.EOS] += 3.0
+    B, S = 6, 5
+    src_mask = torch.ones(B, S, dtype=torch.uint8)
+    src_mask[2, 3:] = 0
+    _compare_decoder(decoder, TransformerEncoderOutput(torch.rand(B, S, 8), src_mask))
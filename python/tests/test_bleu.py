@@ -4,6 +4,7 @@ from collections import Counter
 import pytest
 from mock import patch, call
 import numpy as np
+import baseline.bleu
 from baseline.bleu import (
     n_grams,
     count_n_grams,
@@ -16,7 +17,11 @@ from baseline.bleu import (
     brevity_penalty,
     _read_references,
     _read_lines,
+    bleu,
+    BleuScorer,
+    ids_to_tokens,
 )
+from baseline.utils import Offsets, convert_seq2seq_golds, convert_seq2seq_preds
 
 
 def random_str(len_=None, min_=5, max_=21):
@@ -228,3 +233,81 @@ def test_read_references_group_references():
             read_patch.side_effect = (input1, input2)
             res = _read_references(['', ''], False)
             assert res == gold
+
+
+def _random_corpus(vocab, refs=1, size=50):
+    def sent():
+        return [np.random.choice(vocab) for _ in range(np.random.randint(0, 15))]
+    preds = [sent() for _ in range(size)]
+    golds = [[sent() for _ in range(refs)] for _ in range(size)]
+    return preds, golds
+
+
+@pytest.mark.parametrize('refs', [1, 3])
+def test_scorer_matches_bleu(refs):
+    vocab = [random_str(2) for _ in range(6)]
+    preds, golds = _random_corpus(vocab, refs)
+    scorer = BleuScorer()
+    gold = bleu(preds, golds)
+    for _ in range(2):
+        res = scorer.score(preds, golds)
+        assert res[0] == gold[0]
+        np.testing.assert_equal(res[1], gold[1])
+        assert res[2:] == gold[2:] or np.isnan(gold[3])
+
+
+def test_scorer_caches_references():
+    vocab = [random_str(2) for _ in range(6)]
+    preds, golds = _random_corpus(vocab)
+    scorer = BleuScorer()
+    scorer.score(preds, golds)
+    with patch('baseline.bleu.count_n_grams', wraps=baseline.bleu.count_n_grams) as count_mock:
+        scorer.score(preds, golds)
+    # Only the predictions are counted the second time
+    assert count_mock.call_count == len(preds)
+
+
+def test_scorer_parallel_matches():
+    vocab = [random_str(2) for _ in range(6)]
+    preds, golds = _random_corpus(vocab, size=100)
+    scorer = BleuScorer(processes=2)
+    assert scorer.score(preds, golds)[0] == bleu(preds, golds)[0]
+    scorer.close()
+
+
+def test_scorer_parallel_reuses_pool_and_cache():
+    vocab = [random_str(2) for _ in range(6)]
+    preds, golds = _random_corpus(vocab, refs=2, size=100)
+    scorer = BleuScorer(processes=2)
+    gold = scorer.score(preds, golds)
+    pool = scorer._pool
+    with patch('baseline.bleu.max_gold_n_gram_counts', wraps=baseline.bleu.max_gold_n_gram_counts) as count_mock:
+        assert scorer.score(preds, golds)[0] == gold[0]
+    assert count_mock.call_count == 0
+    assert scorer._pool is pool
+    scorer.close()
+    assert scorer._pool is None
+
+
+def test_ids_to_tokens():
+    eos, pad, go = Offsets.EOS, Offsets.PAD, Offsets.GO
+    indices = np.array([
+        [go, 10, 11, eos, 12],
+        [10, pad, 11, 12, 13],
+    ])
+    assert ids_to_tokens(indices) == [(10, 11), (10, 11, 12, 13)]
+    assert ids_to_tokens(indices, [5, 3]) == [(10, 11), (10, 11)]
+
+
+def test_ids_match_strings():
+    rlut = {i: random_str() for i in range(Offsets.OFFSET, 20)}
+    rlut.update({Offsets.PAD: '<PAD>', Offsets.GO: '<GO>', Offsets.EOS: '<EOS>'})
+    ids = list(range(Offsets.OFFSET, 20)) + [Offsets.EOS, Offsets.PAD]
+    preds = np.random.choice(ids, size=(50, 12))
+    tgt = np.random.choice(ids, size=(50, 12))
+    lengths = np.random.randint(1, 13, size=50)
+    str_preds = convert_seq2seq_preds(preds, rlut)
+    str_golds = convert_seq2seq_golds(tgt, lengths, rlut)
+    id_preds = ids_to_tokens(preds)
+    id_golds = [[g] for g in ids_to_tokens(tgt, lengths)]
+    assert BleuScorer().score(id_preds, id_golds)[0] == bleu(str_preds, str_golds)[0]
@@ -1,3 +1,4 @@
+import pickle
 import numpy as np
 import pytest
 from baseline import ConfusionMatrix
@@ -47,3 +48,50 @@ def test_mc_f1():
     np.testing.assert_allclose(f1, CLASS_F1, TOL)
     wf1 = cm.get_weighted_f()
     np.testing.assert_allclose(wf1, 0.5882784, TOL)
+
+def test_add_batch_matches_add():
+    cm = ConfusionMatrix(LABELS)
+    cm.add_batch(Y_TRUE, Y_PRED)
+    np.testing.assert_equal(cm._cm, make_mc_cm()._cm)
+
+def test_add_batch_accumulates():
+    cm = ConfusionMatrix(LABELS)
+    cm.add_batch(Y_TRUE[:5], Y_PRED[:5])
+    cm.add_batch(np.array(Y_TRUE[5:]), np.array(Y_PRED[5:]))
+    np.testing.assert_equal(cm._cm, make_mc_cm()._cm)
+
+def test_add_batch_empty():
+    cm = ConfusionMatrix(LABELS)
+    cm.add_batch([], [])
+    assert cm.get_total() == 0
+
+def test_add_batch_size_mismatch():
+    cm = ConfusionMatrix(LABELS)
+    with pytest.raises(ValueError):
+        cm.add_batch([0, 1], [1])
+
+def test_add_batch_out_of_range():
+    cm = ConfusionMatrix(LABELS)
+    with pytest.raises(ValueError):
+        cm.add_batch([0, len(LABELS)], [0, 1])
+    with pytest.raises(ValueError):
+        cm.add_batch([0, 1], [-1, 1])
+    with pytest.raises(ValueError):
+        cm.add_batch([0], [len(LABELS)])
+    assert cm.get_total() == 0
+
+def test_merge():
+    shards = []
+    for i in range(0, len(Y_TRUE), 4):
+        cm = ConfusionMatrix(LABELS)
+        cm.add_batch(Y_TRUE[i:i+4], Y_PRED[i:i+4])
+        shards.append(pickle.loads(pickle.dumps(cm)))
+    merged = ConfusionMatrix(LABELS)
+    for cm in shards:
+        merged += cm
+    np.testing.assert_equal(merged._cm, make_mc_cm()._cm)
+    np.testing.assert_equal((shards[0] + shards[1])._cm, shards[0]._cm + shards[1]._cm)
+
+def test_merge_different_labels():
+    with pytest.raises(ValueError):
+        ConfusionMatrix(LABELS).merge(ConfusionMatrix(LABELS[:-1]))
@@ -282,6 +282,38 @@ def test_forward_shape(generate_batch):
     assert fwd.shape == torch.Size([unary.size(1)])
 
 
+def test_forward_script(generate_batch):
+    unary, tags, lengths = generate_batch
+    h = unary.size(2)
+    crf = CRF(h)
+    script_crf = CRF(h, script=True)
+    trans = torch.rand(1, h, h)
+    crf.transitions_p.data = trans.clone()
+    script_crf.transitions_p.data = trans.clone()
+    np.testing.assert_allclose(
+        script_crf.forward(unary, lengths, unary.size(1)).detach().numpy(),
+        crf.forward(unary, lengths, unary.size(1)).detach().numpy(),
+        rtol=1e-6
+    )
+    crf.neg_log_loss(unary, tags, lengths).sum().backward()
+    script_crf.neg_log_loss(unary, tags, lengths).sum().backward()
+    np.testing.assert_allclose(script_crf.transitions_p.grad.numpy(), crf.transitions_p.grad.numpy(), rtol=1e-5, atol=1e-5)
+
+
+def test_decode_script(generate_batch):
+    unary, _, lengths = generate_batch
+    h = unary.size(2)
+    crf = CRF(h)
+    script_crf = CRF(h, script=True)
+    trans = torch.rand(1, h, h)
+    crf.transitions_p.data = trans.clone()
+    script_crf.transitions_p.data = trans.clone()
+    p1, s1 = crf.decode(unary, lengths)
+    p2, s2 = script_crf.decode(unary, lengths)
+    np.testing.assert_equal(p2.numpy(), p1.numpy())
+    np.testing.assert_allclose(s2.detach().numpy(), s1.detach().numpy())
+
+
 def test_decode_batch_stable(generate_examples_and_batch):
     i1, _, l1, i2, _, l2, i, _, l = generate_examples_and_batch
     h = i1.size(2)
@@ -474,3 +506,38 @@ def test_vec_log_sum_exp_batch_stable():
     one_x_one = torch.cat([lse1, lse2], dim=0)
     lse = vec_log_sum_exp(i, 2)
     np.testing.assert_allclose(one_x_one.numpy(), lse.numpy())
+
+
+def test_script_viterbi_matches_viterbi(generate_batch):
+    from mead.pytorch.tagger_decoders import script_viterbi
+    unary, _, lengths = generate_batch
+    h = unary.size(2)
+    trans = torch.rand(h, h)
+    p1, s1 = viterbi(unary, trans.unsqueeze(0), lengths, Offsets.GO, Offsets.EOS)
+    p2, s2 = script_viterbi(unary, trans, lengths, Offsets.GO, Offsets.EOS)
+    np.testing.assert_equal(p2.numpy(), p1.numpy())
+    np.testing.assert_allclose(s2.numpy(), s1.numpy(), rtol=1e-6)
+
+
+def test_exporting_tagger_batched(generate_batch):
+    from mead.pytorch.exporters import ExportingTagger
+    unary, _, lengths = generate_batch
+    h = unary.size(2)
+
+    class Tagger(torch.nn.Module):
+        """Uses the first input as the unaries"""
+        def __init__(self):
+            super(Tagger, self).__init__()
+            self.crf = CRF(h)
+            self.crf.transitions_p.data = torch.rand(1, h, h)
+
+        def compute_unaries(self, x, l):
+            return x[0]
+
+    tagger = Tagger()
+    exportable = ExportingTagger(tagger)
+    # Trace with a single example like the exporter does, then run the whole batch
+    traced = torch.jit.trace(exportable, ((unary[:, :1].transpose(0, 1).contiguous(),), lengths[:1]))
+    paths = traced((unary.transpose(0, 1).contiguous(),), lengths)
+    gold, _ = tagger.crf.decode(unary, lengths)
+    np.testing.assert_equal(paths.numpy(), gold.numpy())
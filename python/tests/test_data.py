@@ -0,0 +1,347 @@
+import numpy as np
+from baseline.data import DictExamples, Seq2SeqExamples, ArrayExamples, ArraySeq2SeqExamples, stack_examples
+
+
+def _examples(n=23, mxlen=12, mxwlen=5):
+    examples = []
+    for i in range(n):
+        length = np.random.randint(1, mxlen)
+        word = np.zeros(mxlen, dtype=int)
+        word[:length] = np.random.randint(4, 100, size=length)
+        char = np.zeros((mxlen, mxwlen), dtype=int)
+        char[:length] = np.random.randint(4, 30, size=(length, mxwlen))
+        tgt_length = np.random.randint(3, mxlen)
+        tgt = np.zeros(mxlen, dtype=int)
+        tgt[:tgt_length] = np.random.randint(4, 100, size=tgt_length)
+        examples.append({
+            'word': word, 'word_lengths': length, 'char': char,
+            'tgt': tgt, 'tgt_lengths': tgt_length, 'y': np.random.randint(0, 5), 'ids': i
+        })
+    return examples
+
+
+def _assert_batches_equal(gold, arrays, batchsz, trim):
+    steps = (len(gold) + batchsz - 1) // batchsz
+    for i in range(steps):
+        g = gold.batch(i, batchsz, trim=trim)
+        a = arrays.batch(i, batchsz, trim=trim)
+        assert set(g.keys()) == set(a.keys())
+        for k in g:
+            np.testing.assert_equal(g[k], a[k])
+
+
+def test_stack_examples():
+    examples = _examples()
+    arrays = stack_examples(examples)
+    assert arrays['word'].shape == (len(examples), 12)
+    assert arrays['char'].shape == (len(examples), 12, 5)
+    assert arrays['y'].shape == (len(examples),)
+
+
+def test_array_examples_match_dict_examples():
+    examples = _examples()
+    gold = DictExamples(list(examples), do_shuffle=False)
+    arrays = ArrayExamples.from_list(examples, do_shuffle=False)
+    assert len(gold) == len(arrays)
+    _assert_batches_equal(gold, arrays, 4, trim=False)
+
+
+def test_array_examples_sorted_trim_match_dict_examples():
+    examples = _examples()
+    gold = DictExamples(list(examples), do_shuffle=False, sort_key='word_lengths')
+    arrays = ArrayExamples.from_list(examples, do_shuffle=False, sort_key='word_lengths')
+    _assert_batches_equal(gold, arrays, 5, trim=True)
+
+
+def test_array_examples_shuffle_is_a_permutation():
+    examples = _examples()
+    arrays = ArrayExamples.from_list(examples, do_shuffle=True)
+    ids = np.concatenate([arrays.batch(i, 5)['ids'] for i in range((len(examples) + 4) // 5)])
+    assert sorted(ids.tolist()) == list(range(len(examples)))
+
+
+def test_array_examples_sort_after_shuffle():
+    examples = _examples()
+    arrays = ArrayExamples.from_list(examples, do_shuffle=True, sort_key='word_lengths')
+    lengths = [arrays[i]['word_lengths'] for i in range(len(arrays))]
+    assert lengths == sorted(lengths)
+
+
+def test_array_examples_batch_is_a_copy():
+    examples = _examples()
+    arrays = ArrayExamples.from_list(examples, do_shuffle=False)
+    batch = arrays.batch(0, 4)
+    batch['word'][:] = -1
+    assert (arrays.arrays['word'] != -1).all()
+
+
+def test_array_seq2seq_examples_match_seq2seq_examples():
+    examples = _examples()
+    gold = Seq2SeqExamples(list(examples), do_shuffle=False, src_sort_key='word_lengths')
+    arrays = ArraySeq2SeqExamples.from_list(examples, do_shuffle=False, src_sort_key='word_lengths')
+    _assert_batches_equal(gold, arrays, 6, trim=True)
+
+
+def test_array_seq2seq_examples_trim_no_sort_key():
+    examples = _examples()
+    gold = Seq2SeqExamples(list(examples), do_shuffle=False)
+    arrays = ArraySeq2SeqExamples.from_list(examples, do_shuffle=False)
+    _assert_batches_equal(gold, arrays, 6, trim=True)
+
+
+def _feed(shuffle=False, trim=True):
+    from baseline.data import ExampleDataFeed
+    examples = ArrayExamples.from_list(_examples(n=41), do_shuffle=False, sort_key='word_lengths')
+    return ExampleDataFeed(examples, 4, shuffle=shuffle, trim=trim)
+
+
+def test_prefetch_matches_feed_thread():
+    from baseline.data import PrefetchDataFeed
+    feed = _feed()
+    prefetch = PrefetchDataFeed(feed, prefetch=3, num_workers=2)
+    assert len(prefetch) == len(feed)
+    gold = list(feed)
+    batches = list(prefetch)
+    assert len(gold) == len(batches)
+    for g, b in zip(gold, batches):
+        for k in g:
+            np.testing.assert_equal(g[k], b[k])
+
+
+def test_prefetch_matches_feed_process():
+    from baseline.data import PrefetchDataFeed
+    feed = _feed()
+    prefetch = PrefetchDataFeed(feed, prefetch=2, num_workers=2, worker_type='process')
+    for g, b in zip(feed, prefetch):
+        for k in g:
+            np.testing.assert_equal(g[k], b[k])
+
+
+def test_prefetch_shuffle_visits_every_step():
+    from baseline.data import PrefetchDataFeed
+    feed = _feed(shuffle=True)
+    ids = np.concatenate([b['ids'] for b in PrefetchDataFeed(feed, prefetch=4)])
+    assert sorted(ids.tolist()) == list(range(41))
+
+
+def test_prefetch_early_exit():
+    from baseline.data import PrefetchDataFeed
+    prefetch = PrefetchDataFeed(_feed(), prefetch=4)
+    for i, _ in enumerate(prefetch):
+        if i == 2:
+            break
+    assert len(list(prefetch)) == len(prefetch)
+
+
+def test_create_prefetch_feed():
+    from baseline.data import create_prefetch_feed, PrefetchDataFeed
+    feed = _feed()
+    assert create_prefetch_feed(feed) is feed
+    assert create_prefetch_feed(None, prefetch=2) is None
+    wrapped = create_prefetch_feed(feed, prefetch=2, prefetch_workers=3)
+    assert isinstance(wrapped, PrefetchDataFeed)
+    assert wrapped.num_workers == 3
+    assert create_prefetch_feed(wrapped, prefetch=2) is wrapped
+
+
+def _bucketed(num_buckets=4, shuffle=True, trim=True, n=101, batchsz=8):
+    from baseline.data import BucketedExampleDataFeed
+    examples = ArrayExamples.from_list(_examples(n=n, mxlen=40), sort_key='word_lengths')
+    return BucketedExampleDataFeed(examples, batchsz, shuffle=shuffle, trim=trim, num_buckets=num_buckets)
+
+
+def test_bucketed_visits_every_example():
+    feed = _bucketed()
+    for _ in range(2):
+        ids = np.concatenate([b['ids'] for b in feed])
+        assert sorted(ids.tolist()) == list(range(101))
+
+
+def test_bucketed_truncate():
+    from baseline.data import BucketedExampleDataFeed
+    examples = ArrayExamples.from_list(_examples(n=21), sort_key='word_lengths')
+    feed = BucketedExampleDataFeed(examples, 4, shuffle=True, truncate=True, num_buckets=3)
+    batches = list(feed)
+    assert len(batches) == len(feed) == 5
+    assert all(len(b['ids']) == 4 for b in batches)
+
+
+def test_bucketed_batches_are_trimmed():
+    for batch in _bucketed():
+        assert batch['word'].shape[1] == np.max(batch['word_lengths'])
+
+
+def test_bucketed_changes_per_epoch():
+    feed = _bucketed()
+    first = [tuple(b['ids']) for b in feed]
+    second = [tuple(b['ids']) for b in feed]
+    assert first != second
+
+
+def test_bucketed_padding_efficiency():
+    from baseline.data import padding_efficiency
+    np.random.seed(1)
+    feed = _bucketed(num_buckets=8)
+    # A bucket per example is just a sort so the batches are as tight as they can be, a shuffle is much worse
+    everything = _bucketed(num_buckets=101)
+    shuffled = np.random.permutation(len(feed.lengths))
+    shuffled = [shuffled[i * 8:(i + 1) * 8] for i in range(len(feed))]
+    assert feed.padding_efficiency > padding_efficiency(feed.lengths, shuffled)
+    assert everything.padding_efficiency >= feed.padding_efficiency
+    batches = list(feed)
+    real = sum(int(np.sum(b['word_lengths'])) for b in batches)
+    padded = sum(b['word'].size for b in batches)
+    assert np.isclose(feed.padding_efficiency, real / float(padded))
+
+
+def test_bucketed_padding_efficiency_no_trim():
+    feed = _bucketed(trim=False)
+    for _ in feed:
+        pass
+    assert np.isclose(feed.padding_efficiency, np.sum(feed.lengths) / float(len(feed.lengths) * 40))
+
+
+def test_bucketed_requires_length_key():
+    import pytest
+    from baseline.data import BucketedExampleDataFeed
+    examples = ArrayExamples.from_list(_examples())
+    with pytest.raises(ValueError):
+        BucketedExampleDataFeed(examples, 4, shuffle=True)
+    feed = BucketedExampleDataFeed(examples, 4, shuffle=True, length_key='tgt_lengths')
+    assert feed.length_key == 'tgt_lengths'
+
+
+def test_create_example_feed():
+    from baseline.data import create_example_feed, BucketedExampleDataFeed
+    examples = ArrayExamples.from_list(_examples(), sort_key='word_lengths')
+    assert not isinstance(create_example_feed(examples, 4, shuffle=True), BucketedExampleDataFeed)
+    assert not isinstance(create_example_feed(examples, 4, num_buckets=4), BucketedExampleDataFeed)
+    assert isinstance(create_example_feed(examples, 4, shuffle=True, num_buckets=4), BucketedExampleDataFeed)
+
+
+def test_prefetch_bucketed():
+    from baseline.data import PrefetchDataFeed
+    feed = _bucketed()
+    ids = np.concatenate([b['ids'] for b in PrefetchDataFeed(feed, prefetch=2, worker_type='process')])
+    assert sorted(ids.tolist()) == list(range(101))
+
+
+def _token_batched(max_tokens=64, n=101, **kwargs):
+    from baseline.data import TokenBatchedExampleDataFeed
+    examples = ArraySeq2SeqExamples.from_list(_examples(n=n, mxlen=40), src_sort_key='word_lengths')
+    kwargs.setdefault('trim', True)
+    return TokenBatchedExampleDataFeed(examples, 8, shuffle=True, max_tokens=max_tokens, **kwargs)
+
+
+def test_token_batched_respects_budget():
+    feed = _token_batched()
+    assert feed.length_keys == ['word_lengths', 'tgt_lengths']
+    for _ in range(2):
+        batches = list(feed)
+        assert len(batches) == len(feed)
+        ids = np.concatenate([b['ids'] for b in batches])
+        assert sorted(ids.tolist()) == list(range(101))
+        for b in batches:
+            size = b['word'].size + b['tgt'].size
+            assert size <= 64 or len(b['ids']) == 1
+
+
+def test_token_batched_sizes_vary():
+    feed = _token_batched(max_tokens=200, num_buckets=101, length_keys=['word_lengths'])
+    sizes = [len(b['ids']) for b in feed]
+    assert max(sizes) > min(sizes)
+    for b in feed:
+        assert b['word'].size <= 200 or len(b['ids']) == 1
+
+
+def test_token_batched_always_trims():
+    feed = _token_batched(max_tokens=40, length_keys=['word_lengths'], trim=False)
+    assert feed.trim
+    for b in feed:
+        assert b['word'].shape[1] == np.max(b['word_lengths'])
+        assert b['word'].size <= 40 or len(b['ids']) == 1
+
+
+def test_token_batched_long_example():
+    feed = _token_batched(max_tokens=1)
+    assert len(feed) == 101
+    assert all(len(b['ids']) == 1 for b in feed)
+
+
+def test_create_example_feed_max_tokens():
+    from baseline.data import create_example_feed, TokenBatchedExampleDataFeed
+    examples = ArrayExamples.from_list(_examples(), sort_key='word_lengths')
+    assert isinstance(create_example_feed(examples, 4, shuffle=True, max_tokens=50), TokenBatchedExampleDataFeed)
+    assert not isinstance(create_example_feed(examples, 4, max_tokens=50), TokenBatchedExampleDataFeed)
+
+
+def test_prefetch_token_batched_len():
+    from baseline.data import PrefetchDataFeed
+    feed = _token_batched()
+    prefetch = PrefetchDataFeed(feed)
+    batches = list(prefetch)
+    assert len(batches) == len(prefetch) == len(feed)
+
+
+def _stream(n=37, batchsz=5, **kwargs):
+    from baseline.data import StreamingDataFeed
+    data = _examples(n=n)
+    return StreamingDataFeed(lambda: iter(data), stack_examples, batchsz, **kwargs), data
+
+
+def test_streaming_in_order():
+    feed, data = _stream()
+    assert len(feed) == 8
+    batches = list(feed)
+    assert len(batches) == 8
+    gold = stack_examples(data)
+    for k in gold:
+        np.testing.assert_equal(np.concatenate([b[k] for b in batches]), gold[k])
+
+
+def test_streaming_shuffle_buffer():
+    from baseline.data import _shuffle_buffer
+    out = list(_shuffle_buffer(iter(range(100)), 10))
+    assert sorted(out) == list(range(100))
+    assert out != list(range(100))
+    # An example can't come out before the buffer holding it was filled
+    assert all(v < i + 10 for i, v in enumerate(out))
+    feed, _ = _stream(shuffle=True, shuffle_buffer=8)
+    ids = np.concatenate([b['ids'] for b in feed])
+    assert sorted(ids.tolist()) == list(range(37))
+
+
+def test_streaming_truncate_and_trim():
+    feed, _ = _stream(truncate=True, trim=True, sort_key='word_lengths')
+    batches = list(feed)
+    assert len(batches) == len(feed) == 7
+    for b in batches:
+        assert len(b['ids']) == 5
+        assert b['word'].shape[1] == np.max(b['word_lengths'])
+
+
+def test_streaming_num_examples():
+    from baseline.data import StreamingDataFeed
+    feed = StreamingDataFeed(lambda: iter(range(10)), lambda x: {'x': np.array(x)}, 4, num_examples=10)
+    assert len(feed) == 3
+    assert [b['x'].tolist() for b in feed] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_streaming_is_not_random_access():
+    import pytest
+    feed, _ = _stream()
+    with pytest.raises(TypeError):
+        feed[0]
+
+
+def test_prefetch_streaming():
+    from baseline.data import PrefetchDataFeed
+    feed, data = _stream()
+    prefetch = PrefetchDataFeed(feed, prefetch=3, worker_type='process')
+    for g, b in zip(feed, prefetch):
+        for k in g:
+            np.testing.assert_equal(g[k], b[k])
+    for i, _ in enumerate(prefetch):
+        if i == 1:
+            break
+    assert len(list(prefetch)) == len(feed)
@@ -0,0 +1,172 @@
+import os
+import io
+import json
+import hashlib
+import zipfile
+import threading
+import pytest
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from mead.downloader import fetch_url, download_to_cache, DataDownloader, DATA_CACHE_CONF
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves `server.files`, with range requests unless `server.ranges` is off"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.path, self.headers.get('Range')))
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        start = 0
+        rng = self.headers.get('Range')
+        if rng is not None and self.server.ranges:
+            start = int(rng.split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        if self.server.cut_off:
+            # Drop the connection half way through
+            self.server.cut_off = False
+            self.wfile.write(data[start:start + (len(data) - start) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+
+@pytest.fixture
+def server():
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.files = {}
+    server.requests = []
+    server.ranges = True
+    server.cut_off = False
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    server.url = lambda path: 'http://127.0.0.1:{}{}'.format(server.server_address[1], path)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _zip(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as z:
+        for name, data in files.items():
+            z.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_fetch(server, tmpdir):
+    data = os.urandom(100000)
+    server.files['/data'] = data
+    path = str(tmpdir.join('data'))
+    assert fetch_url(server.url('/data'), path) == hashlib.sha1(data).hexdigest()
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_fetch_resumes(server, tmpdir):
+    data = os.urandom(100000)
+    server.files['/data'] = data
+    path = str(tmpdir.join('data'))
+    with open(path, 'wb') as f:
+        f.write(data[:30000])
+    assert fetch_url(server.url('/data'), path) == hashlib.sha1(data).hexdigest()
+    assert server.requests == [('/data', 'bytes=30000-')]
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    # Already complete
+    assert fetch_url(server.url('/data'), path, sha1=hashlib.sha1(data).hexdigest())
+
+
+def test_fetch_resumes_after_cut_off(server, tmpdir):
+    data = os.urandom(100000)
+    server.files['/data'] = data
+    server.cut_off = True
+    path = str(tmpdir.join('data'))
+    with pytest.raises(RuntimeError):
+        fetch_url(server.url('/data'), path)
+    assert os.path.getsize(path) == 50000
+    assert fetch_url(server.url('/data'), path) == hashlib.sha1(data).hexdigest()
+    assert server.requests[-1] == ('/data', 'bytes=50000-')
+
+
+def test_fetch_restarts_without_ranges(server, tmpdir):
+    data = os.urandom(1000)
+    server.files['/data'] = data
+    server.ranges = False
+    path = str(tmpdir.join('data'))
+    with open(path, 'wb') as f:
+        f.write(b'junk')
+    fetch_url(server.url('/data'), path)
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_fetch_bad_sha1(server, tmpdir):
+    server.files['/data'] = b'some data'
+    path = str(tmpdir.join('data'))
+    with pytest.raises(RuntimeError):
+        fetch_url(server.url('/data'), path, sha1=hashlib.sha1(b'other data').hexdigest())
+    assert not os.path.exists(path)
+
+
+def test_fetch_missing(server, tmpdir):
+    with pytest.raises(RuntimeError):
+        fetch_url(server.url('/missing'), str(tmpdir.join('data')))
+
+
+def test_download_to_cache_once(server, tmpdir):
+    data = _zip({'train.txt': b'a b c', 'test.txt': b'd e f'})
+    server.files['/bundle.zip'] = data
+    cache = str(tmpdir.join('cache'))
+    results = [None] * 4
+
+    def run(i):
+        results[i] = download_to_cache(server.url('/bundle.zip'), cache, sha1=hashlib.sha1(data).hexdigest())
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(server.requests) == 1
+    assert len(set(results)) == 1
+    assert os.path.basename(results[0]) == hashlib.sha1(data).hexdigest()
+    assert sorted(os.listdir(results[0])) == ['test.txt', 'train.txt']
+    with open(os.path.join(cache, DATA_CACHE_CONF)) as f:
+        assert json.load(f) == {server.url('/bundle.zip'): results[0]}
+    # Only the data, the cache json and the lock files are left
+    assert not [f for f in os.listdir(cache) if '.part' in f]
+
+
+def test_data_downloader_parallel(server, tmpdir):
+    for name in ('train', 'valid', 'test'):
+        server.files['/{}.txt'.format(name)] = name.encode('utf-8') * 100
+    desc = {'{}_file'.format(name): server.url('/{}.txt'.format(name)) for name in ('train', 'valid', 'test')}
+    files = DataDownloader(desc, str(tmpdir.join('cache')), max_workers=3).download()
+    assert sorted(files) == ['test_file', 'train_file', 'valid_file']
+    for k, path in files.items():
+        with open(path, 'rb') as f:
+            assert f.read() == k.split('_')[0].encode('utf-8') * 100
+    # A second time comes from the cache
+    DataDownloader(desc, str(tmpdir.join('cache'))).download()
+    assert len(server.requests) == 3
@@ -225,3 +225,43 @@ def test_rand_counts():
     gold = {"C", "D"}
     for g in gold:
         assert g in wv.vocab
+
+
+@pytest.mark.parametrize('filename', [GLOVE_FILE, W2V_FILE])
+def test_binary_keep_unused(filename, tmpdir):
+    target = convert_embeddings(filename, os.path.join(str(tmpdir), 'embed'))
+    assert is_binary_embeddings(target)
+    np.random.seed(0)
+    wv_file = PretrainedEmbeddingsModel(filename, keep_unused=True)
+    np.random.seed(0)
+    wv_bin = PretrainedEmbeddingsModel(target, keep_unused=True)
+    assert wv_file.vocab == wv_bin.vocab
+    np.testing.assert_allclose(wv_file.weights, wv_bin.weights)
+
+
+@pytest.mark.parametrize('filename', [GLOVE_FILE, W2V_FILE])
+def test_binary_known_vocab(filename, tmpdir):
+    target = convert_embeddings(filename, os.path.join(str(tmpdir), 'embed'))
+    words = [w for w in PretrainedEmbeddingsModel(filename, keep_unused=True).vocab if w not in Offsets.VALUES]
+    known = {w: 1 for w in words[::-2]}
+    known['zzzzzzzzzzz'] = 3
+    np.random.seed(0)
+    wv_file = PretrainedEmbeddingsModel(filename, known_vocab=dict(known))
+    np.random.seed(0)
+    wv_bin = PretrainedEmbeddingsModel(target, known_vocab=dict(known))
+    assert wv_file.vocab == wv_bin.vocab
+    assert 'zzzzzzzzzzz' in wv_bin.vocab
+    np.testing.assert_allclose(wv_file.weights, wv_bin.weights)
+
+
+def test_binary_converts_once(tmpdir):
+    filename = os.path.join(str(tmpdir), 'glove.txt')
+    with open(GLOVE_FILE) as rf, open(filename, 'w') as wf:
+        wf.write(rf.read())
+    wv_file = PretrainedEmbeddingsModel(filename, keep_unused=True)
+    wv_bin = PretrainedEmbeddingsModel(filename, keep_unused=True, use_binary=True)
+    assert is_binary_embeddings(filename + '.bemb')
+    mtime = os.path.getmtime(os.path.join(filename + '.bemb', 'meta.json'))
+    PretrainedEmbeddingsModel(filename, keep_unused=True, use_binary=True)
+    assert os.path.getmtime(os.path.join(filename + '.bemb', 'meta.json')) == mtime
+    np.testing.assert_allclose(wv_file.weights[len(Offsets.VALUES):], wv_bin.weights[len(Offsets.VALUES):])
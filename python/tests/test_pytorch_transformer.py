@@ -89,3 +89,34 @@ def attn_values_sub_mask(attn, qkv):
         for h in range(H):
             for t in range(T):
                 np.testing.assert_allclose(res[b, h, t, :], np.mean(gold[:, :, :t+1, :], axis=2)[b, h, :], atol=1e-5)
+
+
+def test_decoder_stack_cache_matches_full():
+    from baseline.pytorch.transformer import TransformerDecoderStack
+    B, T, S, H = 3, 7, 5, 16
+    stack = TransformerDecoderStack(4, H, 0.1, layers=2).eval()
+    x = torch.rand(B, T, H)
+    memory = torch.rand(B, S, H)
+    src_mask = torch.ones(B, 1, 1, S, dtype=torch.uint8)
+    src_mask[0, :, :, 3:] = 0
+    gold = stack(x, memory, src_mask, subsequent_mask(T).type_as(x))
+    cache = stack.init_cache()
+    steps = [stack(x[:, t:t + 1], memory, src_mask, None, cache=cache) for t in range(T)]
+    np.testing.assert_allclose(torch.cat(steps, 1).numpy(), gold.numpy(), atol=1e-5)
+
+
+def test_decoder_stack_cache_reorder():
+    from baseline.pytorch.transformer import TransformerDecoderStack
+    B, T, S, H = 4, 5, 6, 16
+    stack = TransformerDecoderStack(2, H, 0.1, layers=2).eval()
+    x = torch.rand(B, T, H)
+    memory = torch.rand(1, S, H).expand(B, S, H)
+    src_mask = torch.ones(B, 1, 1, S, dtype=torch.uint8)
+    cache = stack.init_cache()
+    for t in range(T - 1):
+        stack(x[:, t:t + 1], memory, src_mask, None, cache=cache)
+    beams = torch.LongTensor([2, 2, 0, 1])
+    stack.reorder_cache(cache, beams)
+    step = stack(x[beams, T - 1:], memory, src_mask, None, cache=cache)
+    gold = stack(x[beams], memory, src_mask, subsequent_mask(T).type_as(x))[:, -1:]
+    np.testing.assert_allclose(step.numpy(), gold.numpy(), atol=1e-5)
@@ -0,0 +1,124 @@
+import os
+import pytest
+import numpy as np
+from baseline.reader import (
+    VectorizedCache,
+    TSVSeqLabelReader,
+    CONLLSeqReader,
+    TSVParallelCorpusReader,
+)
+from baseline.vectorizers import Token1DVectorizer, Dict1DVectorizer, Char2DVectorizer
+
+
+TEST_LOC = os.path.join(os.path.realpath(os.path.dirname(__file__)), 'test_data')
+
+
+def _vocab(counts):
+    vocab = {'<PAD>': 0, '<GO>': 1, '<EOS>': 2, '<UNK>': 3}
+    for k in counts:
+        vocab[k] = len(vocab)
+    return vocab
+
+
+def _assert_same_batches(gold, cached):
+    assert len(gold) == len(cached)
+    for g, c in zip(gold, cached):
+        assert set(g.keys()) == set(c.keys())
+        for k in g:
+            np.testing.assert_equal(g[k], c[k])
+
+
+class _NoRead(object):
+    """Make sure the vectorizers aren't run when we hit the cache."""
+    def __enter__(self):
+        self.run = Token1DVectorizer.run
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Vectorizer was run on a cache hit")
+        Token1DVectorizer.run = fail
+
+    def __exit__(self, *args):
+        Token1DVectorizer.run = self.run
+
+
+def test_classify_cache_round_trip(tmpdir):
+    file_name = os.path.join(TEST_LOC, 'tsv_unstruct_file.tsv')
+
+    def load(cache_dir):
+        vects = {'word': Token1DVectorizer(mxlen=-1), 'char': Char2DVectorizer(mxlen=-1, mxwlen=-1)}
+        reader = TSVSeqLabelReader(vects, cache_dir=cache_dir)
+        counts, _ = reader.build_vocab(file_name)
+        vocabs = {k: _vocab(v) for k, v in counts.items()}
+        return reader.load(file_name, vocabs, 2), vects
+
+    gold, gold_vects = load(None)
+    _, _ = load(str(tmpdir))
+    assert len(os.listdir(str(tmpdir))) == 1
+    with _NoRead():
+        cached, cached_vects = load(str(tmpdir))
+    _assert_same_batches(gold, cached)
+    assert cached_vects['word'].mxlen == gold_vects['word'].mxlen
+    assert cached_vects['char'].mxwlen == gold_vects['char'].mxwlen
+
+
+def test_tagger_cache_round_trip(tmpdir):
+    file_name = os.path.join(TEST_LOC, 'eng.testb.small.conll')
+
+    def load(cache_dir):
+        vects = {'word': Dict1DVectorizer(mxlen=-1, fields='text')}
+        reader = CONLLSeqReader(vects, cache_dir=cache_dir, named_fields={'0': 'text', '-1': 'y'})
+        counts = reader.build_vocab([file_name])
+        vocabs = {k: _vocab(v) for k, v in counts.items()}
+        return reader.load(file_name, vocabs, 4)
+
+    gold, gold_texts = load(None)
+    load(str(tmpdir))
+    with _NoRead():
+        cached, cached_texts = load(str(tmpdir))
+    _assert_same_batches(gold, cached)
+    assert cached_texts == gold_texts
+
+
+def test_seq2seq_cache_round_trip(tmpdir):
+    file_name = os.path.join(TEST_LOC, 'tsv_parallel.tsv')
+
+    def load(cache_dir):
+        vects = {'src': Token1DVectorizer(mxlen=5), 'tgt': Token1DVectorizer(mxlen=5)}
+        reader = TSVParallelCorpusReader(vects, cache_dir=cache_dir)
+        src, tgt = reader.build_vocabs([file_name])
+        src = {k: _vocab(v) for k, v in src.items()}
+        return reader.load(file_name, src, _vocab(tgt), 2)
+
+    gold = load(None)
+    load(str(tmpdir))
+    with _NoRead():
+        cached = load(str(tmpdir))
+    _assert_same_batches(gold, cached)
+
+
+def test_cache_key_changes_with_vocab():
+    cache = VectorizedCache('unused')
+    file_name = os.path.join(TEST_LOC, 'tsv_parallel.tsv')
+    vects = {'word': Token1DVectorizer(mxlen=5)}
+    k1 = cache.key(file_name, vects, {'word': {'a': 1}})
+    k2 = cache.key(file_name, vects, {'word': {'a': 2}})
+    assert k1 != k2
+    assert k1 == cache.key(file_name, vects, {'word': {'a': 1}})
+    # Nothing is written next to the data, a reader given the directory would read it
+    assert not os.path.exists(file_name + '.sha1')
+
+
+def test_cache_key_changes_with_vectorizer():
+    cache = VectorizedCache('unused')
+    file_name = os.path.join(TEST_LOC, 'tsv_parallel.tsv')
+    k1 = cache.key(file_name, {'word': Token1DVectorizer(mxlen=5)}, {})
+    k2 = cache.key(file_name, {'word': Token1DVectorizer(mxlen=6)}, {})
+    k3 = cache.key(file_name, {'word': Token1DVectorizer(mxlen=5, transform_fn=lambda x: x.lower())}, {})
+    assert len({k1, k2, k3}) == 3
+
+
+def test_cache_miss():
+    cache = VectorizedCache('unused')
+    examples, texts = cache.load('not-a-key', {})
+    assert examples is None
+    assert texts is None
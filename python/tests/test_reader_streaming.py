@@ -0,0 +1,112 @@
+import os
+import numpy as np
+from baseline.data import StreamingDataFeed
+from baseline.reader import TSVSeqLabelReader, CONLLSeqReader, TSVParallelCorpusReader, MultiFileParallelCorpusReader
+from baseline.vectorizers import Token1DVectorizer, Dict1DVectorizer, Char2DVectorizer
+
+
+TEST_LOC = os.path.join(os.path.realpath(os.path.dirname(__file__)), 'test_data')
+
+
+def _vocab(counts):
+    vocab = {'<PAD>': 0, '<GO>': 1, '<EOS>': 2, '<UNK>': 3}
+    for k in counts:
+        vocab[k] = len(vocab)
+    return vocab
+
+
+def _rows(batches, widths):
+    """Get every row of every batch as a string, padded to `widths` so trimmed batches compare"""
+    rows = []
+    for b in batches:
+        for i in range(len(next(iter(b.values())))):
+            row = []
+            for k in sorted(b):
+                v = np.asarray(b[k][i])
+                if v.ndim > 0:
+                    v = np.pad(v, [(0, widths[k] - v.shape[0])] + [(0, 0)] * (v.ndim - 1), mode='constant')
+                row.append(v.tolist())
+            rows.append(repr(row))
+    return sorted(rows)
+
+
+def _assert_same_rows(gold, streamed):
+    widths = {}
+    for b in gold + streamed:
+        for k, v in b.items():
+            if v.ndim > 1:
+                widths[k] = max(widths.get(k, 0), v.shape[1])
+    assert _rows(gold, widths) == _rows(streamed, widths)
+
+
+def test_tagger_streaming():
+    file_name = os.path.join(TEST_LOC, 'eng.testb.small.conll')
+
+    def reader(streaming):
+        vects = {'word': Dict1DVectorizer(mxlen=-1, fields='text')}
+        return CONLLSeqReader(vects, named_fields={'0': 'text', '-1': 'y'}, trim=True,
+                              streaming=streaming, shuffle_buffer=2)
+
+    gold_reader = reader(False)
+    vocabs = {k: _vocab(v) for k, v in gold_reader.build_vocab([file_name]).items()}
+    gold, _ = gold_reader.load(file_name, vocabs, 2, shuffle=True, sort_key='word')
+
+    stream_reader = reader(True)
+    stream_reader.build_vocab([file_name])
+    feed, texts = stream_reader.load(file_name, vocabs, 2, shuffle=True, sort_key='word')
+    assert isinstance(feed, StreamingDataFeed)
+    assert texts is None
+    assert len(feed) == len(gold)
+    _assert_same_rows(list(gold), list(feed))
+
+
+def test_classify_streaming():
+    file_name = os.path.join(TEST_LOC, 'tsv_unstruct_file.tsv')
+
+    def reader(streaming):
+        vects = {'word': Token1DVectorizer(mxlen=-1), 'char': Char2DVectorizer(mxlen=-1, mxwlen=-1)}
+        return TSVSeqLabelReader(vects, streaming=streaming)
+
+    gold_reader = reader(False)
+    counts, _ = gold_reader.build_vocab(file_name)
+    vocabs = {k: _vocab(v) for k, v in counts.items()}
+    gold = gold_reader.load(file_name, vocabs, 2, shuffle=True)
+
+    stream_reader = reader(True)
+    stream_reader.build_vocab(file_name)
+    feed = stream_reader.load(file_name, vocabs, 2, shuffle=True)
+    assert isinstance(feed, StreamingDataFeed)
+    assert len(feed) == len(gold)
+    _assert_same_rows(list(gold), list(feed))
+    # Evaluation data is not streamed
+    assert not isinstance(stream_reader.load(file_name, vocabs, 2), StreamingDataFeed)
+
+
+def _seq2seq_streaming(reader_cls, file_name, **kwargs):
+
+    def reader(streaming):
+        vects = {'src': Token1DVectorizer(mxlen=-1), 'tgt': Token1DVectorizer(mxlen=-1)}
+        return reader_cls(vects, trim=True, streaming=streaming, shuffle_buffer=2, **kwargs)
+
+    gold_reader = reader(False)
+    src, tgt = gold_reader.build_vocabs([file_name])
+    src, tgt = {k: _vocab(v) for k, v in src.items()}, _vocab(tgt)
+    gold = gold_reader.load(file_name, src, tgt, 2, shuffle=True, sort_key='src_lengths')
+
+    stream_reader = reader(True)
+    stream_reader.build_vocabs([file_name])
+    feed = stream_reader.load(file_name, src, tgt, 2, shuffle=True, sort_key='src_lengths')
+    assert isinstance(feed, StreamingDataFeed)
+    assert len(feed) == len(gold)
+    batches = list(feed)
+    for b in batches:
+        assert b['tgt'].shape[1] == np.max(b['tgt_lengths'])
+    _assert_same_rows(list(gold), batches)
+
+
+def test_seq2seq_tsv_streaming():
+    _seq2seq_streaming(TSVParallelCorpusReader, os.path.join(TEST_LOC, 'tsv_parallel.tsv'))
+
+
+def test_seq2seq_multi_file_streaming():
+    _seq2seq_streaming(MultiFileParallelCorpusReader, os.path.join(TEST_LOC, 'multi_parallel'), pair_suffix=['1', '2'])
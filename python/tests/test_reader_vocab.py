@@ -0,0 +1,108 @@
+import os
+import codecs
+import random
+import pytest
+from baseline.reader import (
+    TSVSeqLabelReader,
+    CONLLSeqReader,
+    LineSeqReader,
+    TSVParallelCorpusReader,
+    _shard_file,
+    _read_range,
+)
+from baseline.vectorizers import Token1DVectorizer, Char2DVectorizer, Dict1DVectorizer, Dict2DVectorizer, Char1DVectorizer
+
+WORDS = [u'the', u'a', u'dog', u'über', u'naïve', u'x', u'longestwordhere', u'ß', u'cat', u'日本']
+
+
+def _sentence(n=None):
+    n = random.randint(1, 12) if n is None else n
+    return [random.choice(WORDS) for _ in range(n)]
+
+
+def _write(path, lines):
+    with codecs.open(path, encoding='utf-8', mode='w') as f:
+        f.write(u''.join(lines))
+    return path
+
+
+def _lengths(vectorizers):
+    return {k: {a: v for a, v in vars(vect).items() if a.startswith('max_seen')} for k, vect in vectorizers.items()}
+
+
+def _ordered(vocabs):
+    return {k: list(v.items()) for k, v in vocabs.items()}
+
+
+def test_shard_file_covers_file(tmpdir):
+    lines = [u' '.join(_sentence()) + u'\n' for _ in range(200)]
+    path = _write(str(tmpdir.join('lines.txt')), lines)
+    shards = _shard_file(path, 7)
+    assert len(shards) > 1
+    assert shards[0][0] == 0
+    assert shards[-1][1] == os.path.getsize(path)
+    assert all(a[1] == b[0] for a, b in zip(shards, shards[1:]))
+    read = [l for start, end in shards for l in _read_range(path, start, end)]
+    with codecs.open(path, encoding='utf-8', mode='r') as f:
+        assert read == list(f)
+
+
+def test_classify_parallel_vocab(tmpdir):
+    lines = [u'{}\t{}\n'.format(random.choice([u'pos', u'neg', u'neu']), u' '.join(_sentence())) for _ in range(300)]
+    lines[17] = u'neg\t\n'
+    path = _write(str(tmpdir.join('classify.tsv')), lines)
+
+    def build(workers):
+        vects = {'word': Token1DVectorizer(mxlen=-1), 'char': Char2DVectorizer(mxlen=-1, mxwlen=-1)}
+        reader = TSVSeqLabelReader(vects, vocab_workers=workers)
+        vocab, labels = reader.build_vocab([path, path])
+        return _ordered(vocab), labels, reader.label2index, _lengths(vects)
+
+    assert build(1) == build(4)
+
+
+def test_tagger_parallel_vocab(tmpdir):
+    lines = []
+    for _ in range(150):
+        for w in _sentence():
+            lines.append(u'{} {} {}\n'.format(w, random.choice([u'NN', u'VB']), random.choice([u'O', u'B-PER', u'I-PER'])))
+        lines.append(u'\n')
+    path = _write(str(tmpdir.join('tagger.conll')), lines)
+
+    def build(workers):
+        vects = {'word': Dict1DVectorizer(mxlen=-1, fields='text'), 'char': Dict2DVectorizer(mxlen=-1, mxwlen=-1, fields='text')}
+        reader = CONLLSeqReader(vects, named_fields={'0': 'text', '-1': 'y'}, vocab_workers=workers)
+        vocab = reader.build_vocab([path])
+        return _ordered(vocab), reader.label2index, _lengths(vects), reader.label_vectorizer.max_seen
+
+    assert build(1) == build(5)
+
+
+def test_lm_parallel_vocab(tmpdir):
+    first = _write(str(tmpdir.join('lm1.txt')), [u' '.join(_sentence()) + u'\n' for _ in range(300)])
+    second = _write(str(tmpdir.join('lm2.txt')), [u' '.join(_sentence()) + u'\n' for _ in range(100)])
+
+    def build(workers):
+        vects = {
+            'word': Token1DVectorizer(mxlen=-1),
+            'char': Char2DVectorizer(mxlen=-1, mxwlen=-1),
+            'char1d': Char1DVectorizer(mxlen=-1),
+        }
+        reader = LineSeqReader(vects, False, nctx=5, vocab_workers=workers)
+        vocab = reader.build_vocab([first, second, None])
+        return _ordered(vocab), _lengths(vects)
+
+    assert build(1) == build(3)
+
+
+def test_seq2seq_parallel_vocab(tmpdir):
+    lines = [u'{}\t{}\n'.format(u' '.join(_sentence()), u' '.join(_sentence())) for _ in range(200)]
+    path = _write(str(tmpdir.join('parallel.tsv')), lines)
+
+    def build(workers):
+        vects = {'src': Token1DVectorizer(mxlen=-1), 'tgt': Token1DVectorizer(mxlen=-1)}
+        reader = TSVParallelCorpusReader(vects, vocab_workers=workers)
+        src, tgt = reader.build_vocabs([path])
+        return _ordered(src), list(tgt.items()), _lengths(vects)
+
+    assert build(1) == build(4)
@@ -0,0 +1,447 @@
+import json
+import asyncio
+import threading
+import pytest
+import numpy as np
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from baseline.remote import RemoteModelREST, HTTPConnectionPool
+from baseline.services import ClassifierService, TaggerService
+from baseline.vectorizers import Dict1DVectorizer
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """A stand in for the TF serving REST API that "tags" each token with its value mod 3"""
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.paths.append(self.path)
+        if 'word' not in body['inputs']:
+            payload = {'error': 'missing input'}
+        else:
+            payload = {'outputs': {'classes': (np.array(body['inputs']['word']) % 3).tolist()}}
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Remote(RemoteModelREST):
+    def create_request(self, examples):
+        return {'signature_name': self.signature, 'inputs': {k: examples[k] for k in self.input_keys}}
+
+
+@pytest.fixture
+def server():
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.connections = 0
+    server.paths = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _remote(server, inputs=('word',), **kwargs):
+    return _Remote(
+        'http://127.0.0.1:{}'.format(server.server_address[1]), 'tagger', 'tag_text',
+        lengths_key='lengths', inputs=list(inputs), version=2, **kwargs
+    )
+
+
+def _examples():
+    return {'word': np.array([[4, 5, 6], [7, 8, 0]]), 'lengths': np.array([3, 2])}
+
+
+def test_predict(server):
+    remote = _remote(server)
+    res = remote.predict(_examples())
+    assert [r.tolist() for r in res[0]] == [1, 2, 0]
+    assert [r.tolist() for r in res[1]] == [1, 2]
+    assert server.paths == ['/v1/models/tagger/versions/2:predict']
+
+
+def test_connections_are_reused(server):
+    remote = _remote(server)
+    for _ in range(10):
+        remote.predict(_examples())
+    assert server.connections == 1
+    assert remote.pool.num_connections == 1
+    remote.close()
+
+
+def test_reconnect_after_close(server):
+    remote = _remote(server)
+    remote.predict(_examples())
+    # Simulate the server dropping an idle keep-alive connection
+    conn = remote.pool._idle.get_nowait()
+    conn.sock.shutdown(2)
+    remote.pool._idle.put(conn)
+    remote.predict(_examples())
+    assert remote.pool.num_connections == 2
+
+
+def test_error(server):
+    remote = _remote(server, inputs=('other',))
+    with pytest.raises(ValueError):
+        remote.predict({'other': np.array([[1]]), 'lengths': np.array([1])})
+    stats = remote.stats()
+    assert stats['requests'] == 1
+    assert stats['errors'] == 1
+    assert 'latency_ms' not in stats
+
+
+def test_predict_async(server):
+    remote = _remote(server, pool_size=3)
+
+    async def run():
+        return await asyncio.gather(*[remote.predict_async(_examples()) for _ in range(12)])
+
+    results = asyncio.new_event_loop().run_until_complete(run())
+    assert len(results) == 12
+    for res in results:
+        assert [r.tolist() for r in res[1]] == [1, 2]
+    assert remote.pool.num_connections <= 3
+    stats = remote.stats()
+    assert stats['requests'] == 12
+    assert stats['latency_ms']['p50'] <= stats['latency_ms']['p99'] <= stats['latency_ms']['max']
+    remote.close()
+
+
+def test_pool_limits_connections(server):
+    pool = HTTPConnectionPool('127.0.0.1', server.server_address[1], size=2)
+    body = json.dumps({'inputs': {'word': [[1]]}})
+    threads = [threading.Thread(target=pool.request, args=('POST', '/v1/models/x:predict', body)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert pool.num_connections <= 2
+    pool.close()
+
+
+def test_tagger_service_batched(server):
+    vocabs = {'word': {'<PAD>': 0, 'the': 4, 'dog': 5, 'barks': 6}}
+    remote = _Remote(
+        'http://127.0.0.1:{}'.format(server.server_address[1]), 'tagger', 'tag_text',
+        labels={'O': 0, 'B': 1, 'I': 2}, lengths_key='word_lengths', inputs=['word'], return_labels=False
+    )
+    service = TaggerService(vocabs, {'word': Dict1DVectorizer(mxlen=-1, fields='text')}, remote)
+    res = service.predict(['the', 'dog', 'barks'])
+    assert [t['label'] for t in res[0]] == ['B', 'I', 'O']
+    assert [t['text'] for t in res[0]] == ['the', 'dog', 'barks']
+    # The per-example output has the same values
+    outcomes = remote.predict({'word': np.array([[4, 5, 6], [5, 0, 0]]), 'word_lengths': np.array([3, 1])})
+    assert [o.tolist() for o in outcomes] == [[1, 2, 0], [2]]
+
+
+class _GPUTensor(object):
+    """Acts like a CUDA tensor, which numpy can't read without a copy to the CPU"""
+    def __init__(self, tensor):
+        self.tensor = tensor
+
+    def __getitem__(self, i):
+        return _GPUTensor(self.tensor[i])
+
+    def __array__(self, *args):
+        raise TypeError("can't convert cuda tensor to numpy")
+
+    def cpu(self):
+        return self.tensor
+
+
+class _TensorTaggerModel(object):
+    """Returns a tensor per example like a local PyTorch tagger"""
+    lengths_key = 'word_lengths'
+
+    def get_labels(self):
+        return {'O': 0, 'B': 1, 'I': 2}
+
+    def predict(self, examples):
+        import torch
+        return [_GPUTensor(torch.from_numpy(w % 3)) for w in examples['word']]
+
+
+def test_tagger_service_tensors():
+    pytest.importorskip('torch')
+    vocabs = {'word': {'<PAD>': 0, 'the': 4, 'dog': 5, 'barks': 6}}
+    service = TaggerService(vocabs, {'word': Dict1DVectorizer(mxlen=5, fields='text')}, _TensorTaggerModel())
+    res = service.predict(['the', 'dog', 'barks'])
+    assert [t['label'] for t in res[0]] == ['B', 'I', 'O']
+
+
+def test_deserialize_predict_text():
+    remote = _Remote('http://127.0.0.1:1', 'classify', 'predict_text', inputs=['word'], labels=['a', 'b', 'c'])
+    response = {'classes': [[0, 1, 2], [0, 1, 2]], 'scores': [[0.1, 0.7, 0.2], [0.5, 0.2, 0.3]]}
+    outputs = remote.deserialize_arrays({}, response)
+    assert outputs['classes'].dtype == np.int32
+    assert outputs['scores'].dtype == np.float32
+    res = remote.deserialize_response({}, response)
+    assert [[c for c, _ in r] for r in res] == [[0, 1, 2], [0, 1, 2]]
+    np.testing.assert_allclose([s for _, s in res[0]], [0.1, 0.7, 0.2], rtol=1e-6)
+    with pytest.raises(ValueError):
+        _Remote('http://127.0.0.1:1', 'embed', 'embed_text', inputs=['word']).deserialize_arrays({}, response)
+
+
+class _ListClassifierModel(object):
+    """Returns `(index, score)` lists, like `deserialize_response`"""
+    return_labels = False
+    scores = np.array([[0.1, 0.7, 0.2], [0.3, 0.4, 0.3]], dtype=np.float32)
+
+    def get_labels(self):
+        return ['a', 'b', 'c']
+
+    def predict(self, examples):
+        return [list(zip(np.arange(3, dtype=np.int32), s)) for s in self.scores]
+
+
+class _ClassifierModel(_ListClassifierModel):
+    def predict_arrays(self, examples):
+        return {'classes': np.tile(np.arange(3, dtype=np.int32), (2, 1)), 'scores': self.scores}
+
+
+def test_classifier_service_top_k():
+    service = ClassifierService(model=_ClassifierModel())
+    classes, scores = np.tile(np.arange(3), (2, 1)), _ClassifierModel.scores
+    res = service.top_k(classes, scores)
+    # Ties keep the order the server sent them in
+    assert [[c for c, _ in r] for r in res] == [['b', 'c', 'a'], ['b', 'a', 'c']]
+    assert all(isinstance(s, float) for _, s in res[0])
+    assert [[c for c, _ in r] for r in service.top_k(classes, scores, k=1)] == [['b'], ['b']]
+
+
+def test_classifier_service_batched_matches_lists():
+    batched = ClassifierService(vocabs={}, vectorizers={}, model=_ClassifierModel()).predict(['the', 'dog'])
+    lists = ClassifierService(vocabs={}, vectorizers={}, model=_ListClassifierModel()).predict(['the', 'dog'])
+    assert batched == lists
+
+
+@pytest.fixture
+def grpc_server():
+    grpc = pytest.importorskip('grpc')
+    pytest.importorskip('google.protobuf')
+    from concurrent import futures
+    from baseline.protos import predict_pb2, prediction_service_pb2_grpc
+    from baseline.remote import fill_tensor_proto, tensor_proto_to_ndarray
+
+    class Servicer(prediction_service_pb2_grpc.PredictionServiceServicer):
+        def Predict(self, request, context):
+            word = tensor_proto_to_ndarray(request.inputs['word'])
+            response = predict_pb2.PredictResponse()
+            fill_tensor_proto(response.outputs['classes'], word % 3)
+            return response
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    prediction_service_pb2_grpc.add_PredictionServiceServicer_to_server(Servicer(), server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    yield port
+    server.stop(0)
+
+
+def test_grpc_predict_async(grpc_server):
+    from baseline.remote import RemoteModelGRPC
+    remote = RemoteModelGRPC('127.0.0.1:{}'.format(grpc_server), 'tagger', 'tag_text', lengths_key='lengths', inputs=['word'])
+    assert [r.tolist() for r in remote.predict(_examples())[0]] == [1, 2, 0]
+
+    async def run():
+        return await asyncio.gather(*[remote.predict_async(_examples()) for _ in range(8)])
+
+    results = asyncio.new_event_loop().run_until_complete(run())
+    for res in results:
+        assert [r.tolist() for r in res[1]] == [1, 2]
+    assert remote.stats()['requests'] == 9
+    remote.close()
+
+
+class _Repeated(list):
+    def add(self):
+        self.append(_Dim())
+        return self[-1]
+
+
+class _Dim(object):
+    size = 0
+
+
+class _TensorShape(object):
+    def __init__(self):
+        self.dim = _Repeated()
+
+
+class _TensorProto(object):
+    """A stand in for `TensorProto` with the fields `fill_tensor_proto` and `tensor_proto_to_ndarray` use"""
+    def __init__(self):
+        self.dtype = 0
+        self.tensor_shape = _TensorShape()
+        self.tensor_content = b''
+        for field in ('float_val', 'double_val', 'int_val', 'int64_val', 'bool_val', 'string_val'):
+            setattr(self, field, _Repeated())
+
+
+def test_fill_tensor_proto():
+    from baseline.remote import fill_tensor_proto, DT_INT32, DT_FLOAT, DT_STRING
+    value = np.arange(6, dtype=np.int32).reshape(2, 3)
+    tensor = fill_tensor_proto(_TensorProto(), value)
+    assert tensor.dtype == DT_INT32
+    assert [d.size for d in tensor.tensor_shape.dim] == [2, 3]
+    assert tensor.tensor_content == value.astype('<i4').tobytes()
+    # The dtype and shape can be forced, the data is converted to match
+    tensor = fill_tensor_proto(_TensorProto(), [[1, 2]], shape=[2], dtype=DT_FLOAT)
+    assert [d.size for d in tensor.tensor_shape.dim] == [2]
+    assert tensor.tensor_content == np.array([1, 2], dtype='<f4').tobytes()
+    tensor = fill_tensor_proto(_TensorProto(), np.array([['a', u'\u00e9']]))
+    assert tensor.dtype == DT_STRING
+    assert [d.size for d in tensor.tensor_shape.dim] == [1, 2]
+    assert tensor.string_val == [b'a', u'\u00e9'.encode('utf-8')]
+    assert tensor.tensor_content == b''
+
+
+@pytest.mark.parametrize('value', [
+    np.arange(12, dtype=np.int32).reshape(3, 4),
+    np.random.rand(2, 5).astype(np.float32),
+    np.arange(6, dtype=np.int64),
+    np.array([True, False]),
+    np.array([[b'a', b'bb'], [b'ccc', b'dddd']], dtype=object),
+])
+def test_tensor_proto_round_trip(value):
+    from baseline.remote import fill_tensor_proto, tensor_proto_to_ndarray
+    res = tensor_proto_to_ndarray(fill_tensor_proto(_TensorProto(), value))
+    assert res.shape == value.shape
+    assert res.dtype == value.dtype
+    np.testing.assert_equal(res, value)
+
+
+def test_tensor_proto_val_fields():
+    from baseline.remote import tensor_proto_to_ndarray, DT_FLOAT, DT_INT64, DT_BOOL
+    # Small tensors from TensorFlow use the `*_val` fields instead of `tensor_content`
+    tensor = _TensorProto()
+    tensor.dtype = DT_INT64
+    for size in (2, 2):
+        tensor.tensor_shape.dim.add().size = size
+    tensor.int64_val.extend([1, 2, 3, 4])
+    res = tensor_proto_to_ndarray(tensor)
+    assert res.dtype == np.int64
+    np.testing.assert_equal(res, [[1, 2], [3, 4]])
+    # A tensor where every value is the same is sent as one value
+    tensor = _TensorProto()
+    tensor.dtype = DT_FLOAT
+    tensor.tensor_shape.dim.add().size = 3
+    tensor.float_val.append(0.5)
+    np.testing.assert_equal(tensor_proto_to_ndarray(tensor), np.full(3, 0.5, dtype=np.float32))
+    tensor = _TensorProto()
+    tensor.dtype = DT_BOOL
+    tensor.tensor_shape.dim.add().size = 2
+    np.testing.assert_equal(tensor_proto_to_ndarray(tensor), [False, False])
+
+
+def test_vendored_protos():
+    pytest.importorskip('google.protobuf')
+    import sys
+    import subprocess
+    from baseline.protos import predict_pb2
+    from baseline.remote import fill_tensor_proto, tensor_proto_to_ndarray
+    request = predict_pb2.PredictRequest()
+    request.model_spec.name = 'tagger'
+    request.model_spec.version.value = 2
+    fill_tensor_proto(request.inputs['word'], np.array([[4, 5, 6]], dtype=np.int32))
+    fill_tensor_proto(request.inputs['text'], np.array(['the dog']))
+    request = predict_pb2.PredictRequest.FromString(request.SerializeToString())
+    assert request.model_spec.version.value == 2
+    np.testing.assert_equal(tensor_proto_to_ndarray(request.inputs['word']), [[4, 5, 6]])
+    assert tensor_proto_to_ndarray(request.inputs['text']).tolist() == [b'the dog']
+    # The client does not load TensorFlow
+    import os
+    import baseline
+    code = 'import sys; import baseline.protos.predict_pb2; assert "tensorflow" not in sys.modules'
+    subprocess.check_call([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(baseline.__file__)))
+
+
+@pytest.mark.parametrize('value', [
+    np.arange(12, dtype=np.int32).reshape(3, 4),
+    np.random.rand(2, 5).astype(np.float32),
+    np.arange(6, dtype=np.int64),
+    np.array([True, False]),
+    np.array([['a', 'bb'], ['ccc', 'dddd']]),
+])
+def test_tensor_proto_matches_tf(value):
+    tf = pytest.importorskip('tensorflow')
+    from tensorflow.core.framework import tensor_pb2
+    from baseline.remote import fill_tensor_proto, tensor_proto_to_ndarray
+    tensor = fill_tensor_proto(tensor_pb2.TensorProto(), value)
+    gold = tf.make_ndarray(tensor)
+    res = tensor_proto_to_ndarray(tensor)
+    if value.dtype.kind == 'U':
+        value = value.astype(object)
+        value = np.vectorize(lambda x: x.encode('utf-8'), otypes=[object])(value)
+    np.testing.assert_equal(gold, value)
+    np.testing.assert_equal(res, value)
+    # And decode protos built by TensorFlow, which use the `*_val` fields for small tensors
+    np.testing.assert_equal(tensor_proto_to_ndarray(tf.make_tensor_proto(value)), value)
+
+
+def _pytorch_remote(signature, labels, response):
+    """A `RemoteModelRESTPytorch` whose pool answers each request with `response(inputs)`"""
+    from baseline.pytorch.remote import RemoteModelRESTPytorch
+    remote = RemoteModelRESTPytorch(
+        'http://127.0.0.1:1', 'model', signature,
+        labels=labels, lengths_key='word_lengths', inputs=['word'], return_labels=False
+    )
+    remote.requests = []
+
+    def request(method, path, body=None, headers=None):
+        body = json.loads(body.decode('utf-8'))
+        remote.requests.append(body)
+        return 200, json.dumps({'outputs': response(body['inputs'])})
+    remote.pool.request = request
+    return remote
+
+
+def test_pytorch_tagger_service():
+    pytest.importorskip('torch')
+    vocabs = {'word': {'<PAD>': 0, 'the': 4, 'dog': 5, 'barks': 6}}
+    # Tag each token with its value mod 3, like the TorchScript server the shape is [1, T]
+    remote = _pytorch_remote(
+        'tag_text', {'O': 0, 'B': 1, 'I': 2},
+        lambda inputs: {'classes': (np.array(inputs['data'][0]) % 3)[None].tolist()}
+    )
+    service = TaggerService(vocabs, {'word': Dict1DVectorizer(mxlen=-1, fields='text')}, remote)
+    res = service.predict(['the', 'dog', 'barks'])
+    assert [t['label'] for t in res[0]] == ['B', 'I', 'O']
+    # Examples of different lengths are padded together, still with a request per example
+    arrays = remote.predict_arrays({'word': np.array([[4, 5, 6], [5, 0, 0]]), 'word_lengths': np.array([3, 1])})
+    assert arrays['classes'].tolist() == [[1, 2, 0], [2, 0, 0]]
+    assert len(remote.requests) == 3
+
+
+def test_pytorch_classifier_service():
+    pytest.importorskip('torch')
+    scores = {4: [0.1, 0.7, 0.2], 5: [0.6, 0.1, 0.3]}
+    remote = _pytorch_remote(
+        'predict_text', ['O', 'B', 'I'], lambda inputs: {'classes': [[0, 1, 2]], 'scores': [scores[inputs['data'][0][0]]]}
+    )
+    service = ClassifierService(
+        vocabs={'word': {'<PAD>': 0, 'the': 4, 'dog': 5}},
+        vectorizers={'word': Dict1DVectorizer(mxlen=-1, fields='text')},
+        model=remote
+    )
+    res = service.predict([['the'], ['dog']])
+    assert [[c for c, _ in r] for r in res] == [['B', 'I', 'O'], ['O', 'I', 'B']]
+    np.testing.assert_allclose([s for _, s in res[1]], [0.6, 0.3, 0.1], rtol=1e-6)
@@ -0,0 +1,174 @@
+import os
+import threading
+import pytest
+import numpy as np
+torch = pytest.importorskip('torch')
+from baseline.pytorch.crf import CRF
+from baseline.pytorch.torchy import LSTMEncoder
+from baseline.pytorch.remote import RemoteModelRESTPytorch
+from mead.pytorch.exporters import ExportingTagger, ExportingClassifier
+from mead.pytorch.serve import TorchScriptServer, TorchScriptModel, find_torchscript_model, load_models
+
+
+H = 7
+
+
+class _Tagger(torch.nn.Module):
+    """Embeds the words as unaries"""
+    def __init__(self):
+        super(_Tagger, self).__init__()
+        self.embed = torch.nn.Embedding(20, H)
+        self.crf = CRF(H)
+        self.crf.transitions_p.data = torch.rand(1, H, H)
+
+    def compute_unaries(self, x, l):
+        return self.embed(x[0])
+
+
+class _RNNTagger(_Tagger):
+    """Runs the embeddings through an `LSTMEncoder`, which packs the batch so it has to be sorted by length"""
+    def __init__(self):
+        super(_RNNTagger, self).__init__()
+        self.encoder = LSTMEncoder(H, H, 'lstm', 1, 0.0)
+
+    def compute_unaries(self, x, l):
+        return self.encoder(self.embed(x[0]), l)
+
+
+class _Classifier(torch.nn.Module):
+    def __init__(self):
+        super(_Classifier, self).__init__()
+        self.emb = torch.nn.Embedding(20, 4)
+        self.output = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.LogSoftmax(dim=1))
+
+    def embed(self, x):
+        return self.emb(x[0])
+
+    def pool(self, x, l):
+        return x.sum(1)
+
+    def stacked(self, x):
+        return x
+
+
+def _export(model, wrapper, path):
+    exportable = wrapper(model)
+    exportable.eval()
+    traced = torch.jit.trace(exportable, ((torch.randint(0, 20, (1, 10)),), torch.LongTensor([10])))
+    os.makedirs(path)
+    traced.save(os.path.join(path, 'model.pt'))
+
+
+@pytest.fixture
+def served(tmpdir):
+    torch.manual_seed(0)
+    tagger, classifier = _Tagger(), _Classifier()
+    _export(tagger, ExportingTagger, os.path.join(str(tmpdir), 'tagger', '1'))
+    _export(classifier, ExportingClassifier, os.path.join(str(tmpdir), 'classifier', '2'))
+    models = load_models({
+        'tagger': os.path.join(str(tmpdir), 'tagger'),
+        'classifier': os.path.join(str(tmpdir), 'classifier'),
+    }, max_batch_size=16, max_latency_ms=20)
+    server = TorchScriptServer(('127.0.0.1', 0), models)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    yield server, tagger, classifier
+    server.shutdown()
+    server.server_close()
+    for m in models.values():
+        m.close()
+
+
+def _remote(server, name, signature):
+    return RemoteModelRESTPytorch(
+        'http://127.0.0.1:{}'.format(server.server_address[1]), name, signature,
+        lengths_key='word_lengths', inputs=['word'], return_labels=False
+    )
+
+
+def test_find_torchscript_model(tmpdir):
+    for v in ('1', '2', '10'):
+        os.makedirs(os.path.join(str(tmpdir), v))
+        open(os.path.join(str(tmpdir), v, 'model.pt'), 'w').close()
+    assert find_torchscript_model(str(tmpdir)) == os.path.join(str(tmpdir), '10', 'model.pt')
+    assert find_torchscript_model(os.path.join(str(tmpdir), '2')) == os.path.join(str(tmpdir), '2', 'model.pt')
+    os.makedirs(os.path.join(str(tmpdir), 'empty'))
+    with pytest.raises(ValueError):
+        find_torchscript_model(os.path.join(str(tmpdir), 'empty'))
+
+
+def test_pad():
+    batch = TorchScriptModel.pad([np.ones((2, 3)), np.ones((4, 1))])
+    assert batch.shape == (2, 4, 3)
+    assert batch[0].sum() == 6
+    assert batch[1].sum() == 4
+
+
+def test_rnn_tagger_batches_are_sorted(tmpdir):
+    torch.manual_seed(0)
+    path = os.path.join(str(tmpdir), 'rnn', '1')
+    _export(_RNNTagger(), ExportingTagger, path)
+    model = TorchScriptModel.load(path)
+    words = np.array([[4, 5, 0, 0, 0], [6, 7, 8, 9, 10], [11, 12, 13, 0, 0]])
+    lengths = [2, 5, 3]
+    results = model.predict([((w,), l) for w, l in zip(words, lengths)])
+    for w, l, res in zip(words, lengths, results):
+        # The same as running the example on its own
+        gold = model.predict([((w[:l],), l)])[0]['classes']
+        assert res['classes'][:l].tolist() == gold.tolist()
+
+
+def test_serve_tagger(served):
+    server, tagger, _ = served
+    remote = _remote(server, 'tagger', 'tag_text')
+    words = np.array([[4, 5, 6, 7], [8, 9, 0, 0], [10, 11, 12, 0]])
+    lengths = np.array([4, 2, 3])
+    outcomes = remote.predict({'word': words, 'word_lengths': lengths})
+    gold, _ = tagger.crf.decode(tagger.embed(torch.from_numpy(words)).transpose(0, 1), torch.from_numpy(lengths))
+    gold = gold.transpose(0, 1).numpy()
+    for outcome, g, l in zip(outcomes, gold, lengths):
+        assert [o.item() for o in outcome] == g[:l].tolist()
+    remote.close()
+
+
+def test_serve_classifier(served):
+    server, _, classifier = served
+    remote = _remote(server, 'classifier', 'predict_text')
+    words = np.array([[4, 5, 6], [8, 9, 0]])
+    outcomes = remote.predict({'word': words, 'word_lengths': np.array([3, 2])})
+    gold = classifier.output(classifier.emb(torch.from_numpy(words)).sum(1)).exp().detach().numpy()
+    for outcome, g in zip(outcomes, gold):
+        assert [c.item() for c, _ in outcome] == [0, 1, 2]
+        np.testing.assert_allclose([s for _, s in outcome], g, rtol=1e-5)
+    remote.close()
+
+
+def test_requests_are_batched(served):
+    server, _, _ = served
+    remote = _remote(server, 'tagger', 'tag_text')
+    example = {'word': np.array([[4, 5, 6]]), 'word_lengths': np.array([3])}
+    gold = remote.predict(example)
+    results = [None] * 8
+
+    def run(i):
+        # Different lengths from different connections are padded together
+        ex = {'word': example['word'][:, :i % 3 + 1], 'word_lengths': np.array([i % 3 + 1])}
+        results[i] = remote.predict(ex)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [o.item() for o in results[2][0]] == [o.item() for o in gold[0]]
+    assert all(len(r[0]) == i % 3 + 1 for i, r in enumerate(results))
+    assert server.models['tagger'].stats()['batches'] < 9
+    remote.close()
+
+
+def test_unknown_model(served):
+    server, _, _ = served
+    remote = _remote(server, 'other', 'tag_text')
+    with pytest.raises(ValueError):
+        remote.predict({'word': np.array([[4, 5, 6]]), 'word_lengths': np.array([3])})
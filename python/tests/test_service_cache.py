@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+import pytest
+from mock import patch
+from baseline.services import Service, ServiceCache
+
+
+class _Tensor(object):
+    def __init__(self, size):
+        self.size = size
+
+    def numel(self):
+        return self.size
+
+    def element_size(self):
+        return 4
+
+
+class _Model(object):
+    """Looks like a PyTorch model that takes `size` floats"""
+    def __init__(self, size):
+        self.size = size
+
+    def parameters(self):
+        return [_Tensor(self.size)]
+
+    def buffers(self):
+        return []
+
+
+class _FakeService(Service):
+    loads = []
+
+    @classmethod
+    def task_name(cls):
+        return 'fake'
+
+    @classmethod
+    def load(cls, bundle, **kwargs):
+        # Like the real services, defer to `Service.load` which handles the cache
+        if kwargs.get('cache'):
+            return super(_FakeService, cls).load(bundle, **kwargs)
+        cls.loads.append((bundle, kwargs))
+        time.sleep(kwargs.get('sleep', 0))
+        return cls(model=_Model(kwargs.get('size', 100)))
+
+
+@pytest.fixture
+def bundles(tmpdir):
+    _FakeService.loads = []
+    paths = []
+    for i in range(4):
+        path = str(tmpdir.join('bundle-{}'.format(i)))
+        os.makedirs(path)
+        with open(os.path.join(path, 'model.pyt'), 'w') as f:
+            f.write(str(i))
+        paths.append(path)
+    with patch('baseline.services._rss', return_value=0):
+        yield paths
+
+
+def test_cache_hit(bundles):
+    cache = ServiceCache()
+    s1 = cache.load(_FakeService, bundles[0], backend='pytorch')
+    s2 = cache.load(_FakeService, bundles[0], backend='pytorch')
+    assert s1 is s2
+    assert len(_FakeService.loads) == 1
+    # Different arguments are a different service
+    s3 = cache.load(_FakeService, bundles[0], backend='pytorch', size=10)
+    assert s3 is not s1
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert [s['memory'] for s in stats['services']] == [400, 40]
+    assert stats['memory'] == 440
+
+
+def test_key_changes_with_bundle_contents(bundles):
+    cache = ServiceCache()
+    k1 = cache.key(_FakeService, bundles[0], {'backend': 'pytorch'})
+    with open(os.path.join(bundles[0], 'model.pyt'), 'w') as f:
+        f.write('a new model')
+    assert cache.key(_FakeService, bundles[0], {'backend': 'pytorch'}) != k1
+    assert cache.key(_FakeService, bundles[0], {'backend': 'pyt'}) == cache.key(_FakeService, bundles[0], {'backend': 'pytorch'})
+
+
+def test_memory_eviction(bundles):
+    cache = ServiceCache(max_memory=1000)
+    for bundle in bundles[:3]:
+        cache.load(_FakeService, bundle)
+    # 3 * 400 is over budget so the first one went
+    assert [s['bundle'] for s in cache.stats()['services']] == bundles[1:3]
+    cache.load(_FakeService, bundles[1])
+    cache.load(_FakeService, bundles[3])
+    assert [s['bundle'] for s in cache.stats()['services']] == [bundles[1], bundles[3]]
+    assert cache.stats()['evictions'] == 2
+
+
+def test_max_services(bundles):
+    cache = ServiceCache(max_services=2)
+    for bundle in bundles:
+        cache.load(_FakeService, bundle)
+    assert [s['bundle'] for s in cache.stats()['services']] == bundles[2:]
+
+
+def test_preload_pins(bundles):
+    cache = ServiceCache(max_memory=500)
+    warm = cache.preload([{'task': 'fake', 'bundle': bundles[0]}, {'task': _FakeService, 'bundle': bundles[1]}])
+    assert len(warm) == 2
+    cache.load(_FakeService, bundles[2])
+    cache.load(_FakeService, bundles[3])
+    # Pinned services stay even over budget, the most recent load stays too
+    assert [s['bundle'] for s in cache.stats()['services']] == [bundles[0], bundles[1], bundles[3]]
+    assert cache.load(_FakeService, bundles[0]) is warm[0]
+
+
+def test_concurrent_loads_share(bundles):
+    cache = ServiceCache()
+    results = [None] * 4
+
+    def run(i):
+        results[i] = cache.load(_FakeService, bundles[0], sleep=0.1)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(_FakeService.loads) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_service_load_cache_kwarg(bundles):
+    with patch('baseline.services.SERVICE_CACHE', ServiceCache()) as cache:
+        s1 = _FakeService.load(bundles[0], cache=True)
+        s2 = _FakeService.load(bundles[0], cache=True)
+    assert s1 is s2
+    assert len(_FakeService.loads) == 1
+    assert cache.stats()['hits'] == 1
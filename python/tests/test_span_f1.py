@@ -0,0 +1,86 @@
+import random
+import pytest
+import numpy as np
+from baseline.utils import SpanF1, to_spans, span_f1, per_entity_f1
+
+
+def make_lut(span_type, ents=('PER', 'LOC', 'MISC')):
+    prefixes = ['B-', 'I-', 'E-', 'S-'] if span_type == 'iobes' else ['B-', 'I-']
+    labels = ['<PAD>', 'O'] + [p + e for e in ents for p in prefixes]
+    return dict(enumerate(labels))
+
+
+def random_batch(lut, min_len=0, max_len=12):
+    golds, preds = [], []
+    for _ in range(random.randint(1, 8)):
+        length = random.randint(min_len, max_len)
+        golds.append(np.random.randint(0, len(lut), size=length))
+        preds.append(np.random.randint(1, len(lut), size=length))
+    return golds, preds
+
+
+@pytest.mark.parametrize('span_type', ['iob', 'iob2', 'bio', 'iobes'])
+def test_matches_string_spans(span_type):
+    lut = make_lut(span_type)
+    for _ in range(100):
+        golds, preds = random_batch(lut)
+        spans = SpanF1(lut, span_type)
+        spans.add_batch(golds, preds)
+        gold_chunks = [set(to_spans(g, lut, span_type)) for g in golds]
+        pred_chunks = [set(to_spans(p, lut, span_type)) for p in preds]
+        assert spans.get_f1() == span_f1(gold_chunks, pred_chunks)
+        assert spans.get_all_metrics() == per_entity_f1(gold_chunks, pred_chunks)
+
+
+@pytest.mark.parametrize('span_type', ['iob', 'iobes'])
+def test_spans_match_to_spans(span_type):
+    lut = make_lut(span_type)
+    spans = SpanF1(lut, span_type)
+    seq = np.random.randint(0, len(lut), size=50)
+    res = spans.spans(seq, np.arange(50) == 0)
+    gold = to_spans(seq, lut, span_type)
+    res = ['@'.join([spans.types[t]] + [str(i) for i in range(s, e + 1)]) for t, s, e in res]
+    assert res == gold
+
+
+def test_add_batch_lengths():
+    lut = make_lut('iob')
+    golds = np.random.randint(0, len(lut), size=(6, 10))
+    preds = np.random.randint(0, len(lut), size=(6, 10))
+    lengths = np.random.randint(1, 11, size=6)
+    padded = SpanF1(lut)
+    padded.add_batch(golds, preds, lengths)
+    listed = SpanF1(lut)
+    for g, p, l in zip(golds, preds, lengths):
+        listed.add(g[:l], p[:l])
+    assert padded.get_all_metrics() == listed.get_all_metrics()
+
+
+def test_spans_dont_cross_sentences():
+    lut = {0: 'O', 1: 'B-X', 2: 'I-X'}
+    spans = SpanF1(lut, 'iob')
+    spans.add_batch([[1, 2], [2, 2]], [[1, 2], [2, 2]])
+    assert spans.get_all_metrics()['gold_total'] == 2
+    assert spans.get_f1() == 1.0
+
+
+def test_merge():
+    lut = make_lut('bio')
+    golds, preds = random_batch(lut)
+    full = SpanF1(lut, 'bio')
+    full.add_batch(golds, preds)
+    shards = [SpanF1(lut, 'bio') for _ in golds]
+    for shard, g, p in zip(shards, golds, preds):
+        shard.add(g, p)
+    merged = SpanF1(lut, 'bio')
+    for shard in shards:
+        merged.merge(shard)
+    assert merged.get_all_metrics() == full.get_all_metrics()
+
+
+def test_reset():
+    lut = make_lut('iob')
+    spans = SpanF1(lut)
+    spans.add_batch(*random_batch(lut, min_len=5))
+    spans.reset()
+    assert spans.get_all_metrics()['gold_total'] == 0
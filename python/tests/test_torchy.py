@@ -55,3 +55,40 @@ def test_token_sequence_loss(logits, labels, lengths):
     crit = SequenceCriterion(LossFn=loss, avg='token')
     res = crit(logits, labels)
     np.testing.assert_allclose(res.numpy(), gold.numpy(), rtol=1e-6)
+
+
+def test_metrics_accumulator_loss():
+    from baseline.pytorch.torchy import MetricsAccumulator
+    acc = MetricsAccumulator()
+    losses = np.random.rand(10)
+    norms = np.random.randint(1, 20, size=10)
+    for l, n in zip(losses, norms):
+        acc.add_loss(torch.tensor(l, dtype=torch.float32, requires_grad=True), n)
+    agg, norm = acc.loss()
+    np.testing.assert_allclose(agg, np.sum(losses.astype(np.float32) * norms), rtol=1e-6)
+    assert norm == np.sum(norms)
+    acc.reset()
+    assert acc.loss() == (0.0, 0)
+
+
+def test_metrics_accumulator_confusion():
+    from baseline.confusion import ConfusionMatrix
+    from baseline.pytorch.torchy import MetricsAccumulator
+    labels = [str(i) for i in range(C)]
+    gold = ConfusionMatrix(labels)
+    acc = MetricsAccumulator(C)
+    for _ in range(5):
+        y = torch.randint(0, C, size=(B,)).long()
+        pred = torch.rand(B, C)
+        acc.add_batch(y, pred)
+        gold.add_batch(y.numpy(), pred.argmax(1).numpy())
+    cm = ConfusionMatrix(labels)
+    cm.add_counts(acc.confusion())
+    np.testing.assert_equal(cm.get_all_metrics(), gold.get_all_metrics())
+    assert cm.get_total() == 5 * B
+
+
+def test_metrics_accumulator_empty_confusion():
+    from baseline.pytorch.torchy import MetricsAccumulator
+    acc = MetricsAccumulator(3)
+    np.testing.assert_equal(acc.confusion(), np.zeros((3, 3)))
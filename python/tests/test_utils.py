@@ -1,10 +1,13 @@
 import os
 import string
 import random
+import hashlib
+import zipfile
+import threading
 from itertools import chain
 import pytest
 from mock import patch
-from baseline.utils import get_env_gpus, _idempotent_append, _parse_module_as_path
+from baseline.utils import get_env_gpus, _idempotent_append, _parse_module_as_path, file_sha1, atomic_unzip
 
 
 @pytest.fixture
@@ -149,3 +152,54 @@ def test_parse_module_as_path_absolute():
             real_patch.assert_called_once_with(path)
     assert n == file_base
     assert d == path
+
+
+def test_file_sha1_streams(tmpdir):
+    path = str(tmpdir.join('data'))
+    data = os.urandom(10000)
+    with open(path, 'wb') as f:
+        f.write(data)
+    assert file_sha1(path, chunk_size=333, cache=False) == hashlib.sha1(data).hexdigest()
+    assert not os.path.exists(path + '.sha1')
+
+
+def test_file_sha1_cache(tmpdir):
+    path = str(tmpdir.join('data'))
+    with open(path, 'wb') as f:
+        f.write(b'aaaa')
+    gold = hashlib.sha1(b'aaaa').hexdigest()
+    assert file_sha1(path) == gold
+    assert os.path.exists(path + '.sha1')
+    with patch('baseline.utils.hashlib.sha1') as sha1_patch:
+        assert file_sha1(path) == gold
+        sha1_patch.assert_not_called()
+    # Same size but a new mtime means we hash again
+    with open(path, 'wb') as f:
+        f.write(b'bbbb')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert file_sha1(path) == hashlib.sha1(b'bbbb').hexdigest()
+
+
+def test_atomic_unzip(tmpdir):
+    zip_path = str(tmpdir.join('bundle.zip'))
+    with zipfile.ZipFile(zip_path, 'w') as z:
+        for i in range(20):
+            z.writestr('model/file-{}'.format(i), os.urandom(1000))
+    output_dir = str(tmpdir.join('out'))
+    errors = []
+
+    def run():
+        try:
+            atomic_unzip(zip_path, output_dir)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(os.listdir(os.path.join(output_dir, 'model'))) == 20
+    # No temp dirs are left behind
+    assert sorted(os.listdir(str(tmpdir))) == ['bundle.zip', 'out']
@@ -2,7 +2,15 @@ import string
 import pytest
 import numpy as np
 from baseline.utils import Offsets
-from baseline.vectorizers import Char1DVectorizer, Char2DVectorizer, TextNGramVectorizer, DictTextNGramVectorizer
+from baseline.vectorizers import (
+    Char1DVectorizer,
+    Char2DVectorizer,
+    TextNGramVectorizer,
+    DictTextNGramVectorizer,
+    Token1DVectorizer,
+    Dict1DVectorizer,
+    GOVectorizer,
+)
 
 
 @pytest.fixture
@@ -125,3 +133,83 @@ def test_text_ngrams():
 
     a, length = v.run(tokens, vocab)
     assert np.allclose(a[:length], np.arange(0, len(tokens)))
+
+
+def _random_batch(B=20, mxlen=8, mxwlen=6, alphabet=string.ascii_lowercase + 'XYZ'):
+    batch = []
+    for _ in range(B):
+        tokens = []
+        for _ in range(np.random.randint(0, mxlen)):
+            length = np.random.randint(0, mxwlen)
+            tokens.append(''.join(np.random.choice(list(alphabet), size=length)))
+        batch.append(tokens)
+    return batch
+
+
+def _assert_run_batch(vect, batch, vocab):
+    vecs, lengths = vect.run_batch(batch, vocab)
+    assert len(vecs) == len(batch)
+    for i, tokens in enumerate(batch):
+        vec, length = vect.run(tokens, vocab)
+        np.testing.assert_equal(vecs[i], vec)
+        if length is None:
+            assert lengths is None
+        else:
+            assert lengths[i] == length
+
+
+@pytest.mark.parametrize('mxlen', [-1, 0, 1, 3, 10])
+def test_token_1d_run_batch(vocab, mxlen):
+    batch = _random_batch()
+    word_vocab = {k: i for i, k in enumerate(Offsets.VALUES)}
+    for tokens in batch:
+        for t in tokens:
+            if np.random.rand() < 0.7:
+                word_vocab.setdefault(t, len(word_vocab))
+    vect = Token1DVectorizer(mxlen=mxlen)
+    for tokens in batch:
+        vect.count(tokens)
+    _assert_run_batch(vect, batch, word_vocab)
+
+
+def test_token_1d_run_batch_no_unk():
+    batch = [['a', 'b', 'c'], ['a', 'z', 'b'], ['z'], [], ['c', 'b', 'a', 'b', 'c']]
+    vocab = {'<PAD>': 0, 'a': 1, 'b': 2, 'c': 3}
+    _assert_run_batch(Token1DVectorizer(mxlen=4), batch, vocab)
+
+
+def test_token_1d_run_batch_rev_and_transform(vocab):
+    batch = [['A', 'b'], ['C', 'D', 'e']]
+    _assert_run_batch(Token1DVectorizer(mxlen=4, rev=True), batch, vocab)
+    _assert_run_batch(Token1DVectorizer(mxlen=4, transform_fn=lambda x: x.lower()), batch, vocab)
+
+
+def test_dict_1d_run_batch(vocab):
+    batch = [[{'text': 'a', 'pos': 'b'}, {'text': 'c', 'pos': 'd'}], [{'text': 'q', 'pos': 'x'}]]
+    _assert_run_batch(Dict1DVectorizer(mxlen=3, fields='text'), batch, vocab)
+
+
+def test_go_run_batch(vocab):
+    batch = [['a', 'b'], ['c'], ['d', 'e', 'f', 'g', 'h']]
+    _assert_run_batch(GOVectorizer(Token1DVectorizer(mxlen=4)), batch, vocab)
+
+
+def test_run_batch_fallback(vocab):
+    batch = [['a', 'b', 'c', 'd'], ['e', 'f', 'g']]
+    _assert_run_batch(TextNGramVectorizer(mxlen=4, filtsz=3), batch, vocab)
+
+
+@pytest.mark.parametrize('mxlen,mxwlen', [(-1, -1), (0, 3), (2, 0), (3, 2), (10, 10)])
+def test_char_2d_run_batch(vocab, mxlen, mxwlen):
+    batch = _random_batch()
+    vect = Char2DVectorizer(mxlen=mxlen, mxwlen=mxwlen)
+    for tokens in batch:
+        vect.count(tokens)
+    _assert_run_batch(vect, batch, vocab)
+
+
+def test_char_2d_run_batch_no_eow():
+    # Without an <EOW> the end of word is the PAD id, and characters that map to it also end the word
+    vocab = {'<PAD>': 0, '<UNK>': 1, 'a': 2, 'b': 3, 'p': 0}
+    batch = [['ab', 'apb', ''], ['ppp', 'b'], []]
+    _assert_run_batch(Char2DVectorizer(mxlen=5, mxwlen=2), batch, vocab)
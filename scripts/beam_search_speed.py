@@ -0,0 +1,111 @@
+import time
+import argparse
+import numpy as np
+import torch
+from baseline.utils import Offsets
+from baseline.pytorch.embeddings import LookupTableEmbeddings
+from baseline.pytorch.seq2seq.encoders import RNNEncoderOutput, TransformerEncoderOutput
+from baseline.pytorch.seq2seq.decoders import RNNDecoderWithAttn, TransformerDecoderWrapper, beam_search, repeat_batch
+
+
+def create_decoder(args):
+    embeddings = LookupTableEmbeddings('tgt', vsz=args.vsz, dsz=args.hsz)
+    if args.decoder == 'transformer':
+        decoder = TransformerDecoderWrapper(embeddings, layers=args.layers, num_heads=4)
+    else:
+        decoder = RNNDecoderWithAttn(embeddings, hsz=args.hsz, rnntype='lstm', layers=args.layers)
+    return decoder.to(args.device).eval()
+
+
+def create_encoder_outputs(args):
+    B, T, H = args.batchsz, args.src_len, args.hsz
+    output = torch.randn(B, T, H, device=args.device)
+    src_mask = torch.ones(B, T, dtype=torch.uint8, device=args.device)
+    if args.decoder == 'transformer':
+        return TransformerEncoderOutput(output, src_mask)
+    hidden = tuple(torch.randn(args.layers, B, H, device=args.device) for _ in range(2))
+    return RNNEncoderOutput(output, hidden, src_mask)
+
+
+def sample_lengths(args):
+    """Output lengths with a long tail, like real translations."""
+    lengths = np.random.lognormal(np.log(args.mean_len), 0.5, size=args.batchsz)
+    return torch.from_numpy(np.clip(lengths, 1, args.mxlen - 1).astype(np.int64)).to(args.device)
+
+
+def forced_length_fns(decoder, targets):
+    """Wrap the decoder so each example only (and always) emits EOS at its target length.
+
+    A random model doesn't stop in any sensible way, this gives the search realistic lengths while
+    still doing all of the work of the real decoder.
+    """
+    def init(encoder_outputs, K):
+        return decoder.beam_init(encoder_outputs, K), repeat_batch(targets, K)
+
+    def step(paths, extra):
+        state, tgt = extra
+        probs, state = decoder.beam_step(paths, state)
+        probs = probs.view(-1, probs.size(-1))
+        eos = torch.full_like(probs[:, Offsets.EOS], -np.inf).masked_fill(tgt < paths.size(2), 0)
+        probs[:, Offsets.EOS] = eos
+        return probs, (state, tgt)
+
+    def update(beams, extra):
+        state, tgt = extra
+        return decoder.beam_update(beams, state), tgt[beams]
+
+    def compact(rows, extra):
+        state, tgt = extra
+        return decoder.beam_compact(rows, state), tgt[rows]
+
+    return init, step, update, compact
+
+
+def time_search(decoder, encoder_outputs, targets, args, compact):
+    init, step, update, compact_fn = forced_length_fns(decoder, targets)
+    compact_fn = compact_fn if compact else None
+    times = []
+    for _ in range(args.trials):
+        start = time.time()
+        _, lengths, _ = beam_search(encoder_outputs, init, step, update, compact=compact_fn, beam=args.beam, mxlen=args.mxlen)
+        if args.device != 'cpu':
+            torch.cuda.synchronize()
+        times.append(time.time() - start)
+    return lengths[:, 0].cpu().numpy(), np.array(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the speed of beam search with and without compaction")
+    parser.add_argument('--decoder', default='transformer', choices=['transformer', 'rnn'])
+    parser.add_argument('--batchsz', default=64, type=int)
+    parser.add_argument('--beam', default=5, type=int)
+    parser.add_argument('--mxlen', default=100, type=int)
+    parser.add_argument('--mean_len', default=20, type=float, help="The typical output length")
+    parser.add_argument('--src_len', default=30, type=int)
+    parser.add_argument('--hsz', default=256, type=int)
+    parser.add_argument('--layers', default=2, type=int)
+    parser.add_argument('--vsz', default=8000, type=int)
+    parser.add_argument('--trials', default=5, type=int)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--seed', default=1337, type=int)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    np.random.seed(args.seed)
+    decoder = create_decoder(args)
+    encoder_outputs = create_encoder_outputs(args)
+    targets = sample_lengths(args)
+
+    results = {}
+    for name, compact in (('full', False), ('compact', True)):
+        lengths, times = time_search(decoder, encoder_outputs, targets, args, compact)
+        results[name] = np.sum(lengths) / np.mean(times)
+        print('{:>8}: {:.4f}s +/- {:.4f}s per batch, {:.1f} tokens/sec'.format(
+            name, np.mean(times), np.std(times), results[name]
+        ))
+    print('Output lengths: mean {:.1f}, max {}'.format(np.mean(lengths), np.max(lengths)))
+    print('Speed up: {:.2f}x'.format(results['compact'] / results['full']))
+
+
+if __name__ == "__main__":
+    main()
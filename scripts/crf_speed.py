@@ -0,0 +1,57 @@
+import time
+import argparse
+import numpy as np
+import torch
+from baseline.pytorch.crf import CRF
+
+
+def time_fn(fn, trials, device):
+    times = []
+    for _ in range(trials):
+        start = time.time()
+        fn()
+        if device != 'cpu':
+            torch.cuda.synchronize()
+        times.append(time.time() - start)
+    # Drop the first run, it includes things like the TorchScript compile
+    return np.mean(times[1:]) if trials > 1 else times[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the CRF forward algorithm and viterbi over sequence lengths")
+    parser.add_argument('--lengths', nargs='+', default=[50, 100, 250, 500, 1000], type=int)
+    parser.add_argument('--batchsz', default=32, type=int)
+    parser.add_argument('--n_tags', default=20, type=int)
+    parser.add_argument('--trials', default=5, type=int)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    crfs = {
+        'eager': CRF(args.n_tags).to(args.device),
+        'script': CRF(args.n_tags, script=True).to(args.device),
+    }
+    trans = torch.randn(1, args.n_tags, args.n_tags, device=args.device)
+    for crf in crfs.values():
+        crf.transitions_p.data.copy_(trans)
+
+    print('{:>6} {:>8} {:>14} {:>14} {:>14} {:>14}'.format(
+        'T', 'B', 'forward eager', 'forward script', 'viterbi eager', 'viterbi script'
+    ))
+    for T in args.lengths:
+        unary = torch.randn(T, args.batchsz, args.n_tags, device=args.device)
+        # Ragged lengths so the masking is exercised
+        lengths = torch.randint(T // 2, T + 1, (args.batchsz,), device=args.device)
+        lengths[0] = T
+        row = []
+        for name in ('eager', 'script'):
+            crf = crfs[name]
+            row.append(time_fn(lambda: crf.forward(unary, lengths, args.batchsz), args.trials, args.device))
+        with torch.no_grad():
+            for name in ('eager', 'script'):
+                crf = crfs[name]
+                row.append(time_fn(lambda: crf.decode(unary, lengths), args.trials, args.device))
+        print('{:>6} {:>8} '.format(T, args.batchsz) + ' '.join('{:>13.2f}ms'.format(t * 1000) for t in row))
+
+
+if __name__ == "__main__":
+    main()